@@ -1,13 +1,33 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from .models import Chats, MessageReaction
-from backend.discussions.models import Society, SocietyMember, SocietyMessage
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from .models import Chats
+from backend.discussions.models import SocietyMember, SocietyMessage
+from .receipts import acknowledge_messages, parse_receipt
+from .society_fanout import mark_society_read
+from .messages import clean_content, create_chat_message, create_society_message
 from .serializers import ChatSerializer, SocietyMessageSerializer, MessageReactionSerializer
 import json
+import time
+import uuid
 
 CustomUser = get_user_model()
 
+# How long a society membership verified on the socket is trusted before it is checked again
+MEMBERSHIP_RECHECK_SECONDS = 60
+
+
+def parse_book_id(book_id):
+    """The book UUID of a websocket payload, None when absent, or raise ValueError"""
+    return uuid.UUID(str(book_id)) if book_id else None
+
+
+def valid_content(content):
+    return isinstance(content, str) and bool(content.strip())
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.chat_id = self.scope['url_route']['kwargs']['chat_id']
@@ -18,8 +38,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close(code=4001)  # Unauthorized
             return
 
-        # Verify user is part of the chat
-        if await self.is_valid_chat_member(user, self.chat_id):
+        # Verify user is part of the chat, and keep the chat and partner for the whole connection
+        self.user = user
+        self.chat = await self.load_chat(user, self.chat_id)
+        if self.chat:
+            self.partner = self.chat.receiver if self.chat.sender_id == user.user_id else self.chat.sender
             await self.channel_layer.group_add(self.group_name, self.channel_name)
             await self.accept()
         else:
@@ -41,21 +64,37 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.handle_send_message(data)
         elif action == 'add_reaction':
             await self.handle_add_reaction(data)
+        elif action == 'receipt':
+            await self.handle_receipt(data)
         else:
             await self.send(text_data=json.dumps({'error': 'Invalid action.'}))
 
+    async def handle_receipt(self, data):
+        # Everything the partner sent up to ``up_to``; the partner gets one receipt event
+        try:
+            receipt_status, up_to = parse_receipt(data)
+            await database_sync_to_async(acknowledge_messages)(
+                self.user.user_id, self.partner.user_id, receipt_status, up_to
+            )
+        except ValueError as e:
+            await self.send(text_data=json.dumps({'error': str(e)}))
+        except Chats.DoesNotExist:
+            await self.send(text_data=json.dumps({'error': 'Message not found.'}))
+
     async def handle_send_message(self, data):
         content = data.get('content')
-        book_id = data.get('book_id')
-        user = self.scope['user']
 
-        if not content:
+        if not valid_content(content):
             await self.send(text_data=json.dumps({'error': 'Message content cannot be empty.'}))
             return
+        try:
+            book_id = parse_book_id(data.get('book_id'))
+        except ValueError:
+            await self.send(text_data=json.dumps({'error': 'Invalid book ID.'}))
+            return
 
-        chat = await self.create_chat_message(user, content, book_id)
-        if chat:
-            serialized_chat = await database_sync_to_async(ChatSerializer)(chat).data
+        serialized_chat = await self.save_message(content, book_id)
+        if serialized_chat:
             await self.channel_layer.group_send(
                 self.group_name,
                 {
@@ -68,20 +107,20 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def handle_add_reaction(self, data):
         reaction_type = data.get('reaction_type')
-        user = self.scope['user']
 
         if not reaction_type:
             await self.send(text_data=json.dumps({'error': 'Reaction type is required.'}))
             return
 
-        reaction = await self.create_reaction(user, reaction_type)
-        if reaction:
-            serialized_reaction = await database_sync_to_async(MessageReactionSerializer)(reaction).data
+        saved = await self.save_reaction(reaction_type)
+        if saved:
+            serialized_reaction, reaction_counts = saved
             await self.channel_layer.group_send(
                 self.group_name,
                 {
                     'type': 'reaction_added',
                     'reaction': serialized_reaction,
+                    'reaction_counts': reaction_counts,
                 }
             )
         else:
@@ -96,45 +135,40 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def reaction_added(self, event):
         await self.send(text_data=json.dumps({
             'type': 'reaction_added',
-            'reaction': event['reaction']
+            'reaction': event['reaction'],
+            'reaction_counts': event.get('reaction_counts'),
         }))
 
     @database_sync_to_async
-    def is_valid_chat_member(self, user, chat_id):
-        try:
-            chat = Chats.objects.get(chat_id=chat_id)
-            return user in (chat.sender, chat.receiver)
-        except Chats.DoesNotExist:
-            return False
-
-    @database_sync_to_async
-    def create_chat_message(self, user, content, book_id):
-        try:
-            chat = Chats.objects.get(chat_id=self.chat_id)
-            receiver = chat.receiver if chat.sender == user else chat.sender
-            data = {'content': content, 'receiver_id': str(receiver.user_id)}  # Ensure UUID is string
-            if book_id:
-                data['book_id'] = str(book_id)  # Ensure UUID is string
-            serializer = ChatSerializer(data=data, context={'sender': user})
-            if serializer.is_valid():
-                return serializer.save()
+    def load_chat(self, user, chat_id):
+        """The chat with both participants loaded if ``user`` is one of them with a live partner, else None"""
+        chat = Chats.objects.select_related('sender', 'receiver').filter(chat_id=chat_id).first()
+        if chat is None or user.user_id not in (chat.sender_id, chat.receiver_id):
             return None
-        except Chats.DoesNotExist:
+        if chat.sender_id is None or chat.receiver_id is None:
             return None
+        return chat
 
     @database_sync_to_async
-    def create_reaction(self, user, reaction_type):
+    def save_message(self, content, book_id):
+        # Membership and partner were resolved at connect, so this is the insert and its bookkeeping only
         try:
-            chat = Chats.objects.get(chat_id=self.chat_id)
-            serializer = MessageReactionSerializer(
-                data={'reaction_type': reaction_type},
-                context={'chat': chat, 'user': user}
-            )
-            if serializer.is_valid():
-                return serializer.save()
-            return None
-        except Chats.DoesNotExist:
+            chat = create_chat_message(self.user, self.partner, clean_content(content), book_id)
+        except IntegrityError:
             return None
+        return ChatSerializer(chat).data
+
+    @database_sync_to_async
+    def save_reaction(self, reaction_type):
+        serializer = MessageReactionSerializer(
+            data={'reaction_type': reaction_type},
+            context={'chat': self.chat, 'user': self.user}
+        )
+        if serializer.is_valid():
+            serializer.save()
+            return serializer.data, self.chat.reaction_counts
+        return None
+
 
 class SocietyConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -146,8 +180,11 @@ class SocietyConsumer(AsyncWebsocketConsumer):
             await self.close(code=4001)  # Unauthorized
             return
 
-        # Verify user is a society member
-        if await self.is_society_member(user, self.society_id):
+        # Verify user is a society member, and keep the society for the whole connection
+        self.user = user
+        self.society = await self.load_society(user, self.society_id)
+        if self.society:
+            self.membership_checked_at = time.monotonic()
             await self.channel_layer.group_add(self.group_name, self.channel_name)
             await self.accept()
         else:
@@ -164,53 +201,67 @@ class SocietyConsumer(AsyncWebsocketConsumer):
             await self.send(text_data=json.dumps({'error': 'Invalid JSON data.'}))
             return
 
+        if not await self.ensure_member():
+            return
+
         action = data.get('action')
         if action == 'send_message':
             await self.handle_send_society_message(data)
         elif action == 'add_reaction':
             await self.handle_add_society_reaction(data)
+        elif action == 'read':
+            # Moves this member's unread watermark to the latest message
+            await database_sync_to_async(mark_society_read)(self.society.society_id, self.user.user_id)
         else:
             await self.send(text_data=json.dumps({'error': 'Invalid action.'}))
 
+    async def ensure_member(self):
+        """
+        Re-verify the cached membership once it is older than MEMBERSHIP_RECHECK_SECONDS
+
+        Closes the socket of a user who left or was removed from the society.
+        """
+        if time.monotonic() - self.membership_checked_at < MEMBERSHIP_RECHECK_SECONDS:
+            return True
+        if await self.load_society(self.user, self.society_id) is None:
+            await self.close(code=4003)  # Forbidden
+            return False
+        self.membership_checked_at = time.monotonic()
+        return True
+
     async def handle_send_society_message(self, data):
         content = data.get('content')
-        book_id = data.get('book_id')
-        user = self.scope['user']
 
-        if not content:
+        if not valid_content(content):
             await self.send(text_data=json.dumps({'error': 'Message content cannot be empty.'}))
             return
+        try:
+            book_id = parse_book_id(data.get('book_id'))
+        except ValueError:
+            await self.send(text_data=json.dumps({'error': 'Invalid book ID.'}))
+            return
 
-        message = await self.create_society_message(user, content, book_id)
-        if message:
-            serialized_message = await database_sync_to_async(SocietyMessageSerializer)(message).data
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    'type': 'society_message',
-                    'message': serialized_message,
-                }
-            )
-        else:
+        # Saving broadcasts the message to the society group, this socket included
+        if not await self.save_society_message(content, book_id):
             await self.send(text_data=json.dumps({'error': 'Failed to send message.'}))
 
     async def handle_add_society_reaction(self, data):
         reaction_type = data.get('reaction_type')
         message_id = data.get('message_id')
-        user = self.scope['user']
 
         if not reaction_type or not message_id:
             await self.send(text_data=json.dumps({'error': 'Reaction type and message ID are required.'}))
             return
 
-        reaction = await self.create_society_reaction(user, message_id, reaction_type)
-        if reaction:
-            serialized_reaction = await database_sync_to_async(MessageReactionSerializer)(reaction).data
+        saved = await self.save_society_reaction(message_id, reaction_type)
+        if saved:
+            serialized_reaction, reaction_counts = saved
             await self.channel_layer.group_send(
                 self.group_name,
                 {
                     'type': 'reaction_added',
                     'reaction': serialized_reaction,
+                    'reaction_counts': reaction_counts,
                 }
             )
         else:
@@ -225,44 +276,39 @@ class SocietyConsumer(AsyncWebsocketConsumer):
     async def reaction_added(self, event):
         await self.send(text_data=json.dumps({
             'type': 'reaction_added',
-            'reaction': event['reaction']
+            'reaction': event['reaction'],
+            'reaction_counts': event.get('reaction_counts'),
         }))
 
     @database_sync_to_async
-    def is_society_member(self, user, society_id):
-        return SocietyMember.objects.filter(
+    def load_society(self, user, society_id):
+        """The society if ``user`` is an active member of it, else None"""
+        membership = SocietyMember.objects.select_related('society').filter(
             society__society_id=society_id, user=user, status='ACTIVE'
-        ).exists()
+        ).first()
+        return membership.society if membership else None
 
     @database_sync_to_async
-    def create_society_message(self, user, content, book_id):
+    def save_society_message(self, content, book_id):
+        # The society and membership were resolved at connect, so this is the insert and its broadcast only
         try:
-            society = Society.objects.get(society_id=self.society_id)
-            data = {'content': content}
-            if book_id:
-                data['book_id'] = str(book_id)  # Ensure UUID is string
-            serializer = SocietyMessageSerializer(
-                data=data,
-                context={'society_id': self.society_id, 'user': user}
-            )
-            if serializer.is_valid():
-                return serializer.save()
-            return None
-        except Society.DoesNotExist:
+            return create_society_message(self.society, self.user, clean_content(content), book_id)
+        except IntegrityError:
             return None
 
     @database_sync_to_async
-    def create_society_reaction(self, user, message_id, reaction_type):
+    def save_society_reaction(self, message_id, reaction_type):
         try:
-            society_message = SocietyMessage.objects.get(
+            society_message = SocietyMessage.objects.select_related('user').get(
                 message_id=message_id, society__society_id=self.society_id, status='ACTIVE'
             )
-            serializer = MessageReactionSerializer(
-                data={'reaction_type': reaction_type},
-                context={'society_message': society_message, 'user': user}
-            )
-            if serializer.is_valid():
-                return serializer.save()
+        except (SocietyMessage.DoesNotExist, ValidationError):
             return None
-        except SocietyMessage.DoesNotExist:
-            return None
\ No newline at end of file
+        serializer = MessageReactionSerializer(
+            data={'reaction_type': reaction_type},
+            context={'society_message': society_message, 'user': self.user}
+        )
+        if serializer.is_valid():
+            serializer.save()
+            return serializer.data, society_message.reaction_counts
+        return None
@@ -0,0 +1,183 @@
+"""
+Maintenance of the denormalized Conversation rows behind the chat inbox
+
+Every change is a single statement on the pair's row: sending upserts it,
+reading and deleting adjust one side's counter or watermark. The chats table
+is only consulted again when the previewed last message gets deleted.
+"""
+import uuid
+
+from django.db import connection
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.db.models import UUIDField
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import Chats, Conversation
+
+
+def ordered_pair(user_id, partner_id):
+    """The (user_low, user_high) key of a pair of users"""
+    return tuple(sorted((uuid.UUID(str(user_id)), uuid.UUID(str(partner_id)))))
+
+
+def side_of(user_id, partner_id):
+    """'low' or 'high', the side of ``user_id`` in its conversation with ``partner_id``"""
+    return 'low' if ordered_pair(user_id, partner_id)[0] == uuid.UUID(str(user_id)) else 'high'
+
+
+def pair_filter(user_id, partner_id):
+    low, high = ordered_pair(user_id, partner_id)
+    return Q(user_low_id=low, user_high_id=high)
+
+
+def pair_messages(user_id, partner_id):
+    """
+    All messages between two users, filtered the way chats_pair_created_idx is built
+
+    Matching LEAST/GREATEST of the participants lets both directions of the
+    conversation come from one index range ordered by created_at.
+    """
+    low, high = ordered_pair(user_id, partner_id)
+    return Chats.objects.alias(
+        pair_low=Least('sender', 'receiver', output_field=UUIDField()),
+        pair_high=Greatest('sender', 'receiver', output_field=UUIDField())
+    ).filter(pair_low=low, pair_high=high)
+
+
+def record_message(chat):
+    """
+    Make ``chat`` the pair's last message and count it as unread for the receiver
+
+    Uses INSERT ... ON CONFLICT so the first message of a pair creates the row
+    and concurrent sends cannot lose an unread increment.
+    """
+    if not chat.sender_id or not chat.receiver_id:
+        return
+    low, high = ordered_pair(chat.sender_id, chat.receiver_id)
+    receiver_side = side_of(chat.receiver_id, chat.sender_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO conversations (
+                conversation_id, user_low_id, user_high_id, last_message_id, last_message_at,
+                low_unread_count, high_unread_count, created_at
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (user_low_id, user_high_id) DO UPDATE SET
+                {receiver_side}_unread_count = conversations.{receiver_side}_unread_count + 1,
+                last_message_id = CASE
+                    WHEN conversations.last_message_at IS NULL
+                      OR EXCLUDED.last_message_at >= conversations.last_message_at
+                    THEN EXCLUDED.last_message_id
+                    ELSE conversations.last_message_id
+                END,
+                last_message_at = GREATEST(conversations.last_message_at, EXCLUDED.last_message_at)
+            """,
+            [
+                uuid.uuid4(), low, high, chat.chat_id, chat.created_at,
+                int(receiver_side == 'low'), int(receiver_side == 'high'), timezone.now()
+            ]
+        )
+
+
+def record_read(receiver_id, sender_id, count=1):
+    """Take ``count`` messages from ``sender_id`` off ``receiver_id``'s unread counter"""
+    if not count:
+        return
+    field = f'{side_of(receiver_id, sender_id)}_unread_count'
+    Conversation.objects.filter(pair_filter(receiver_id, sender_id)).update(
+        **{field: Greatest(F(field) - count, 0)}
+    )
+
+
+def refresh_last_message(chat):
+    """
+    Replace a deleted message as its conversation's last message
+
+    A no-op unless ``chat`` is the current last message.
+    """
+    latest = Chats.objects.filter(
+        Q(sender_id=OuterRef('user_low_id'), receiver_id=OuterRef('user_high_id')) |
+        Q(sender_id=OuterRef('user_high_id'), receiver_id=OuterRef('user_low_id')),
+        is_deleted_by_sender=False
+    ).order_by('-created_at')
+    Conversation.objects.filter(last_message_id=chat.chat_id).update(
+        last_message_id=Subquery(latest.values('chat_id')[:1]),
+        last_message_at=Subquery(latest.values('created_at')[:1])
+    )
+
+
+def delete_conversation(user_id, partner_id):
+    """
+    Hide the conversation and all its current messages from ``user_id`` only
+
+    Returns:
+        bool: Whether the conversation exists
+    """
+    side = side_of(user_id, partner_id)
+    return bool(Conversation.objects.filter(pair_filter(user_id, partner_id)).update(**{
+        f'{side}_deleted_before': timezone.now(),
+        f'{side}_unread_count': 0,
+    }))
+
+
+def visible_since(user_id, partner_id):
+    """The deletion watermark of ``user_id`` in the conversation, or None"""
+    side = side_of(user_id, partner_id)
+    return Conversation.objects.filter(pair_filter(user_id, partner_id)).values_list(
+        f'{side}_deleted_before', flat=True
+    ).first()
+
+
+def hidden_by_deletion(user):
+    """
+    Whether a Chats row is at or before ``user``'s deletion watermark of its conversation
+
+    Returns:
+        Exists: An expression to filter or annotate Chats querysets with
+    """
+    return Exists(Conversation.objects.filter(
+        user_low_id=Least(OuterRef('sender_id'), OuterRef('receiver_id'), output_field=UUIDField()),
+        user_high_id=Greatest(OuterRef('sender_id'), OuterRef('receiver_id'), output_field=UUIDField())
+    ).filter(
+        Q(user_low=user, low_deleted_before__gte=OuterRef('created_at')) |
+        Q(user_high=user, high_deleted_before__gte=OuterRef('created_at'))
+    ))
+
+
+def deleted_conversations(user, after, until=None):
+    """
+    Conversations ``user`` deleted after ``after``, and up to ``until`` if given
+
+    Returns:
+        list: (partner_id, deleted_before) tuples, oldest deletion first
+    """
+    deletions = []
+    for side, partner in (('low', 'user_high_id'), ('high', 'user_low_id')):
+        filters = {f'user_{side}': user, f'{side}_deleted_before__gt': after}
+        if until is not None:
+            filters[f'{side}_deleted_before__lte'] = until
+        deletions += Conversation.objects.filter(**filters).values_list(partner, f'{side}_deleted_before')
+    return sorted(deletions, key=lambda deletion: deletion[1])
+
+
+def inbox(user):
+    """
+    Conversations shown in ``user``'s inbox, latest first, in one indexed query
+
+    Rows come with the partner, last message and its relations loaded.
+    """
+    visible_as_low = Q(user_low=user) & (
+        Q(low_deleted_before__isnull=True) | Q(last_message_at__gt=F('low_deleted_before'))
+    )
+    visible_as_high = Q(user_high=user) & (
+        Q(high_deleted_before__isnull=True) | Q(last_message_at__gt=F('high_deleted_before'))
+    )
+    return Conversation.objects.filter(
+        visible_as_low | visible_as_high,
+        last_message__isnull=False
+    ).select_related(
+        'user_low', 'user_high',
+        'last_message__sender', 'last_message__receiver', 'last_message__book'
+    ).order_by('-last_message_at')
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import time
+import uuid
+
+from channels.layers import InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from backend.chat.models import Chats
+from backend.chat.routing import websocket_urlpatterns
+from backend.discussions.models import Society, SocietyMember
+from backend.users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Measure messages/sec through ChatConsumer and SocietyConsumer in this process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500, help='Messages sent through each consumer')
+        parser.add_argument('--members', type=int, default=20, help='Active members of the benchmark society')
+        parser.add_argument(
+            '--in-memory', action='store_true',
+            help='Use the in-memory channel layer instead of the configured (Redis) one'
+        )
+
+    def handle(self, *args, **options):
+        if options['in_memory']:
+            channel_layers.set('default', InMemoryChannelLayer())
+
+        suffix = uuid.uuid4().hex[:8]
+        users = [
+            CustomUser.objects.create_user(f'bench_{suffix}_{i}', f'bench_{suffix}_{i}@example.com', uuid.uuid4().hex)
+            for i in range(max(options['members'], 2))
+        ]
+        sender, receiver = users[:2]
+        chat = Chats.objects.create(sender=sender, receiver=receiver, content='Benchmark')
+        society = Society.objects.create(name=f'Benchmark {suffix}', creator=sender)
+        SocietyMember.objects.bulk_create([SocietyMember(society=society, user=user) for user in users])
+
+        try:
+            for name, path in [
+                ('ChatConsumer', f'/ws/chat/{chat.chat_id}/'),
+                ('SocietyConsumer', f'/ws/society/{society.society_id}/'),
+            ]:
+                sent, seconds = asyncio.run(self._run(path, sender, options['messages']))
+                self.stdout.write(
+                    f"{name}: {sent} messages in {seconds * 1000:.0f} ms, {sent / seconds:.0f} messages/sec"
+                )
+        finally:
+            Chats.objects.filter(sender__in=users).delete()
+            society.delete()
+            CustomUser.objects.filter(user_id__in=[user.user_id for user in users]).delete()
+
+    async def _run(self, path, user, count):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        if not connected:
+            raise RuntimeError(f"Could not connect to {path}")
+
+        # Each message is sent, stored and received back from the group before the next one
+        start = time.perf_counter()
+        for i in range(count):
+            await communicator.send_to(text_data=json.dumps({'action': 'send_message', 'content': f'Message {i}'}))
+            response = json.loads(await communicator.receive_from(timeout=10))
+            if 'error' in response:
+                raise RuntimeError(response['error'])
+        seconds = time.perf_counter() - start
+
+        await communicator.disconnect()
+        return count, seconds
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from backend.chat.media_processing import process_pending_media
+
+
+class Command(BaseCommand):
+    help = 'Extract thumbnails, durations and waveforms for new chat media (long-running worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Media messages claimed per batch')
+        parser.add_argument('--poll-interval', type=float, default=2, help='Seconds to wait when nothing is pending')
+        parser.add_argument('--once', action='store_true', help='Process everything pending once and exit')
+
+    def handle(self, *args, **options):
+        processed = 0
+        try:
+            while True:
+                batch = process_pending_media(batch_size=options['batch_size'])
+                processed += batch
+                if batch < options['batch_size']:
+                    if options['once']:
+                        self.stdout.write(f'Processed {processed} media messages')
+                        return
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            return
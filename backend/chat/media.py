@@ -0,0 +1,279 @@
+"""
+Chat attachments stored in object storage
+
+Clients start an upload, send the file in MEDIA_UPLOAD_PART_SIZE parts and
+then complete it, which assembles the object and creates the Chats row. With
+MinIO each part goes straight to storage through a presigned URL; otherwise,
+and for clients that cannot reach storage, parts are streamed through the
+server. Nothing holds more than one part in memory, and the legacy form upload
+is streamed with upload_fileobj and a bounded TransferConfig.
+"""
+import logging
+import math
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from backend.utils.minio_storage import get_object_client, get_object_url
+from .messages import clean_content, create_chat_message
+from .models import MediaUpload
+
+logger = logging.getLogger(__name__)
+
+MEDIA_MESSAGE_TYPES = ('IMAGE', 'AUDIO', 'VIDEO', 'VOICE_NOTE', 'FILE')
+# S3 allows at most this many parts per upload
+MAX_PARTS = 10000
+PRESIGNED_URL_EXPIRY = 3600
+# Request bodies are read in chunks of this size and spill to disk past SPOOL_SIZE
+STREAM_CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024
+
+
+class MediaUploadError(Exception):
+    """An upload request that cannot be honoured; the message is safe to show to clients"""
+
+
+class MediaUploadExpired(MediaUploadError):
+    """The storage side of a pending upload is gone; the upload has been marked ABORTED"""
+
+
+def _missing_upload(error):
+    return error.response.get('Error', {}).get('Code') == 'NoSuchUpload'
+
+
+def _expire(upload):
+    upload.status = 'ABORTED'
+    upload.save(update_fields=['status'])
+    raise MediaUploadExpired("Upload has expired or was aborted.")
+
+
+def transfer_config():
+    # At most max_concurrency parts of multipart_chunksize are buffered at once
+    return TransferConfig(
+        multipart_threshold=settings.MEDIA_UPLOAD_PART_SIZE,
+        multipart_chunksize=settings.MEDIA_UPLOAD_PART_SIZE,
+        max_concurrency=4,
+        use_threads=True,
+    )
+
+
+def object_key(sender_id, upload_id, filename):
+    return f"chat-media/{sender_id}/{upload_id}/{get_valid_filename(os.path.basename(filename)) or 'file'}"
+
+
+def part_count(size):
+    return max(1, math.ceil(size / settings.MEDIA_UPLOAD_PART_SIZE))
+
+
+def start_upload(sender, receiver, message_type, filename, size, content_type=''):
+    """
+    Open a multipart upload for an attachment from ``sender`` to ``receiver``
+
+    Returns:
+        tuple: The MediaUpload, and the presigned URL of each part in order
+        (None where parts must be sent through the server)
+
+    Raises:
+        MediaUploadError: If the file is too large
+    """
+    if size > settings.MEDIA_UPLOAD_MAX_SIZE:
+        raise MediaUploadError(f"File size cannot exceed {settings.MEDIA_UPLOAD_MAX_SIZE // (1024 * 1024)}MB.")
+    if part_count(size) > MAX_PARTS:
+        raise MediaUploadError("File has too many parts.")
+
+    upload = MediaUpload(
+        sender=sender, receiver=receiver, message_type=message_type,
+        filename=os.path.basename(filename)[:255], content_type=content_type or '', size=size
+    )
+    upload.object_key = object_key(sender.user_id, upload.upload_id, filename)
+    client = get_object_client()
+    extra = {'ContentType': content_type} if content_type else {}
+    upload.storage_upload_id = client.create_multipart_upload(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=upload.object_key, **extra
+    )['UploadId']
+    upload.save(force_insert=True)
+
+    urls = [
+        client.generate_presigned_url(
+            'upload_part',
+            Params={
+                'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': upload.object_key,
+                'UploadId': upload.storage_upload_id, 'PartNumber': number
+            },
+            ExpiresIn=PRESIGNED_URL_EXPIRY
+        )
+        for number in range(1, part_count(size) + 1)
+    ]
+    return upload, urls
+
+
+def upload_part(upload, part_number, stream):
+    """
+    Stream one part of a pending upload from a request body to storage
+
+    The body is copied in STREAM_CHUNK_SIZE chunks into a spooled temporary
+    file, so at most SPOOL_SIZE of it is held in memory.
+
+    Raises:
+        MediaUploadError: If the part number or size is out of range
+        MediaUploadExpired: If storage no longer has the upload
+    """
+    if not 1 <= part_number <= part_count(upload.size):
+        raise MediaUploadError("Invalid part number.")
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as body:
+        received = 0
+        for chunk in iter(lambda: stream.read(STREAM_CHUNK_SIZE), b''):
+            received += len(chunk)
+            if received > settings.MEDIA_UPLOAD_PART_SIZE:
+                raise MediaUploadError("Part is larger than the part size.")
+            body.write(chunk)
+        if not received:
+            raise MediaUploadError("Part is empty.")
+        body.seek(0)
+        try:
+            return get_object_client().upload_part(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=upload.object_key,
+                UploadId=upload.storage_upload_id, PartNumber=part_number, Body=body
+            )['ETag']
+        except ClientError as e:
+            if _missing_upload(e):
+                _expire(upload)
+            raise
+
+
+def _uploaded_parts(client, upload):
+    parts, marker = [], 0
+    while True:
+        page = client.list_parts(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=upload.object_key,
+            UploadId=upload.storage_upload_id, PartNumberMarker=marker
+        )
+        parts += page.get('Parts', [])
+        if not page.get('IsTruncated'):
+            return parts
+        marker = page['NextPartNumberMarker']
+
+
+def _stored_size(client, upload):
+    try:
+        return client.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=upload.object_key)['ContentLength']
+    except ClientError:
+        return None
+
+
+def complete_upload(upload, content=None):
+    """
+    Assemble a pending upload and create its message
+
+    The parts are listed from storage, so clients do not need to send back the
+    ETags, and the assembled size is checked against the declared one. Callers
+    hold a row lock on ``upload`` so it is completed only once. If an earlier
+    attempt assembled the object but failed before recording the message, the
+    stored object is used as is.
+
+    Returns:
+        Chats: The new media message
+
+    Raises:
+        MediaUploadError: If parts are missing or the size does not match
+        MediaUploadExpired: If storage has neither the upload nor its assembled object
+    """
+    client = get_object_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    try:
+        parts = _uploaded_parts(client, upload)
+    except ClientError as e:
+        if not _missing_upload(e):
+            raise
+        if _stored_size(client, upload) != upload.size:
+            _expire(upload)
+    else:
+        if [part['PartNumber'] for part in parts] != list(range(1, part_count(upload.size) + 1)):
+            raise MediaUploadError("Upload is missing parts.")
+        if sum(part['Size'] for part in parts) != upload.size:
+            raise MediaUploadError("Uploaded size does not match the declared size.")
+
+        client.complete_multipart_upload(
+            Bucket=bucket, Key=upload.object_key, UploadId=upload.storage_upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': part['PartNumber'], **({'ETag': part['ETag']} if 'ETag' in part else {})}
+                for part in parts
+            ]}
+        )
+
+    with transaction.atomic():
+        chat = create_chat_message(
+            upload.sender, upload.receiver, clean_content(content) if content else None,
+            message_type=upload.message_type,
+            media_url=get_object_url(upload.object_key),
+            media_filename=upload.filename,
+            media_size=upload.size,
+        )
+        upload.status = 'COMPLETED'
+        upload.chat = chat
+        upload.save(update_fields=['status', 'chat'])
+    return chat
+
+
+def abort_upload(upload):
+    """Discard a pending upload and the parts stored so far"""
+    try:
+        get_object_client().abort_multipart_upload(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=upload.object_key, UploadId=upload.storage_upload_id
+        )
+    except Exception as e:
+        # Storage lifecycle rules clean up what could not be aborted here
+        logger.warning(f"Failed to abort media upload {upload.upload_id}: {e}")
+    upload.status = 'ABORTED'
+    upload.save(update_fields=['status'])
+
+
+def store_media_file(sender, receiver, message_type, media_file, content=None):
+    """
+    Upload a file received as a form field and create its message in one request
+
+    Django spools large uploads to a temporary file; upload_fileobj reads it
+    back in parts, so memory stays bounded by the transfer config.
+
+    Returns:
+        Chats: The new media message
+    """
+    key = object_key(sender.user_id, uuid.uuid4(), media_file.name)
+    extra = {'ContentType': media_file.content_type} if getattr(media_file, 'content_type', None) else {}
+    media_file.seek(0)
+    get_object_client().upload_fileobj(
+        media_file, settings.AWS_STORAGE_BUCKET_NAME, key, ExtraArgs=extra, Config=transfer_config()
+    )
+    return create_chat_message(
+        sender, receiver, clean_content(content) if content else None,
+        message_type=message_type,
+        media_url=get_object_url(key),
+        media_filename=os.path.basename(media_file.name)[:255],
+        media_size=media_file.size,
+    )
+
+
+def expire_media_uploads(now=None, batch_size=500):
+    """
+    Abort uploads still pending after MEDIA_UPLOAD_TTL_HOURS
+
+    Returns:
+        int: Number of uploads aborted
+    """
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.MEDIA_UPLOAD_TTL_HOURS)
+    with transaction.atomic():
+        expired = list(MediaUpload.objects.select_for_update(skip_locked=True).filter(
+            status='PENDING', created_at__lt=cutoff
+        )[:batch_size])
+        for upload in expired:
+            abort_upload(upload)
+    return len(expired)
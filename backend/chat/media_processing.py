@@ -0,0 +1,198 @@
+"""
+Background extraction of previews for chat media
+
+New media messages are picked up by the process_chat_media worker, which
+writes image thumbnails to object storage and reads the duration and a
+downsampled waveform of audio and voice notes. Results for a batch are written
+back with one bulk UPDATE; clients pick them up through the delta sync
+endpoint, as ``updated_at`` moves.
+
+Audio is decoded with the standard library and NumPy only: PCM WAV gets a
+duration and a waveform, Ogg (Vorbis/Opus) a duration read from its page
+headers. Other formats, and videos, are marked processed without previews.
+"""
+import io
+import logging
+import math
+import struct
+import tempfile
+import wave
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from backend.utils.minio_storage import get_object_client, get_object_url, object_key_from_url
+from .media import transfer_config
+from .models import Chats
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 80
+# Bars in the waveform drawn for audio and voice notes
+WAVEFORM_POINTS = 64
+# The last Ogg page, which carries the final granule position, is searched for in this tail
+OGG_TAIL_SIZE = 64 * 1024
+OPUS_GRANULE_RATE = 48000
+AUDIO_MESSAGE_TYPES = ('AUDIO', 'VOICE_NOTE')
+
+
+def make_thumbnail(fileobj):
+    """
+    Render a JPEG thumbnail of an image no larger than THUMBNAIL_SIZE
+
+    Returns:
+        bytes: The encoded thumbnail
+    """
+    with Image.open(fileobj) as image:
+        # JPEGs are decoded straight at a reduced scale
+        image.draft('RGB', THUMBNAIL_SIZE)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(THUMBNAIL_SIZE)
+        output = io.BytesIO()
+        image.convert('RGB').save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def _pcm_samples(frames, sample_width):
+    if sample_width == 1:
+        return np.frombuffer(frames, dtype=np.uint8).astype(np.int32) - 128
+    if sample_width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        return np.where(samples & 0x800000, samples - 0x1000000, samples)
+    return np.frombuffer(frames, dtype={2: '<i2', 4: '<i4'}[sample_width])
+
+
+def wav_info(fileobj):
+    """
+    Duration and waveform of a PCM WAV file
+
+    The file is read one waveform bar at a time, keeping the peak of each.
+
+    Returns:
+        tuple: Duration in whole seconds, and WAVEFORM_POINTS peaks scaled to 0-100
+    """
+    with wave.open(fileobj, 'rb') as audio:
+        frames, rate, sample_width = audio.getnframes(), audio.getframerate(), audio.getsampwidth()
+        frames_per_point = max(1, math.ceil(frames / WAVEFORM_POINTS))
+        peaks = []
+        for chunk in iter(lambda: audio.readframes(frames_per_point), b''):
+            samples = _pcm_samples(chunk, sample_width)
+            peaks.append(int(np.abs(samples).max()) if samples.size else 0)
+    duration = round(frames / rate) if rate else 0
+    loudest = max(peaks, default=0)
+    waveform = [round(peak * 100 / loudest) for peak in peaks] if loudest else [0] * len(peaks)
+    return duration, waveform
+
+
+def ogg_duration(fileobj):
+    """
+    Duration of an Ogg Vorbis or Opus file from its first and last page headers
+
+    Returns:
+        int: Duration in whole seconds, or None if the stream is not recognised
+    """
+    fileobj.seek(0)
+    head = fileobj.read(OGG_TAIL_SIZE)
+    if not head.startswith(b'OggS'):
+        return None
+    body = head[27 + head[26]:]
+    if body.startswith(b'\x01vorbis'):
+        rate, pre_skip = struct.unpack_from('<I', body, 12)[0], 0
+    elif body.startswith(b'OpusHead'):
+        pre_skip, rate = struct.unpack_from('<H', body, 10)[0], OPUS_GRANULE_RATE
+    else:
+        return None
+
+    fileobj.seek(0, io.SEEK_END)
+    fileobj.seek(max(0, fileobj.tell() - OGG_TAIL_SIZE))
+    tail = fileobj.read()
+    last_page = tail.rfind(b'OggS')
+    if last_page < 0 or len(tail) < last_page + 14 or not rate:
+        return None
+    granule = struct.unpack_from('<q', tail, last_page + 6)[0]
+    return max(0, round((granule - pre_skip) / rate))
+
+
+def audio_info(fileobj):
+    """
+    Duration and waveform of an audio file, as far as its format can be decoded here
+
+    Returns:
+        tuple: Duration in seconds (or None) and waveform (or None)
+    """
+    signature = fileobj.read(12)
+    fileobj.seek(0)
+    if signature[:4] == b'RIFF' and signature[8:12] == b'WAVE':
+        try:
+            return wav_info(fileobj)
+        except (wave.Error, EOFError, KeyError):
+            # Compressed WAV; fall through with nothing to show
+            return None, None
+    if signature[:4] == b'OggS':
+        return ogg_duration(fileobj), None
+    return None, None
+
+
+def _process(client, chat):
+    key = object_key_from_url(chat.media_url)
+    if not key or chat.message_type not in ('IMAGE', *AUDIO_MESSAGE_TYPES):
+        return
+    with tempfile.TemporaryFile() as media:
+        client.download_fileobj(settings.AWS_STORAGE_BUCKET_NAME, key, media, Config=transfer_config())
+        media.seek(0)
+        if chat.message_type == 'IMAGE':
+            thumbnail_key = f"chat-media/thumbnails/{chat.chat_id}.jpg"
+            client.upload_fileobj(
+                io.BytesIO(make_thumbnail(media)), settings.AWS_STORAGE_BUCKET_NAME, thumbnail_key,
+                ExtraArgs={'ContentType': 'image/jpeg'}
+            )
+            chat.media_thumbnail = get_object_url(thumbnail_key)
+        else:
+            duration, waveform = audio_info(media)
+            if duration is not None:
+                chat.media_duration = duration
+            chat.media_waveform = waveform
+
+
+def process_pending_media(batch_size=20):
+    """
+    Extract previews for one batch of unprocessed media messages
+
+    Rows are claimed in a short transaction by stamping ``media_processed_at``,
+    so no lock is held while files are downloaded and several workers can run
+    at once. A file that cannot be read is logged and left without previews.
+
+    Returns:
+        int: Number of messages processed
+    """
+    with transaction.atomic():
+        chats = list(
+            Chats.objects.select_for_update(skip_locked=True)
+            .filter(media_url__isnull=False, media_processed_at__isnull=True)
+            .order_by('created_at')
+            .only('chat_id', 'message_type', 'media_url', 'media_thumbnail', 'media_duration', 'media_waveform')
+            [:batch_size]
+        )
+        if not chats:
+            return 0
+        Chats.objects.filter(chat_id__in=[chat.chat_id for chat in chats]).update(media_processed_at=timezone.now())
+
+    client = get_object_client()
+    for chat in chats:
+        try:
+            _process(client, chat)
+        except Exception as e:
+            logger.warning(f"Failed to extract media previews for chat {chat.chat_id}: {e}")
+
+    now = timezone.now()
+    for chat in chats:
+        chat.media_processed_at = chat.updated_at = now
+    Chats.objects.bulk_update(
+        chats, ['media_thumbnail', 'media_duration', 'media_waveform', 'media_processed_at', 'updated_at']
+    )
+    return len(chats)
@@ -0,0 +1,93 @@
+"""
+Write paths for private and society messages
+
+Used by the REST serializers once they have validated a request, and directly by
+the websocket consumers, which resolve the sender's conversation or membership
+once at connect. Content is always sanitized here; what the consumers skip is
+the per-message lookup of users, books and societies.
+"""
+import bleach
+from django.db import transaction
+from markdown import markdown
+
+from backend.discussions.models import SocietyMessage
+from backend.swaps.models import Notification
+from backend.utils.websocket import send_notification_to_user
+from .conversations import record_message
+from .models import Chats
+from .society_fanout import record_society_message
+
+
+def clean_content(value):
+    """Render markdown and strip it down to the tags messages may contain"""
+    return bleach.clean(
+        markdown(value),
+        tags=['p', 'strong', 'em', 'a', 'code'],
+        attributes={'a': ['href']},
+        protocols=['https']
+    )
+
+
+@transaction.atomic
+def create_chat_message(sender, receiver, content, book_id=None, **fields):
+    """
+    Insert a private message and do its bookkeeping
+
+    Updates the pair's conversation row and notifies the receiver.
+
+    Args:
+        sender: Sending user
+        receiver: Receiving user
+        content: Sanitized content, see clean_content
+        book_id: Optional referenced book; its existence is enforced by the foreign key
+
+    Returns:
+        Chats: The message, with sender and receiver attached
+    """
+    chat = Chats(sender=sender, receiver=receiver, content=content, book_id=book_id, status='SENT', **fields)
+    chat.save(force_insert=True)
+    record_message(chat)
+
+    text = f"{sender.username} sent you a {'media message' if chat.media_url else 'message'}."
+    notification = Notification.objects.create(
+        user=receiver,
+        type='message_received',
+        message=text,
+        content_type='chat',
+        content_id=chat.chat_id
+    )
+    send_notification_to_user(
+        receiver.user_id,
+        {
+            "notification_id": str(notification.notification_id),
+            "message": text,
+            "type": "message_received",
+            "content_type": "chat",
+            "content_id": str(chat.chat_id),
+            "follow_id": None
+        }
+    )
+    return chat
+
+
+@transaction.atomic
+def create_society_message(society, user, content, book_id=None, **fields):
+    """
+    Insert a society message and broadcast it to the society's group
+
+    Cost does not depend on the number of members: unread badges come from
+    read watermarks and absent members get a digest later, see society_fanout.
+
+    Args:
+        society: Society the message is posted to
+        user: Posting member
+        content: Sanitized content, see clean_content
+        book_id: Optional referenced book; its existence is enforced by the foreign key
+
+    Returns:
+        SocietyMessage: The message, with society and user attached
+    """
+    message = SocietyMessage(society=society, user=user, content=content, book_id=book_id, **fields)
+    message.save(force_insert=True)
+    record_society_message(message)
+    return message
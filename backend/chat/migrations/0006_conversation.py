@@ -0,0 +1,73 @@
+# Generated by Django 5.2 on 2026-10-19 00:04
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_conversations(apps, schema_editor):
+    """One conversation per pair that already exchanged messages, in a single INSERT ... SELECT"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO conversations (
+                conversation_id, user_low_id, user_high_id, last_message_id, last_message_at,
+                low_unread_count, high_unread_count, created_at
+            )
+            SELECT
+                gen_random_uuid(),
+                pair.user_low_id,
+                pair.user_high_id,
+                (array_agg(pair.chat_id ORDER BY pair.created_at DESC) FILTER (WHERE NOT pair.is_deleted_by_sender))[1],
+                max(pair.created_at) FILTER (WHERE NOT pair.is_deleted_by_sender),
+                count(*) FILTER (WHERE pair.unread AND pair.receiver_id = pair.user_low_id),
+                count(*) FILTER (WHERE pair.unread AND pair.receiver_id = pair.user_high_id),
+                min(pair.created_at)
+            FROM (
+                SELECT chat_id, receiver_id, created_at, is_deleted_by_sender,
+                       status IN ('SENT', 'DELIVERED') AS unread,
+                       LEAST(sender_id, receiver_id) AS user_low_id,
+                       GREATEST(sender_id, receiver_id) AS user_high_id
+                FROM chats
+                WHERE sender_id IS NOT NULL AND receiver_id IS NOT NULL AND sender_id <> receiver_id
+            ) pair
+            GROUP BY pair.user_low_id, pair.user_high_id
+            ON CONFLICT (user_low_id, user_high_id) DO NOTHING
+            """
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_chats_delivered_at_chats_media_duration_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('conversation_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('last_message_at', models.DateTimeField(blank=True, db_comment='created_at of the last message', null=True)),
+                ('low_unread_count', models.PositiveIntegerField(db_comment='Messages user_low has not read yet', default=0)),
+                ('high_unread_count', models.PositiveIntegerField(db_comment='Messages user_high has not read yet', default=0)),
+                ('low_deleted_before', models.DateTimeField(blank=True, db_comment='user_low deleted the conversation up to this time; older messages are hidden from them', null=True)),
+                ('high_deleted_before', models.DateTimeField(blank=True, db_comment='user_high deleted the conversation up to this time; older messages are hidden from them', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_message', models.ForeignKey(blank=True, db_comment='Latest message not deleted by its sender, shown in the inbox', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.chats')),
+                ('user_high', models.ForeignKey(db_comment='Participant with the larger user_id', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(db_comment='Participant with the smaller user_id', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'conversations',
+                'db_table_comment': 'Denormalized private chat inbox, one row per user pair',
+                'indexes': [models.Index(fields=['user_low', '-last_message_at'], name='conversations_low_inbox_idx'), models.Index(fields=['user_high', '-last_message_at'], name='conversations_high_inbox_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_low', 'user_high'), name='conversations_unique_pair'), models.CheckConstraint(condition=models.Q(('user_low__lt', models.F('user_high'))), name='conversations_ordered_pair')],
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-19 00:07
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_conversation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chats',
+            index=models.Index(django.db.models.functions.comparison.Least('sender', 'receiver'), django.db.models.functions.comparison.Greatest('sender', 'receiver'), models.F('created_at'), models.F('chat_id'), name='chats_pair_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chats',
+            index=models.Index(fields=['sender', 'updated_at'], name='chats_sender_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chats',
+            index=models.Index(fields=['receiver', 'updated_at'], name='chats_receiver_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-19 00:10
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+def backfill_search_vectors(apps, schema_editor):
+    """Fill the new column in committed batches so the table is never locked for long"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                """
+                UPDATE chats SET search_vector = to_tsvector('english', coalesce(content, ''))
+                WHERE chat_id IN (SELECT chat_id FROM chats WHERE search_vector IS NULL LIMIT 5000)
+                """
+            )
+            if cursor.rowcount < 5000:
+                break
+
+
+class Migration(migrations.Migration):
+    # The backfill commits per batch and the index is built concurrently
+    atomic = False
+
+    dependencies = [
+        ('chat', '0007_message_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chats',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(db_comment='Full-text search vector of content, maintained on create and edit', editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='chats',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='chats_search_idx'),
+        ),
+    ]
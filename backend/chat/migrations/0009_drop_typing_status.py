@@ -0,0 +1,16 @@
+# Generated by Django 5.2 on 2026-10-19 00:19
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_message_search'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='ChatTypingStatus',
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-19 00:24
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_drop_typing_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaUpload',
+            fields=[
+                ('upload_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('message_type', models.CharField(choices=[('TEXT', 'Text'), ('IMAGE', 'Image'), ('AUDIO', 'Audio'), ('VIDEO', 'Video'), ('VOICE_NOTE', 'Voice Note'), ('BOOK_REFERENCE', 'Book Reference'), ('FILE', 'File')], max_length=20)),
+                ('filename', models.CharField(db_comment='Original filename', max_length=255)),
+                ('content_type', models.CharField(blank=True, default='', max_length=100)),
+                ('size', models.BigIntegerField(db_comment='Size in bytes declared when the upload started')),
+                ('object_key', models.CharField(db_comment='Key of the object in the media bucket', max_length=500)),
+                ('storage_upload_id', models.CharField(db_comment='Multipart upload ID issued by object storage', max_length=255)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('COMPLETED', 'Completed'), ('ABORTED', 'Aborted')], default='PENDING', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chat', models.OneToOneField(blank=True, db_comment='Message created when the upload completed', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.chats')),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='media_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'chat_media_uploads',
+                'db_table_comment': 'Multipart uploads of chat attachments in progress',
+                'indexes': [models.Index(condition=models.Q(('status', 'PENDING')), fields=['created_at'], name='media_uploads_pending_idx')],
+            },
+        ),
+    ]
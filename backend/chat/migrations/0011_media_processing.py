@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 00:28
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The pending-media index is built concurrently
+    atomic = False
+
+    dependencies = [
+        ('chat', '0010_media_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chats',
+            name='media_processed_at',
+            field=models.DateTimeField(blank=True, db_comment='When previews were extracted; null while media waits for the processing worker', null=True),
+        ),
+        migrations.AddField(
+            model_name='chats',
+            name='media_waveform',
+            field=models.JSONField(blank=True, db_comment='Downsampled peaks (0-100) of audio and voice notes for the player', null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='chats',
+            index=models.Index(condition=models.Q(('media_processed_at__isnull', True), ('media_url__isnull', False)), fields=['created_at'], name='chats_media_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-19 00:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Older clients could react to a message more than once; keep each user's latest reaction
+DEDUPLICATE_REACTIONS = """
+DELETE FROM message_reactions older
+USING message_reactions newer
+WHERE older.user_id = newer.user_id
+  AND (older.chat_id = newer.chat_id OR older.society_message_id = newer.society_message_id)
+  AND (older.created_at, older.reaction_id) < (newer.created_at, newer.reaction_id)
+"""
+
+BACKFILL_REACTION_COUNTS = """
+UPDATE chats SET reaction_counts = counts.reaction_counts
+FROM (
+    SELECT chat_id, jsonb_object_agg(reaction_type, total) AS reaction_counts
+    FROM (
+        SELECT chat_id, reaction_type, COUNT(*) AS total
+        FROM message_reactions WHERE chat_id IS NOT NULL GROUP BY chat_id, reaction_type
+    ) AS totals
+    GROUP BY chat_id
+) AS counts
+WHERE chats.chat_id = counts.chat_id;
+
+UPDATE society_messages SET reaction_counts = counts.reaction_counts
+FROM (
+    SELECT society_message_id, jsonb_object_agg(reaction_type, total) AS reaction_counts
+    FROM (
+        SELECT society_message_id, reaction_type, COUNT(*) AS total
+        FROM message_reactions WHERE society_message_id IS NOT NULL GROUP BY society_message_id, reaction_type
+    ) AS totals
+    GROUP BY society_message_id
+) AS counts
+WHERE society_messages.message_id = counts.society_message_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_media_processing'),
+        ('discussions', '0011_society_message_reaction_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chats',
+            name='reaction_counts',
+            field=models.JSONField(blank=True, db_comment='Reaction type to number of reactions, maintained with the reactions', default=dict),
+        ),
+        migrations.RunSQL(DEDUPLICATE_REACTIONS, migrations.RunSQL.noop),
+        migrations.RunSQL(BACKFILL_REACTION_COUNTS, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='messagereaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('chat__isnull', False)), fields=('user', 'chat'), name='one_reaction_per_chat'),
+        ),
+        migrations.AddConstraint(
+            model_name='messagereaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('society_message__isnull', False)), fields=('user', 'society_message'), name='one_reaction_per_society_message'),
+        ),
+    ]
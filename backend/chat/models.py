@@ -1,8 +1,13 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
 import uuid
 from django.utils import timezone
+from backend.utils.search import SearchVectorMixin
 
-class Chats(models.Model):
+class Chats(SearchVectorMixin, models.Model):
     STATUS_CHOICES = (
         ('SENT', 'Sent'),
         ('DELIVERED', 'Delivered'),
@@ -43,6 +48,16 @@ class Chats(models.Model):
     media_duration = models.IntegerField(blank=True, null=True, db_comment='Duration in seconds for audio/video')
     media_size = models.BigIntegerField(blank=True, null=True, db_comment='File size in bytes')
     media_filename = models.CharField(max_length=255, blank=True, null=True, db_comment='Original filename')
+    media_waveform = models.JSONField(
+        blank=True,
+        null=True,
+        db_comment='Downsampled peaks (0-100) of audio and voice notes for the player'
+    )
+    media_processed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        db_comment='When previews were extracted; null while media waits for the processing worker'
+    )
 
     book = models.ForeignKey(
         'library.Book',
@@ -62,6 +77,16 @@ class Chats(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True, db_comment='Tracks last update')
     edited_at = models.DateTimeField(auto_now=True, db_comment='Tracks last edit')
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        db_comment='Full-text search vector of content, maintained on create and edit'
+    )
+    reaction_counts = models.JSONField(
+        default=dict,
+        blank=True,
+        db_comment='Reaction type to number of reactions, maintained with the reactions'
+    )
 
     class Meta:
         db_table = 'chats'
@@ -69,6 +94,21 @@ class Chats(models.Model):
         indexes = [
             models.Index(fields=['sender', 'receiver']),
             models.Index(fields=['created_at']),
+            # Conversation history: both directions of a pair share one index range
+            models.Index(
+                Least('sender', 'receiver'), Greatest('sender', 'receiver'), F('created_at'), F('chat_id'),
+                name='chats_pair_created_idx'
+            ),
+            # Delta sync of everything that changed for a user
+            models.Index(fields=['sender', 'updated_at'], name='chats_sender_updated_idx'),
+            models.Index(fields=['receiver', 'updated_at'], name='chats_receiver_updated_idx'),
+            GinIndex(fields=['search_vector'], name='chats_search_idx'),
+            # Queue of media messages waiting for preview extraction
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(media_url__isnull=False, media_processed_at__isnull=True),
+                name='chats_media_pending_idx'
+            ),
         ]
 
     def __str__(self):
@@ -84,38 +124,119 @@ class Chats(models.Model):
 
     def mark_as_read(self):
         """Mark message as read"""
+        from .conversations import record_read
+
         if self.status in ['SENT', 'DELIVERED']:
             self.status = 'READ'
             self.read_at = timezone.now()
             self.save(update_fields=['status', 'read_at'])
+            record_read(self.receiver_id, self.sender_id)
 
 
-class ChatTypingStatus(models.Model):
-    """Track typing status for real-time indicators"""
-    typing_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.ForeignKey(
+class Conversation(models.Model):
+    """
+    One row per pair of users who exchanged private messages, for the chat inbox
+
+    The pair is stored ordered (user_low < user_high) so each pair has exactly one
+    row. Counters and watermarks exist once per side and are maintained by
+    backend.chat.conversations when messages are sent, read and deleted.
+    """
+    conversation_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_low = models.ForeignKey(
         'users.CustomUser',
         on_delete=models.CASCADE,
-        related_name='typing_statuses'
+        related_name='+',
+        db_comment='Participant with the smaller user_id'
     )
-    chat_partner = models.ForeignKey(
+    user_high = models.ForeignKey(
         'users.CustomUser',
         on_delete=models.CASCADE,
-        related_name='partner_typing_statuses'
+        related_name='+',
+        db_comment='Participant with the larger user_id'
+    )
+    last_message = models.ForeignKey(
+        Chats,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+',
+        db_comment='Latest message not deleted by its sender, shown in the inbox'
+    )
+    last_message_at = models.DateTimeField(blank=True, null=True, db_comment='created_at of the last message')
+    low_unread_count = models.PositiveIntegerField(default=0, db_comment='Messages user_low has not read yet')
+    high_unread_count = models.PositiveIntegerField(default=0, db_comment='Messages user_high has not read yet')
+    low_deleted_before = models.DateTimeField(
+        blank=True,
+        null=True,
+        db_comment='user_low deleted the conversation up to this time; older messages are hidden from them'
+    )
+    high_deleted_before = models.DateTimeField(
+        blank=True,
+        null=True,
+        db_comment='user_high deleted the conversation up to this time; older messages are hidden from them'
     )
-    is_typing = models.BooleanField(default=False)
-    last_typing_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        db_table = 'chat_typing_status'
-        unique_together = ['user', 'chat_partner']
+        db_table = 'conversations'
+        db_table_comment = 'Denormalized private chat inbox, one row per user pair'
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='conversations_unique_pair'),
+            models.CheckConstraint(condition=models.Q(user_low__lt=models.F('user_high')), name='conversations_ordered_pair'),
+        ]
         indexes = [
-            models.Index(fields=['user', 'chat_partner']),
-            models.Index(fields=['last_typing_at']),
+            models.Index(fields=['user_low', '-last_message_at'], name='conversations_low_inbox_idx'),
+            models.Index(fields=['user_high', '-last_message_at'], name='conversations_high_inbox_idx'),
         ]
 
     def __str__(self):
-        return f"{self.user.username} typing to {self.chat_partner.username}: {self.is_typing}"
+        return f"Conversation {self.user_low_id} / {self.user_high_id}"
+
+
+class MediaUpload(models.Model):
+    """
+    A chat attachment being uploaded to object storage in parts
+
+    Created when the client starts an upload; completing it assembles the
+    object and creates the Chats row. Uploads never completed are aborted by
+    the scheduler after MEDIA_UPLOAD_TTL_HOURS.
+    """
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('COMPLETED', 'Completed'),
+        ('ABORTED', 'Aborted'),
+    )
+
+    upload_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    sender = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, related_name='media_uploads')
+    receiver = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, related_name='+')
+    message_type = models.CharField(max_length=20, choices=Chats.MESSAGE_TYPE_CHOICES)
+    filename = models.CharField(max_length=255, db_comment='Original filename')
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    size = models.BigIntegerField(db_comment='Size in bytes declared when the upload started')
+    object_key = models.CharField(max_length=500, db_comment='Key of the object in the media bucket')
+    storage_upload_id = models.CharField(max_length=255, db_comment='Multipart upload ID issued by object storage')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    chat = models.OneToOneField(
+        Chats,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+',
+        db_comment='Message created when the upload completed'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'chat_media_uploads'
+        db_table_comment = 'Multipart uploads of chat attachments in progress'
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(status='PENDING'), name='media_uploads_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} from {self.sender_id} ({self.status})"
+
 
 class MessageReaction(models.Model):
     REACTION_CHOICES = (
@@ -164,6 +285,14 @@ class MessageReaction(models.Model):
                       models.Q(chat__isnull=True, society_message__isnull=False),
                 name='one_message_type'
             ),
+            # One reaction per user per message, which reaction_counts relies on
+            models.UniqueConstraint(
+                fields=['user', 'chat'], condition=models.Q(chat__isnull=False), name='one_reaction_per_chat'
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'society_message'], condition=models.Q(society_message__isnull=False),
+                name='one_reaction_per_society_message'
+            ),
         ]
 
     def __str__(self):
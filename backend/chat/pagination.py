@@ -0,0 +1,83 @@
+import base64
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque cursor for a (timestamp, id) position"""
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor
+
+    Raises:
+        NotFound: If the cursor is malformed
+    """
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        timestamp = parse_datetime(timestamp)
+        if timestamp is None:
+            raise ValueError(cursor)
+        return timestamp, uuid.UUID(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise NotFound("Invalid cursor.")
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination of private messages over (created_at, chat_id)
+
+    Without a cursor the newest page is returned. ``before=<cursor>`` pages
+    towards older messages and ``after=<cursor>`` towards newer ones; either way
+    results are in chronological order and no OFFSET is used.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        size = self.get_page_size(request)
+        before = request.query_params.get('before')
+        after = request.query_params.get('after')
+
+        if after:
+            created_at, chat_id = decode_cursor(after)
+            rows = list(queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, chat_id__gt=chat_id)
+            ).order_by('created_at', 'chat_id')[:size + 1])
+            self.has_newer = len(rows) > size
+            self.has_older = True
+            self.rows = rows[:size]
+        else:
+            if before:
+                created_at, chat_id = decode_cursor(before)
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, chat_id__lt=chat_id)
+                )
+            rows = list(queryset.order_by('-created_at', '-chat_id')[:size + 1])
+            self.has_older = len(rows) > size
+            self.has_newer = bool(before)
+            self.rows = rows[:size][::-1]
+        return self.rows
+
+    def get_paginated_response(self, data):
+        first, last = (self.rows[0], self.rows[-1]) if self.rows else (None, None)
+        return Response({
+            'results': data,
+            'previous_cursor': encode_cursor(first.created_at, first.chat_id) if first and self.has_older else None,
+            'next_cursor': encode_cursor(last.created_at, last.chat_id) if last and self.has_newer else None,
+        })
@@ -0,0 +1,121 @@
+"""
+Reactions to private and society messages with per-message aggregate counts
+
+Each message keeps a ``reaction_counts`` JSON object of reaction type to count,
+adjusted in the same transaction as the reaction row by one UPDATE that adds
+the change to the stored counts. Message pages embed the counts and the
+caller's own reaction, found with one query per page, instead of every
+reaction row.
+"""
+import json
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import Chats, MessageReaction
+
+
+def _target_filter(target):
+    return {'chat': target} if isinstance(target, Chats) else {'society_message': target}
+
+
+def _adjust_counts(target, deltas):
+    """Add ``deltas`` (reaction type to +/-1) to the target's counts in one statement; types at zero are dropped"""
+    table, pk_column = (('chats', 'chat_id') if isinstance(target, Chats) else ('society_messages', 'message_id'))
+    # Reactions change what delta sync returns for a private message
+    touch = ', updated_at = %s' if isinstance(target, Chats) else ''
+    params = [json.dumps(deltas)] + ([timezone.now()] if touch else []) + [target.pk]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} SET reaction_counts = (
+                SELECT COALESCE(jsonb_object_agg(key, total), '{{}}'::jsonb)
+                FROM (
+                    SELECT key, SUM(value::int) AS total
+                    FROM (
+                        SELECT key, value FROM jsonb_each_text({table}.reaction_counts)
+                        UNION ALL
+                        SELECT key, value FROM jsonb_each_text(%s::jsonb)
+                    ) AS changes
+                    GROUP BY key
+                    HAVING SUM(value::int) > 0
+                ) AS counts
+            ){touch}
+            WHERE {pk_column} = %s
+            RETURNING reaction_counts
+            """,
+            params
+        )
+        row = cursor.fetchone()
+    counts = row[0] if row else {}
+    # psycopg2 returns jsonb already decoded
+    target.reaction_counts = json.loads(counts) if isinstance(counts, str) else counts
+    return target.reaction_counts
+
+
+def react(user, target, reaction_type):
+    """
+    Set ``user``'s reaction to a Chats or SocietyMessage ``target``
+
+    A user has at most one reaction per message; reacting again with another
+    type replaces it. ``target.reaction_counts`` is refreshed.
+
+    Returns:
+        tuple: The MessageReaction and whether it was newly created
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                reaction = MessageReaction.objects.select_for_update().filter(
+                    user=user, **_target_filter(target)
+                ).first()
+                if reaction is None:
+                    reaction = MessageReaction.objects.create(
+                        user=user, reaction_type=reaction_type, **_target_filter(target)
+                    )
+                    _adjust_counts(target, {reaction_type: 1})
+                    return reaction, True
+                if reaction.reaction_type != reaction_type:
+                    _adjust_counts(target, {reaction.reaction_type: -1, reaction_type: 1})
+                    reaction.reaction_type = reaction_type
+                    reaction.save(update_fields=['reaction_type'])
+                return reaction, False
+        except IntegrityError:
+            # A concurrent request created the user's reaction first; update that one instead
+            if attempt:
+                raise
+
+
+@transaction.atomic
+def unreact(user, target):
+    """
+    Remove ``user``'s reaction to ``target``
+
+    Returns:
+        bool: Whether there was a reaction to remove
+    """
+    reaction = MessageReaction.objects.select_for_update().filter(user=user, **_target_filter(target)).first()
+    if reaction is None:
+        return False
+    reaction.delete()
+    _adjust_counts(target, {reaction.reaction_type: -1})
+    return True
+
+
+def own_reactions(user, messages):
+    """
+    The reaction ``user`` left on each of a page of messages, in one query
+
+    Args:
+        messages: Chats or SocietyMessages, all of the same model
+
+    Returns:
+        dict: Message primary key to reaction type, for the messages the user reacted to
+    """
+    messages = [message for message in messages if message is not None]
+    if not messages or not getattr(user, 'is_authenticated', False):
+        return {}
+    field = 'chat_id' if isinstance(messages[0], Chats) else 'society_message_id'
+    return dict(MessageReaction.objects.filter(
+        user=user, **{f'{field}__in': [message.pk for message in messages]}
+    ).values_list(field, 'reaction_type'))
@@ -0,0 +1,94 @@
+"""
+Read receipts and delivery acknowledgements up to a watermark
+
+Clients acknowledge everything a partner sent up to the newest message they
+have seen, instead of one message per call. Each acknowledgement is a single
+UPDATE over the pair's messages, one change to the conversation's unread
+counter and one receipt event to the partner.
+"""
+import uuid
+
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from backend.utils.websocket import push_user_events
+from .conversations import record_read
+from .models import Chats
+
+# Statuses each acknowledgement moves forward from
+RECEIPT_STATUSES = {
+    'DELIVERED': ('SENT',),
+    'READ': ('SENT', 'DELIVERED'),
+}
+
+
+def parse_receipt(data):
+    """
+    The (status, up_to) of a receipt request body or websocket payload
+
+    Raises:
+        ValueError: If the status or message ID is invalid
+    """
+    receipt_status = data.get('status', 'READ')
+    if receipt_status not in RECEIPT_STATUSES:
+        raise ValueError(f"Invalid status. Must be one of: {list(RECEIPT_STATUSES)}")
+    up_to = data.get('up_to')
+    if not up_to:
+        return receipt_status, None
+    try:
+        return receipt_status, uuid.UUID(str(up_to))
+    except ValueError:
+        raise ValueError("Invalid message ID.")
+
+
+def receipt_event(reader_id, receipt_status, watermark, count, at):
+    return {
+        'type': 'message_receipt',
+        'user_id': str(reader_id),
+        'status': receipt_status,
+        'up_to': watermark.isoformat(),
+        'count': count,
+        'at': at.isoformat(),
+    }
+
+
+def acknowledge_messages(reader_id, partner_id, receipt_status, up_to=None):
+    """
+    Mark messages from ``partner_id`` to ``reader_id`` delivered or read up to a watermark
+
+    Args:
+        receipt_status: 'DELIVERED' or 'READ'
+        up_to: chat_id of the newest message acknowledged; everything sent so far if None
+
+    Returns:
+        int: Number of messages whose status changed
+
+    Raises:
+        Chats.DoesNotExist: If ``up_to`` is not a message from the partner to the reader
+    """
+    statuses = RECEIPT_STATUSES[receipt_status]
+    now = timezone.now()
+    with transaction.atomic():
+        if up_to:
+            watermark = Chats.objects.values_list('created_at', flat=True).get(
+                chat_id=up_to, sender_id=partner_id, receiver_id=reader_id
+            )
+        else:
+            watermark = now
+
+        fields = {'status': receipt_status, 'updated_at': now, 'delivered_at': Coalesce('delivered_at', Value(now))}
+        if receipt_status == 'READ':
+            fields['read_at'] = now
+        count = Chats.objects.filter(
+            receiver_id=reader_id, sender_id=partner_id, created_at__lte=watermark, status__in=statuses
+        ).update(**fields)
+        if not count:
+            return 0
+
+        if receipt_status == 'READ':
+            record_read(reader_id, partner_id, count)
+        event = receipt_event(reader_id, receipt_status, watermark, count, now)
+        transaction.on_commit(lambda: push_user_events({partner_id: event}))
+    return count
@@ -0,0 +1,125 @@
+"""
+Full-text search over the caller's private and society messages
+
+Both tables carry a ``search_vector`` column behind a GIN index, kept current
+by SearchVectorMixin on create and edit. Each scope is one indexed query that
+is restricted to what the caller can read, ordered newest first and cut with a
+(created_at, id) keyset, so pages never need an OFFSET. Snippets come from
+ts_headline, which only runs on the rows of the returned page.
+"""
+from django.contrib.postgres.search import SearchHeadline, SearchQuery
+from django.db.models import Q
+
+from backend.discussions.models import SocietyMember, SocietyMessage
+from backend.utils.search import SEARCH_CONFIG
+from .conversations import hidden_by_deletion
+from .models import Chats
+from .pagination import decode_cursor, encode_cursor
+
+SEARCH_SCOPES = ('all', 'private', 'society')
+# Society messages in these states are no longer shown to members
+HIDDEN_SOCIETY_STATUSES = ('DELETED', 'FLAGGED')
+
+
+def _headline(query):
+    return SearchHeadline(
+        'content', query, config=SEARCH_CONFIG,
+        start_sel='<mark>', stop_sel='</mark>', max_fragments=2
+    )
+
+
+def _before(cursor, pk_name):
+    if not cursor:
+        return Q()
+    created_at, row_id = cursor
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, **{f'{pk_name}__lt': row_id})
+
+
+def private_matches(user, query):
+    """Matching private messages that ``user`` sent or received and has not deleted"""
+    # Messages older than the user's deletion watermark of the conversation stay hidden
+    return Chats.objects.filter(
+        Q(sender=user, is_deleted_by_sender=False) | Q(receiver=user, is_deleted_by_receiver=False),
+        search_vector=query
+    ).exclude(hidden_by_deletion(user))
+
+
+def society_matches(user, query):
+    """Matching messages of the societies ``user`` is an active member of"""
+    return SocietyMessage.objects.filter(
+        society__in=SocietyMember.objects.filter(user=user, status='ACTIVE').values('society_id'),
+        search_vector=query
+    ).exclude(status__in=HIDDEN_SOCIETY_STATUSES)
+
+
+def search_messages(user, text, scope='all', cursor=None, size=20):
+    """
+    Search ``user``'s messages, newest first
+
+    Args:
+        text: Search terms in web search syntax (quoted phrases, ``or``, ``-term``)
+        scope: 'all', 'private' or 'society'
+        cursor: ``next_cursor`` of the previous page
+        size: Page size
+
+    Returns:
+        dict: The page's results and the cursor of the next page, or None
+
+    Raises:
+        rest_framework.exceptions.NotFound: If the cursor is malformed
+    """
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    position = decode_cursor(cursor) if cursor else None
+
+    rows = []
+    if scope in ('all', 'private'):
+        chats = private_matches(user, query).filter(_before(position, 'chat_id')).annotate(
+            headline=_headline(query)
+        ).select_related('sender', 'receiver').order_by('-created_at', '-chat_id')[:size + 1]
+        rows += [(chat.created_at, chat.chat_id, _private_result(user, chat)) for chat in chats]
+    if scope in ('all', 'society'):
+        messages = society_matches(user, query).filter(_before(position, 'message_id')).annotate(
+            headline=_headline(query)
+        ).select_related('user', 'society').order_by('-created_at', '-message_id')[:size + 1]
+        rows += [(message.created_at, message.message_id, _society_result(message)) for message in messages]
+
+    # Each scope is already in keyset order, so merging keeps the page consistent across them
+    rows.sort(key=lambda row: (row[0], row[1]), reverse=True)
+    page = rows[:size]
+    return {
+        'results': [result for _, _, result in page],
+        'next_cursor': encode_cursor(page[-1][0], page[-1][1]) if len(rows) > size else None,
+    }
+
+
+def _user(user):
+    if user is None:
+        return None
+    return {
+        'user_id': str(user.user_id),
+        'username': user.username,
+        'profile_picture': user.profile_picture if user.profile_picture else None,
+    }
+
+
+def _private_result(user, chat):
+    partner = chat.receiver if chat.sender_id == user.user_id else chat.sender
+    return {
+        'type': 'private',
+        'message_id': str(chat.chat_id),
+        'sender': _user(chat.sender),
+        'partner': _user(partner),
+        'headline': chat.headline,
+        'created_at': chat.created_at,
+    }
+
+
+def _society_result(message):
+    return {
+        'type': 'society',
+        'message_id': str(message.message_id),
+        'sender': _user(message.user),
+        'society': {'society_id': str(message.society.society_id), 'name': message.society.name},
+        'headline': message.headline,
+        'created_at': message.created_at,
+    }
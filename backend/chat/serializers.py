@@ -1,10 +1,15 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from backend.discussions.models import Society, SocietyMember, SocietyMessage
 from backend.users.models import CustomUser
 from backend.library.models import Book
 from backend.swaps.models import Notification, Exchange
 from backend.utils.websocket import send_notification_to_user
+from .media import MEDIA_MESSAGE_TYPES, store_media_file
+from .messages import clean_content, create_chat_message, create_society_message
 from .models import Chats, MessageReaction
+from .reactions import react
 import bleach
 from markdown import markdown
 from uuid import UUID
@@ -22,22 +27,24 @@ class BookMiniSerializer(serializers.ModelSerializer):
 class MessageReactionSerializer(serializers.ModelSerializer):
     user = UserMiniSerializer(read_only=True)
     reaction_type = serializers.ChoiceField(choices=MessageReaction.REACTION_CHOICES)
+    message_id = serializers.SerializerMethodField()
 
     class Meta:
         model = MessageReaction
-        fields = ['reaction_id', 'user', 'reaction_type', 'created_at']
+        fields = ['reaction_id', 'user', 'reaction_type', 'message_id', 'created_at']
         read_only_fields = ['reaction_id', 'created_at']
 
+    def get_message_id(self, obj):
+        return str(obj.chat_id or obj.society_message_id)
+
     def create(self, validated_data):
         chat = self.context.get('chat')
         society_message = self.context.get('society_message')
         user = self.context['user']
-        reaction = MessageReaction.objects.create(
-            user=user,
-            chat=chat,
-            society_message=society_message,
-            **validated_data
-        )
+        # Updates the message's reaction_counts in the same transaction
+        reaction, created = react(user, chat or society_message, validated_data['reaction_type'])
+        if not created:
+            return reaction
         target_user = chat.sender if chat else society_message.user
         notification = Notification.objects.create(
             user=target_user,
@@ -59,6 +66,8 @@ class MessageReactionSerializer(serializers.ModelSerializer):
             }
         )
         return reaction
+
+
 class ChatSerializer(serializers.ModelSerializer):
     sender = UserMiniSerializer(read_only=True)
     receiver = UserMiniSerializer(read_only=True)
@@ -67,7 +76,7 @@ class ChatSerializer(serializers.ModelSerializer):
     content = serializers.CharField(required=False, allow_blank=True)
     book_id = serializers.UUIDField(write_only=True, required=False, allow_null=True)
     can_note = serializers.SerializerMethodField()
-    reactions = MessageReactionSerializer(many=True, read_only=True)
+    my_reaction = serializers.SerializerMethodField()
 
     # Add time formatting
     sent_at_formatted = serializers.SerializerMethodField()
@@ -79,19 +88,31 @@ class ChatSerializer(serializers.ModelSerializer):
         fields = [
             'chat_id', 'sender', 'receiver', 'content', 'message_type', 'status',
             'book', 'media_url', 'media_thumbnail', 'media_duration', 'media_size',
-            'media_filename', 'sent_at', 'delivered_at', 'read_at', 'created_at',
-            'edited_at', 'receiver_id', 'book_id', 'can_note', 'reactions',
+            'media_filename', 'media_waveform', 'sent_at', 'delivered_at', 'read_at', 'created_at',
+            'edited_at', 'receiver_id', 'book_id', 'can_note', 'reaction_counts', 'my_reaction',
             'sent_at_formatted', 'delivered_at_formatted', 'read_at_formatted'
         ]
         read_only_fields = [
             'chat_id', 'status', 'sent_at', 'delivered_at', 'read_at',
-            'created_at', 'edited_at', 'reactions', 'media_url', 'media_thumbnail',
-            'media_duration', 'media_size', 'media_filename'
+            'created_at', 'edited_at', 'reaction_counts', 'media_url', 'media_thumbnail',
+            'media_duration', 'media_size', 'media_filename', 'media_waveform'
         ]
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.context.get('preview'):
+            # Inbox previews show the thumbnail; the media itself is fetched with the conversation
+            data.pop('media_url')
+            data.pop('media_waveform')
+        return data
+
     def get_can_note(self, obj):
         return True  # Frontend triggers new message
 
+    def get_my_reaction(self, obj):
+        # Views load the caller's reactions for the whole page, see reactions.own_reactions
+        return self.context.get('own_reactions', {}).get(obj.chat_id)
+
     def get_sent_at_formatted(self, obj):
         return obj.sent_at.strftime('%H:%M') if obj.sent_at else None
 
@@ -104,12 +125,7 @@ class ChatSerializer(serializers.ModelSerializer):
     def validate_content(self, value):
         if not value or not value.strip():
             raise serializers.ValidationError("Message content cannot be empty.")
-        return bleach.clean(
-            markdown(value),
-            tags=['p', 'strong', 'em', 'a', 'code'],
-            attributes={'a': ['href']},
-            protocols=['https']
-        )
+        return clean_content(value)
 
     def validate_receiver_id(self, value):
         if not CustomUser.objects.filter(user_id=value).exists():
@@ -125,42 +141,11 @@ class ChatSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        sender = self.context['sender']
         receiver = CustomUser.objects.get(user_id=validated_data.pop('receiver_id'))
-        book_id = validated_data.pop('book_id', None)
-        book = Book.objects.get(book_id=book_id) if book_id else None
-
-        chat = Chats.objects.create(
-            sender=sender,
-            receiver=receiver,
-            book=book,
-            status='SENT',
-            **validated_data
-        )
-
-        # Create notification
-        notification = Notification.objects.create(
-            user=receiver,
-            type='message_received',
-            message=f"{sender.username} sent you a message.",
-            content_type='chat',
-            content_id=chat.chat_id
+        return create_chat_message(
+            self.context['sender'], receiver, validated_data.pop('content', None), **validated_data
         )
 
-        # Send notification via WebSocket
-        send_notification_to_user(
-            receiver.user_id,
-            {
-                "notification_id": str(notification.notification_id),
-                "message": f"{sender.username} sent you a message.",
-                "type": "message_received",
-                "content_type": "chat",
-                "content_id": str(chat.chat_id),
-                "follow_id": None
-            }
-        )
-        return chat
-
     def update(self, instance, validated_data):
         instance.content = validated_data.get('content', instance.content)
         instance.save()
@@ -179,60 +164,41 @@ class MediaMessageSerializer(serializers.ModelSerializer):
         ]
 
     def validate_message_type(self, value):
-        allowed_types = ['IMAGE', 'AUDIO', 'VIDEO', 'VOICE_NOTE', 'FILE']
-        if value not in allowed_types:
-            raise serializers.ValidationError(f"Invalid message type. Must be one of: {allowed_types}")
+        if value not in MEDIA_MESSAGE_TYPES:
+            raise serializers.ValidationError(f"Invalid message type. Must be one of: {list(MEDIA_MESSAGE_TYPES)}")
         return value
 
     def validate_media_file(self, value):
-        # Add file size and type validation
-        max_size = 10 * 1024 * 1024  # 10MB
-        if value.size > max_size:
-            raise serializers.ValidationError("File size cannot exceed 10MB.")
+        if value.size > settings.MEDIA_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"File size cannot exceed {settings.MEDIA_UPLOAD_MAX_SIZE // (1024 * 1024)}MB."
+            )
         return value
 
     def create(self, validated_data):
-        sender = self.context['sender']
-        receiver = CustomUser.objects.get(user_id=validated_data.pop('receiver_id'))
-        media_file = validated_data.pop('media_file')
-
-        # Handle file upload to storage (MinIO/S3)
-        # This would typically involve uploading the file and getting the URL
-        # For now, we'll create a placeholder
-
-        chat = Chats.objects.create(
-            sender=sender,
-            receiver=receiver,
-            status='SENT',
-            media_url=f"media/{media_file.name}",  # Placeholder
-            media_filename=media_file.name,
-            media_size=media_file.size,
-            **validated_data
+        receiver = CustomUser.objects.get(user_id=validated_data['receiver_id'])
+        # Streamed to object storage in parts; the request's temporary file is never read whole
+        return store_media_file(
+            self.context['sender'], receiver, validated_data['message_type'],
+            validated_data['media_file'], validated_data.get('content')
         )
 
-        # Create notification
-        notification = Notification.objects.create(
-            user=receiver,
-            type='message_received',
-            message=f"{sender.username} sent you a media message.",
-            content_type='chat',
-            content_id=chat.chat_id
-        )
 
-        # Send notification via WebSocket
-        send_notification_to_user(
-            receiver.user_id,
-            {
-                "notification_id": str(notification.notification_id),
-                "message": f"{sender.username} sent you a media message.",
-                "type": "message_received",
-                "content_type": "chat",
-                "content_id": str(chat.chat_id),
-                "follow_id": None
-            }
-        )
-        return chat
-    
+class MediaUploadSerializer(serializers.Serializer):
+    """Start of a multipart attachment upload"""
+    receiver_id = serializers.UUIDField()
+    message_type = serializers.ChoiceField(choices=MEDIA_MESSAGE_TYPES)
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    size = serializers.IntegerField(min_value=1)
+
+    def validate_size(self, value):
+        if value > settings.MEDIA_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"File size cannot exceed {settings.MEDIA_UPLOAD_MAX_SIZE // (1024 * 1024)}MB."
+            )
+        return value
+
 class ChatReadStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = Chats
@@ -293,27 +259,26 @@ class SocietyMessageSerializer(serializers.ModelSerializer):
     society = serializers.UUIDField(source='society.society_id', read_only=True)
     book_id = serializers.UUIDField(write_only=True, required=False, allow_null=True)
     can_note = serializers.SerializerMethodField()
-    reactions = MessageReactionSerializer(many=True, read_only=True)
+    my_reaction = serializers.SerializerMethodField()
 
     class Meta:
         model = SocietyMessage
         fields = [
             'message_id', 'society', 'user', 'content', 'book',
-            'is_pinned', 'created_at', 'edited_at', 'book_id', 'can_note', 'reactions'
+            'is_pinned', 'created_at', 'edited_at', 'book_id', 'can_note', 'reaction_counts', 'my_reaction'
         ]
+        read_only_fields = ['reaction_counts']
 
     def get_can_note(self, obj):
         return True  # Frontend triggers new message
 
+    def get_my_reaction(self, obj):
+        return self.context.get('own_reactions', {}).get(obj.message_id)
+
     def validate_content(self, value):
         if not value.strip():
             raise serializers.ValidationError("Message content cannot be empty.")
-        return bleach.clean(
-            markdown(value),
-            tags=['p', 'strong', 'em', 'a', 'code'],
-            attributes={'a': ['href']},
-            protocols=['https']
-        )
+        return clean_content(value)
 
     def validate_book_id(self, value):
         if value and not Book.objects.filter(book_id=value).exists():
@@ -321,39 +286,10 @@ class SocietyMessageSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        society = Society.objects.get(society_id=self.context['society_id'])
-        user = self.context['user']
-        book_id = validated_data.pop('book_id', None)
-        book = Book.objects.get(book_id=book_id) if book_id else None
-
-        message = SocietyMessage.objects.create(
-            society=society,
-            user=user,
-            book=book,
-            **validated_data
-        )
-        members = SocietyMember.objects.filter(society=society, status='ACTIVE').exclude(user=user)
-        for member in members:
-            notification = Notification.objects.create(
-                user=member.user,
-                type='society_message',
-                message=f"{user.username} posted in {society.name}.",
-                content_type='society_message',
-                content_id=message.message_id
-            )
-            # Send notification via WebSocket to the member's group
-            send_notification_to_user(
-                member.user.user_id,
-                {
-                    "notification_id": str(notification.notification_id),
-                    "message": f"{user.username} posted in {society.name}.",
-                    "type": "society_message",
-                    "content_type": "society_message",
-                    "content_id": str(message.message_id),
-                    "follow_id": None
-                }
-            )
-        return message
+        # Views pass the society and user to save(); older callers put them in the context
+        society = validated_data.pop('society', None) or Society.objects.get(society_id=self.context['society_id'])
+        user = validated_data.pop('user', None) or self.context['user']
+        return create_society_message(society, user, validated_data.pop('content'), **validated_data)
 
     def update(self, instance, validated_data):
         instance.content = validated_data.get('content', instance.content)
@@ -0,0 +1,143 @@
+"""
+Fan-out-on-read for society messages
+
+Posting a message stores it once, advances the society's ``message_seq`` and
+sends a single event to the ``society_<id>`` group that connected members'
+sockets have joined. Nothing is written per member. Unread badges are the
+distance between the society's sequence and each member's read watermark, and
+members who stay away get a periodic digest notification instead of one
+notification per message.
+"""
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from backend.discussions.models import Society, SocietyMember
+from backend.utils.websocket import queue_notifications
+
+# Only societies with a message in this window are considered for digests
+DIGEST_LOOKBACK = timedelta(days=7)
+
+
+def record_society_message(message):
+    """
+    Advance the society's sequence for ``message`` and broadcast it after commit
+
+    The poster has read their own message, so their watermark moves with it.
+    """
+    now = timezone.now()
+    Society.objects.filter(society_id=message.society_id).update(
+        message_seq=F('message_seq') + 1, last_message_at=message.created_at
+    )
+    SocietyMember.objects.filter(society_id=message.society_id, user_id=message.user_id).update(
+        last_read_seq=Subquery(Society.objects.filter(society_id=OuterRef('society_id')).values('message_seq')[:1]),
+        last_read_at=now
+    )
+    transaction.on_commit(lambda: broadcast_society_message(message))
+
+
+def broadcast_society_message(message):
+    """Send ``message`` to every socket in the society's group with one group_send"""
+    from .serializers import SocietyMessageSerializer
+
+    async_to_sync(get_channel_layer().group_send)(
+        f"society_{message.society_id}",
+        {'type': 'society_message', 'message': SocietyMessageSerializer(message).data}
+    )
+
+
+def mark_society_read(society_id, user_id):
+    """
+    Move the member's read watermark to the society's latest message
+
+    Returns:
+        bool: Whether ``user_id`` is an active member of the society
+    """
+    return bool(SocietyMember.objects.filter(society_id=society_id, user_id=user_id, status='ACTIVE').update(
+        last_read_seq=Subquery(Society.objects.filter(society_id=OuterRef('society_id')).values('message_seq')[:1]),
+        last_read_at=timezone.now()
+    ))
+
+
+def society_unread_counts(user_id):
+    """
+    Unread message counts of every society ``user_id`` is an active member of, in one query
+
+    Returns:
+        dict: society_id to the number of messages posted since the member last read it
+    """
+    return {
+        society_id: max(message_seq - last_read_seq, 0)
+        for society_id, message_seq, last_read_seq in SocietyMember.objects.filter(
+            user_id=user_id, status='ACTIVE'
+        ).values_list('society_id', 'society__message_seq', 'last_read_seq')
+    }
+
+
+def send_society_digests(now=None, batch_size=500):
+    """
+    Notify members of the messages they missed, once per SOCIETY_DIGEST_INTERVAL_MINUTES
+
+    A member gets a digest when messages arrived since their last read and
+    since their last digest, and neither reading nor a digest happened within
+    the interval, so members who follow the society live are never notified.
+
+    Returns:
+        int: Number of digests sent
+    """
+    from backend.swaps.models import Notification
+
+    now = now or timezone.now()
+    cutoff = now - timedelta(minutes=settings.SOCIETY_DIGEST_INTERVAL_MINUTES)
+    total = 0
+    while True:
+        with transaction.atomic():
+            members = list(
+                SocietyMember.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(
+                    status='ACTIVE',
+                    society__status='ACTIVE',
+                    society__last_message_at__gte=now - DIGEST_LOOKBACK,
+                    last_read_seq__lt=F('society__message_seq'),
+                    digest_seq__lt=F('society__message_seq'),
+                )
+                # GREATEST skips NULLs, so this is the latest of the three
+                .alias(quiet_since=Greatest('digested_at', 'last_read_at', 'joined_at'))
+                .filter(quiet_since__lte=cutoff)
+                .select_related('society')
+                .order_by()[:batch_size]
+            )
+            notifications = []
+            for member in members:
+                unread = member.society.message_seq - member.last_read_seq
+                notifications.append(Notification(
+                    user_id=member.user_id,
+                    type='society_digest',
+                    message=f"{unread} new message{'s' if unread != 1 else ''} in {member.society.name}.",
+                    content_type='society',
+                    content_id=member.society_id
+                ))
+                member.digest_seq = member.society.message_seq
+                member.digested_at = now
+            Notification.objects.bulk_create(notifications)
+            queue_notifications([
+                (notification.user_id, {
+                    "notification_id": str(notification.notification_id),
+                    "message": notification.message,
+                    "type": notification.type,
+                    "content_type": notification.content_type,
+                    "content_id": str(notification.content_id),
+                    "follow_id": None
+                })
+                for notification in notifications
+            ])
+            SocietyMember.objects.bulk_update(members, ['digest_seq', 'digested_at'])
+        total += len(members)
+        if len(members) < batch_size:
+            return total
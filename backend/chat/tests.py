@@ -1,3 +1,840 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import struct
+import tempfile
+import uuid
+import wave
+from datetime import timedelta
+from io import BytesIO
+from unittest.mock import patch
 
-# Create your tests here.
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+
+from backend.discussions.models import Society, SocietyMember, SocietyMessage
+from backend.swaps.models import Notification, NotificationOutbox
+from backend.users.models import CustomUser, Follows
+from backend.utils.minio_storage import get_object_client
+from backend.utils.testing import clear_test_cache
+from .media import expire_media_uploads, store_media_file
+from .media_processing import process_pending_media
+from .messages import create_chat_message
+from .receipts import acknowledge_messages
+from .society_fanout import send_society_digests
+from .models import Chats, Conversation, MediaUpload, MessageReaction
+from .routing import websocket_urlpatterns
+from .serializers import ChatSerializer
+
+
+class ChatTestMixin:
+    def setUp(self):
+        clear_test_cache()
+        self.user = CustomUser.objects.create_user('gail', 'gail@example.com', 'pass12345')
+        self.client = APIClient()
+
+    def tearDown(self):
+        clear_test_cache()
+
+    def _partner(self, name):
+        partner = CustomUser.objects.create_user(name, f'{name}@example.com', 'pass12345')
+        Follows.objects.create(follower=self.user, followed=partner)
+        Follows.objects.create(follower=partner, followed=self.user)
+        return partner
+
+    def _send(self, sender, receiver, content='Hello'):
+        self.client.force_authenticate(sender)
+        response = self.client.post(
+            reverse('chat:send_message'), {'receiver_id': str(receiver.user_id), 'content': content}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data['chat_id']
+
+    def _inbox(self):
+        self.client.force_authenticate(self.user)
+        return self.client.get(reverse('chat:message_list')).data
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ConversationInboxTests(ChatTestMixin, TestCase):
+    def test_inbox_query_count_does_not_grow_with_partners(self):
+        partners = [self._partner(f'partner{i}') for i in range(2)]
+        for partner in partners:
+            self._send(partner, self.user)
+        # Conversations with partners and last messages, then reactions of those messages
+        with self.assertNumQueries(2):
+            self.assertEqual(self._inbox()['count'], 2)
+
+        partners += [self._partner(f'partner{i}') for i in range(2, 6)]
+        for partner in partners[2:]:
+            self._send(partner, self.user)
+        with self.assertNumQueries(2):
+            inbox = self._inbox()
+        self.assertEqual(inbox['count'], 6)
+        self.assertEqual(inbox['results'][0]['partner']['username'], 'partner5')
+
+    def test_unread_counts_last_message_and_deletion(self):
+        partner = self._partner('hank')
+        first = self._send(partner, self.user, 'One')
+        second = self._send(partner, self.user, 'Two')
+        reply = self._send(self.user, partner, 'Three')
+
+        conversation = self._inbox()['results'][0]
+        self.assertEqual(conversation['unread_count'], 2)
+        self.assertEqual(conversation['latest_message']['chat_id'], reply)
+
+        self.client.force_authenticate(self.user)
+        self.client.post(reverse('chat:mark_read', args=[first]))
+        # Marking the same message again does not decrement twice
+        self.client.post(reverse('chat:mark_read', args=[first]))
+        self.assertEqual(self._inbox()['results'][0]['unread_count'], 1)
+
+        self.client.delete(reverse('chat:delete_message', args=[reply]))
+        self.assertEqual(self._inbox()['results'][0]['latest_message']['chat_id'], second)
+
+        response = self.client.delete(reverse('chat:delete_conversation', args=[partner.user_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._inbox()['count'], 0)
+        history = self.client.get(reverse('chat:message_list'), {'receiver_id': str(partner.user_id)}).data
+        self.assertEqual(history['results'], [])
+
+        # The partner still sees the conversation, and a new message brings it back
+        self.client.force_authenticate(partner)
+        self.assertEqual(self.client.get(reverse('chat:message_list')).data['count'], 1)
+        self._send(partner, self.user, 'Four')
+        conversation = self._inbox()['results'][0]
+        self.assertEqual(conversation['unread_count'], 1)
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(Chats.objects.count(), 4)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    MESSAGE_SYNC_OVERLAP_SECONDS=0,
+)
+class MessageHistoryTests(ChatTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.partner = self._partner('ivy')
+        self.chat_ids = [
+            self._send(*((self.user, self.partner) if i % 2 else (self.partner, self.user)), content=f'Message {i}')
+            for i in range(7)
+        ]
+
+    def _history(self, **params):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(
+            reverse('chat:message_list'), {'receiver_id': str(self.partner.user_id), 'page_size': 3, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor_pages_in_both_directions(self):
+        newest = self._history()
+        self.assertEqual([m['chat_id'] for m in newest['results']], self.chat_ids[4:])
+        self.assertIsNone(newest['next_cursor'])
+
+        older = self._history(before=newest['previous_cursor'])
+        self.assertEqual([m['chat_id'] for m in older['results']], self.chat_ids[1:4])
+        oldest = self._history(before=older['previous_cursor'])
+        self.assertEqual([m['chat_id'] for m in oldest['results']], self.chat_ids[:1])
+        self.assertIsNone(oldest['previous_cursor'])
+
+        newer = self._history(after=oldest['next_cursor'])
+        self.assertEqual([m['chat_id'] for m in newer['results']], self.chat_ids[1:4])
+        self.assertEqual(self._history(after=newer['next_cursor'])['results'], newest['results'])
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(
+            reverse('chat:message_list'), {'receiver_id': str(self.partner.user_id), 'before': 'bogus'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_sync_returns_only_changes_since_watermark(self):
+        self.client.force_authenticate(self.user)
+        first = self.client.get(reverse('chat:message_sync'), {'since': timezone.now().isoformat()}).data
+        self.assertEqual(first['messages'], [])
+        self.assertFalse(first['has_more'])
+
+        edited, deleted = self.chat_ids[1], self.chat_ids[3]
+        self.client.patch(reverse('chat:edit_message', args=[edited]), {'content': 'Edited'}, format='json')
+        self.client.delete(reverse('chat:delete_message', args=[deleted]))
+        new = self._send(self.partner, self.user, 'New')
+
+        self.client.force_authenticate(self.user)
+        changes = self.client.get(reverse('chat:message_sync'), {'since': first['watermark']}).data
+        self.assertEqual([m['chat_id'] for m in changes['messages']], [edited, new])
+        self.assertEqual(changes['deleted'], [deleted])
+
+        caught_up = self.client.get(reverse('chat:message_sync'), {'since': changes['watermark']}).data
+        self.assertEqual((caught_up['messages'], caught_up['deleted']), ([], []))
+        self.assertEqual(caught_up['watermark'], changes['watermark'])
+
+    @override_settings(MESSAGE_SYNC_OVERLAP_SECONDS=60)
+    def test_sync_rescans_changes_that_commit_late(self):
+        self.client.force_authenticate(self.user)
+        since = (timezone.now() - timedelta(seconds=5)).isoformat()
+        first = self.client.get(reverse('chat:message_sync'), {'since': since}).data
+        self.assertEqual(len(first['messages']), 7)
+
+        # Stamped before the last sync's newest change, but committed after it
+        late = self._send(self.partner, self.user, 'Late')
+        Chats.objects.filter(chat_id=late).update(updated_at=timezone.now() - timedelta(seconds=10))
+
+        self.client.force_authenticate(self.user)
+        again = self.client.get(reverse('chat:message_sync'), {'since': first['watermark']}).data
+        chat_ids = [message['chat_id'] for message in again['messages']]
+        self.assertIn(late, chat_ids)
+        # Changes inside the overlap come back too; clients deduplicate them by chat_id
+        self.assertIn(self.chat_ids[-1], chat_ids)
+
+    def test_sync_respects_conversation_deletion(self):
+        self.client.force_authenticate(self.user)
+        first = self.client.get(reverse('chat:message_sync'), {'since': timezone.now().isoformat()}).data
+        self.client.delete(reverse('chat:delete_conversation', args=[self.partner.user_id]))
+
+        cleared = self.client.get(reverse('chat:message_sync'), {'since': first['watermark']}).data
+        self.assertEqual([c['partner_id'] for c in cleared['deleted_conversations']], [str(self.partner.user_id)])
+        caught_up = self.client.get(reverse('chat:message_sync'), {'since': cleared['watermark']}).data
+        self.assertEqual(caught_up['deleted_conversations'], [])
+
+        # A later change to a message from before the deletion does not bring it back
+        old = self.chat_ids[0]
+        self.client.force_authenticate(self.partner)
+        self.client.patch(reverse('chat:edit_message', args=[old]), {'content': 'Edited'}, format='json')
+        new = self._send(self.partner, self.user, 'After')
+
+        self.client.force_authenticate(self.user)
+        changes = self.client.get(reverse('chat:message_sync'), {'since': cleared['watermark']}).data
+        self.assertEqual([m['chat_id'] for m in changes['messages']], [new])
+        self.assertEqual(changes['deleted'], [old])
+        self.assertEqual(changes['deleted_conversations'], [])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class MessageSearchTests(ChatTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.partner = self._partner('jill')
+        self.stranger = CustomUser.objects.create_user('kurt', 'kurt@example.com', 'pass12345')
+
+    def _search(self, q, **params):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('chat:message_search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def _society(self, name, member_status='ACTIVE'):
+        society = Society.objects.create(name=name, creator=self.stranger)
+        SocietyMember.objects.create(society=society, user=self.user, status=member_status)
+        return society
+
+    def test_search_is_limited_to_own_conversations_and_memberships(self):
+        mine = self._send(self.partner, self.user, 'Have you read the Dune sequels?')
+        self._send(self.partner, self.user, 'Nothing relevant here')
+        other = self._partner('lena')
+        Chats.objects.create(sender=other, receiver=self.stranger, content='Dune is great')
+
+        joined = self._society('Spice readers')
+        left = self._society('Former club', member_status='REMOVED')
+        society_message = SocietyMessage.objects.create(society=joined, user=self.stranger, content='Dune night on Friday')
+        SocietyMessage.objects.create(society=left, user=self.stranger, content='Dune discussion')
+        SocietyMessage.objects.create(society=joined, user=self.stranger, content='Dune spoilers', status='DELETED')
+
+        results = self._search('dune')['results']
+        self.assertEqual(
+            [(r['type'], r['message_id']) for r in results],
+            [('society', str(society_message.message_id)), ('private', mine)]
+        )
+        self.assertIn('<mark>Dune</mark>', results[1]['headline'])
+        self.assertEqual(results[1]['partner']['username'], 'jill')
+        self.assertEqual([r['type'] for r in self._search('dune', scope='private')['results']], ['private'])
+
+        # Deleting the conversation hides its messages from search as well
+        self.client.delete(reverse('chat:delete_conversation', args=[self.partner.user_id]))
+        self.assertEqual([r['type'] for r in self._search('dune')['results']], ['society'])
+
+    def test_edit_updates_the_search_vector(self):
+        chat_id = self._send(self.user, self.partner, 'Lunch at noon')
+        self.client.patch(reverse('chat:edit_message', args=[chat_id]), {'content': 'Swap at the library'}, format='json')
+        self.assertEqual(self._search('lunch')['results'], [])
+        self.assertEqual([r['message_id'] for r in self._search('library')['results']], [chat_id])
+
+        society = self._society('Poets', member_status='ACTIVE')
+        message = SocietyMessage.objects.create(society=society, user=self.user, content='Haiku draft')
+        response = self.client.patch(
+            reverse('chat:edit_society_message', args=[society.society_id, message.message_id]),
+            {'content': 'Sonnet draft'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._search('haiku')['results'], [])
+        self.assertEqual(len(self._search('sonnet')['results']), 1)
+
+    def test_cursor_pages_through_both_scopes(self):
+        society = self._society('Readers')
+        expected = []
+        for i in range(25):
+            if i % 2:
+                expected.append(self._send(self.partner, self.user, f'Book swap {i}'))
+            else:
+                message = SocietyMessage.objects.create(society=society, user=self.stranger, content=f'Book swap {i}')
+                expected.append(str(message.message_id))
+
+        first = self._search('swap')
+        self.assertEqual(len(first['results']), 20)
+        second = self._search('swap', cursor=first['next_cursor'])
+        self.assertIsNone(second['next_cursor'])
+        found = [r['message_id'] for r in first['results'] + second['results']]
+        self.assertEqual(found, expected[::-1])
+
+    def test_rejects_empty_query_and_bad_scope(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('chat:message_search'), {'q': ' '}).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse('chat:message_search'), {'q': 'x', 'scope': 'everything'}).status_code, 400
+        )
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerTests(ChatTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.partner = self._partner('mona')
+        self.chat = Chats.objects.create(sender=self.partner, receiver=self.user, content='Hi')
+        self.society = Society.objects.create(name='Night readers', creator=self.partner)
+        SocietyMember.objects.create(society=self.society, user=self.user)
+
+    async def _connect(self, path, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope['user'] = user
+        connected, code = await communicator.connect()
+        return communicator, connected, code
+
+    async def _send(self, communicator, content):
+        await communicator.send_to(text_data=json.dumps({'action': 'send_message', 'content': content}))
+        return json.loads(await communicator.receive_from())
+
+    async def test_chat_consumer_sends_through_the_cached_partner(self):
+        communicator, connected, _ = await self._connect(f'/ws/chat/{self.chat.chat_id}/', self.user)
+        self.assertTrue(connected)
+        event = await self._send(communicator, '**Deal**')
+        self.assertEqual(event['type'], 'chat_message')
+        self.assertEqual(event['message']['content'], '<p><strong>Deal</strong></p>')
+        self.assertEqual(event['message']['receiver']['username'], 'mona')
+        self.assertIn('error', await self._send(communicator, '   '))
+        await communicator.disconnect()
+
+        stranger = await CustomUser.objects.acreate(username='nils', email='nils@example.com')
+        _, connected, code = await self._connect(f'/ws/chat/{self.chat.chat_id}/', stranger)
+        self.assertFalse(connected)
+        self.assertEqual(code, 4003)
+
+    async def test_society_consumer_rechecks_membership(self):
+        path = f'/ws/society/{self.society.society_id}/'
+        communicator, connected, _ = await self._connect(path, self.user)
+        self.assertTrue(connected)
+        event = await self._send(communicator, 'Hello club')
+        self.assertEqual(event['message']['society'], str(self.society.society_id))
+
+        await SocietyMember.objects.filter(user=self.user).aupdate(status='REMOVED')
+        with patch('backend.chat.consumers.MEMBERSHIP_RECHECK_SECONDS', 0):
+            await communicator.send_to(text_data=json.dumps({'action': 'send_message', 'content': 'Still here?'}))
+            self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': 4003})
+        self.assertEqual(await SocietyMessage.objects.acount(), 1)
+
+    async def test_chat_consumer_acknowledges_up_to_a_watermark(self):
+        layer = get_channel_layer()
+        partner_channel = await layer.new_channel()
+        await layer.group_add(f"user_{self.partner.user_id}", partner_channel)
+        later = await Chats.objects.acreate(sender=self.partner, receiver=self.user, content='Still there?')
+
+        communicator, _, _ = await self._connect(f'/ws/chat/{self.chat.chat_id}/', self.user)
+        await communicator.send_to(text_data=json.dumps({'action': 'receipt', 'status': 'DELIVERED'}))
+        event = await layer.receive(partner_channel)
+        self.assertEqual((event['type'], event['status'], event['count']), ('message_receipt', 'DELIVERED', 2))
+
+        await communicator.send_to(text_data=json.dumps({'action': 'receipt', 'up_to': str(self.chat.chat_id)}))
+        event = await layer.receive(partner_channel)
+        self.assertEqual((event['status'], event['count']), ('READ', 1))
+        await later.arefresh_from_db()
+        self.assertEqual(later.status, 'DELIVERED')
+
+        await communicator.send_to(text_data=json.dumps({'action': 'receipt', 'status': 'SEEN'}))
+        self.assertIn('error', json.loads(await communicator.receive_from()))
+        await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ReadReceiptTests(ChatTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.partner = self._partner('paula')
+        self.sent = [self._send(self.partner, self.user, f'Message {number}') for number in range(5)]
+        self.layer = get_channel_layer()
+        self.partner_channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f"user_{self.partner.user_id}", self.partner_channel)
+
+    def _receipt(self, **data):
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('chat:conversation_receipt', args=[self.partner.user_id]), data, format='json'
+            )
+
+    def test_read_up_to_a_watermark_in_one_update(self):
+        # Watermark lookup, the UPDATE and the unread counter, inside one savepoint
+        with self.assertNumQueries(5):
+            response = acknowledge_messages(self.user.user_id, self.partner.user_id, 'READ', self.sent[2])
+        self.assertEqual(response, 3)
+        statuses = dict(Chats.objects.values_list('chat_id', 'status'))
+        self.assertEqual([statuses[uuid.UUID(chat_id)] for chat_id in self.sent], ['READ'] * 3 + ['SENT'] * 2)
+        self.assertEqual(self._inbox()['results'][0]['unread_count'], 2)
+
+        response = self._receipt()
+        self.assertEqual(response.data, {'status': 'READ', 'count': 2})
+        event = async_to_sync(self.layer.receive)(self.partner_channel)
+        self.assertEqual((event['type'], event['user_id'], event['count']), ('message_receipt', str(self.user.user_id), 2))
+        self.assertEqual(self._inbox()['results'][0]['unread_count'], 0)
+
+        # Nothing left to acknowledge: no event
+        self.assertEqual(self._receipt().data['count'], 0)
+
+    def test_delivery_acknowledgements_do_not_touch_unread_counts(self):
+        self.assertEqual(self._receipt(status='DELIVERED', up_to=self.sent[-1]).data['count'], 5)
+        self.assertEqual(async_to_sync(self.layer.receive)(self.partner_channel)['status'], 'DELIVERED')
+        self.assertEqual(self._inbox()['results'][0]['unread_count'], 5)
+        self.assertFalse(Chats.objects.filter(delivered_at__isnull=True).exists())
+
+        self.assertEqual(self._receipt(status='READ').data['count'], 5)
+        self.assertEqual(self._inbox()['results'][0]['unread_count'], 0)
+
+    def test_invalid_receipts(self):
+        self.assertEqual(self._receipt(status='SEEN').status_code, 400)
+        self.assertEqual(self._receipt(up_to='not-an-id').status_code, 400)
+        # Only messages from the partner can be a watermark
+        own = self._send(self.user, self.partner, 'Mine')
+        self.assertEqual(self._receipt(up_to=own).status_code, 404)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    SOCIETY_DIGEST_INTERVAL_MINUTES=60,
+)
+class SocietyFanoutTests(ChatTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.society = Society.objects.create(name='Slow readers', creator=self.user)
+        SocietyMember.objects.create(society=self.society, user=self.user, role='admin')
+        self.reader = self._member('rhea')
+
+    def _member(self, name):
+        member = CustomUser.objects.create_user(name, f'{name}@example.com', 'pass12345')
+        SocietyMember.objects.create(society=self.society, user=member)
+        return member
+
+    def _post(self, content='Chapter one'):
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('chat:send_society_message', args=[self.society.society_id]), {'content': content}, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def _unread(self, user):
+        self.client.force_authenticate(user)
+        societies = self.client.get(reverse('chat:list_societies'), {'my_societies': 'true'}).data['results']
+        return societies[0]['unread_count']
+
+    def _post_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self._post()
+        return len(queries)
+
+    def test_posting_cost_does_not_depend_on_member_count(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f"society_{self.society.society_id}", channel)
+
+        few = self._post_queries()
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual((event['type'], event['message']['content']), ('society_message', '<p>Chapter one</p>'))
+
+        for number in range(30):
+            self._member(f'member{number}')
+        self.assertEqual(self._post_queries(), few)
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_unread_badges_follow_read_watermarks(self):
+        self._post()
+        self._post()
+        self.assertEqual(self._unread(self.reader), 2)
+        self.assertEqual(self._unread(self.user), 0)
+
+        latecomer = CustomUser.objects.create_user('sid', 'sid@example.com', 'pass12345')
+        self.client.force_authenticate(latecomer)
+        self.client.post(reverse('chat:join_society', args=[self.society.society_id]))
+        self.assertEqual(self._unread(latecomer), 0)
+
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(self.client.post(reverse('chat:mark_society_read', args=[self.society.society_id])).status_code, 200)
+        self.assertEqual(self._unread(self.reader), 0)
+        self._post()
+        self.assertEqual(self._unread(self.reader), 1)
+
+        self.client.force_authenticate(CustomUser.objects.create_user('ty', 'ty@example.com', 'pass12345'))
+        self.assertEqual(self.client.post(reverse('chat:mark_society_read', args=[self.society.society_id])).status_code, 403)
+
+    def test_absent_members_get_one_digest_per_interval(self):
+        live = self._member('lou')
+        SocietyMember.objects.filter(society=self.society).update(joined_at=timezone.now() - timedelta(days=1))
+        self._post()
+        self._post()
+        self.client.force_authenticate(live)
+        self.client.post(reverse('chat:mark_society_read', args=[self.society.society_id]))
+        self._post()
+
+        # The live reader read within the interval; only the absent member is notified
+        self.assertEqual(send_society_digests(), 1)
+        digest = Notification.objects.get()
+        self.assertEqual((digest.user, digest.message), (self.reader, '3 new messages in Slow readers.'))
+        self.assertEqual(NotificationOutbox.objects.filter(recipient_id=self.reader.user_id).count(), 1)
+        self.assertEqual(send_society_digests(), 0)
+
+        self._post()
+        self.assertEqual(send_society_digests(), 0)
+        later = timezone.now() + timedelta(minutes=61)
+        self.assertEqual(send_society_digests(now=later), 2)
+        self.assertEqual(Notification.objects.filter(user=self.reader).latest('created_at').message, '4 new messages in Slow readers.')
+
+    def test_reading_after_a_digest_stops_digests(self):
+        SocietyMember.objects.filter(society=self.society).update(joined_at=timezone.now() - timedelta(days=1))
+        self._post()
+        self.assertEqual(send_society_digests(), 1)
+        SocietyMember.objects.filter(user=self.reader).update(digested_at=timezone.now() - timedelta(hours=2))
+
+        # The member now follows the society live
+        self.client.force_authenticate(self.reader)
+        self.client.post(reverse('chat:mark_society_read', args=[self.society.society_id]))
+        self._post()
+        self.assertEqual(send_society_digests(), 0)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ReactionCountTests(ChatTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.partner = self._partner('rita')
+        self.chat_ids = [self._send(self.partner, self.user, f'Page {number}') for number in range(3)]
+
+    def _react(self, user, chat_id, reaction_type):
+        self.client.force_authenticate(user)
+        return self.client.post(reverse('chat:add_reaction', args=[chat_id]), {'reaction_type': reaction_type}, format='json')
+
+    def _history_queries(self):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get(
+                reverse('chat:message_list'), {'receiver_id': str(self.partner.user_id)}
+            ).data['results']
+        return len(queries), {message['chat_id']: message for message in results}
+
+    def test_counts_follow_adds_changes_and_removals(self):
+        response = self._react(self.user, self.chat_ids[0], 'LOVE')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['reaction_counts'], {'LOVE': 1})
+        self.assertEqual(self._react(self.partner, self.chat_ids[0], 'LOVE').data['reaction_counts'], {'LOVE': 2})
+
+        # Reacting again replaces the user's reaction
+        self.assertEqual(self._react(self.user, self.chat_ids[0], 'HAHA').data['reaction_counts'], {'LOVE': 1, 'HAHA': 1})
+        self.assertEqual(MessageReaction.objects.count(), 2)
+
+        self.client.force_authenticate(self.partner)
+        response = self.client.delete(reverse('chat:add_reaction', args=[self.chat_ids[0]]))
+        self.assertEqual(response.data['reaction_counts'], {'HAHA': 1})
+        self.assertEqual(self.client.delete(reverse('chat:add_reaction', args=[self.chat_ids[0]])).status_code, 404)
+        self.assertEqual(Chats.objects.get(chat_id=self.chat_ids[0]).reaction_counts, {'HAHA': 1})
+
+        self.assertEqual(self._react(self.user, self.chat_ids[0], 'MEH').status_code, 400)
+        stranger = CustomUser.objects.create_user('stan', 'stan@example.com', 'pass12345')
+        self.assertEqual(self._react(stranger, self.chat_ids[0], 'LIKE').status_code, 404)
+
+    def test_message_pages_take_the_same_queries_regardless_of_reactions(self):
+        baseline, _ = self._history_queries()
+        for chat_id in self.chat_ids:
+            self._react(self.user, chat_id, 'LIKE')
+            self._react(self.partner, chat_id, 'WOW')
+
+        queries, messages = self._history_queries()
+        self.assertEqual(queries, baseline)
+        first = messages[self.chat_ids[0]]
+        self.assertEqual((first['reaction_counts'], first['my_reaction']), ({'LIKE': 1, 'WOW': 1}, 'LIKE'))
+        self.assertNotIn('reactions', first)
+
+        self.client.force_authenticate(self.user)
+        who = self.client.get(reverse('chat:list_reactions', args=[self.chat_ids[0]])).data
+        self.assertEqual(sorted(reaction['user']['username'] for reaction in who), ['gail', 'rita'])
+
+    def test_society_message_reactions(self):
+        society = Society.objects.create(name='Poets', creator=self.user)
+        SocietyMember.objects.create(society=society, user=self.user, role='admin')
+        SocietyMember.objects.create(society=society, user=self.partner)
+        message = SocietyMessage.objects.create(society=society, user=self.partner, content='Stanza')
+        url = reverse('chat:add_society_reaction', args=[society.society_id, message.message_id])
+
+        self.client.force_authenticate(self.user)
+        response = self.client.post(url, {'reaction_type': 'SAD'}, format='json')
+        self.assertEqual((response.status_code, response.data['message_id']), (201, str(message.message_id)))
+        self.assertEqual(response.data['reaction_counts'], {'SAD': 1})
+
+        page = self.client.get(reverse('chat:society_messages', args=[society.society_id])).data['results']
+        self.assertEqual((page[0]['reaction_counts'], page[0]['my_reaction']), ({'SAD': 1}, 'SAD'))
+        self.assertEqual(len(self.client.get(
+            reverse('chat:list_society_reactions', args=[society.society_id, message.message_id])
+        ).data), 1)
+
+
+class LeanMessageInsertTests(ChatTestMixin, TestCase):
+    def test_insert_path_queries(self):
+        partner = self._partner('olga')
+        # Message, conversation upsert, notification and its outbox row, in one savepoint
+        with self.assertNumQueries(6):
+            chat = create_chat_message(self.user, partner, '<p>Lean</p>')
+            data = ChatSerializer(chat).data
+        self.assertEqual((data['reaction_counts'], data['my_reaction']), ({}, None))
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message_id, chat.chat_id)
+        self.assertEqual(conversation.low_unread_count + conversation.high_unread_count, 1)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+    MEDIA_UPLOAD_PART_SIZE=1024,
+    MEDIA_UPLOAD_MAX_SIZE=8 * 1024,
+)
+class MediaUploadTests(ChatTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.partner = self._partner('pete')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+    def _start(self, size, filename='notes.pdf'):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('chat:start_media_upload'), {
+            'receiver_id': str(self.partner.user_id), 'message_type': 'FILE',
+            'filename': filename, 'content_type': 'application/pdf', 'size': size,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def _put_part(self, part, body):
+        return self.client.generic('PUT', part['url'], body, content_type='application/octet-stream')
+
+    def _stored(self, media_url):
+        return os.path.join(self.media_root, media_url.removeprefix('/media/'))
+
+    def test_parts_streamed_through_the_server_are_assembled_into_a_message(self):
+        data = os.urandom(2500)
+        started = self._start(len(data))
+        self.assertEqual([part['part_number'] for part in started['parts']], [1, 2, 3])
+        self.assertFalse(started['parts'][0]['direct'])
+
+        # Parts may arrive in any order
+        for part in reversed(started['parts']):
+            offset = (part['part_number'] - 1) * started['part_size']
+            response = self._put_part(part, data[offset:offset + started['part_size']])
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.data['etag'])
+
+        response = self.client.post(
+            reverse('chat:complete_media_upload', args=[started['upload_id']]), {'content': 'Chapter 3'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['message_type'], response.data['content']), ('FILE', '<p>Chapter 3</p>'))
+        with open(self._stored(response.data['media_url']), 'rb') as stored:
+            self.assertEqual(stored.read(), data)
+
+        upload = MediaUpload.objects.get(upload_id=started['upload_id'])
+        self.assertEqual((upload.status, str(upload.chat_id)), ('COMPLETED', response.data['chat_id']))
+        self.assertEqual(Conversation.objects.get().last_message_id, upload.chat_id)
+
+        # Completing twice does not create a second message
+        response = self.client.post(reverse('chat:complete_media_upload', args=[started['upload_id']]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Chats.objects.count(), 1)
+
+    def test_incomplete_or_oversized_uploads_are_rejected(self):
+        started = self._start(2000)
+        self.assertEqual(self._put_part(started['parts'][0], b'').status_code, 400)
+        self.assertEqual(self._put_part(started['parts'][0], b'x' * 1025).status_code, 400)
+        self._put_part(started['parts'][0], b'x' * 1024)
+
+        response = self.client.post(reverse('chat:complete_media_upload', args=[started['upload_id']]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Chats.objects.exists())
+
+        response = self.client.post(reverse('chat:start_media_upload'), {
+            'receiver_id': str(self.partner.user_id), 'message_type': 'FILE', 'filename': 'big.bin', 'size': 9 * 1024,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_uploads_gone_from_storage(self):
+        data = os.urandom(1500)
+        assembled = self._start(len(data))
+        for part in assembled['parts']:
+            offset = (part['part_number'] - 1) * assembled['part_size']
+            self._put_part(part, data[offset:offset + assembled['part_size']])
+        # An earlier attempt assembled the object, then failed to record the message
+        upload = MediaUpload.objects.get(upload_id=assembled['upload_id'])
+        get_object_client().complete_multipart_upload(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=upload.object_key, UploadId=upload.storage_upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': 1}, {'PartNumber': 2}]}
+        )
+        response = self.client.post(reverse('chat:complete_media_upload', args=[assembled['upload_id']]))
+        self.assertEqual(response.status_code, 201)
+        with open(self._stored(response.data['media_url']), 'rb') as stored:
+            self.assertEqual(stored.read(), data)
+
+        expired = self._start(100)
+        upload = MediaUpload.objects.get(upload_id=expired['upload_id'])
+        get_object_client().abort_multipart_upload(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=upload.object_key, UploadId=upload.storage_upload_id
+        )
+        self.assertEqual(self._put_part(expired['parts'][0], b'x' * 100).status_code, 410)
+        self.assertEqual(MediaUpload.objects.get(upload_id=expired['upload_id']).status, 'ABORTED')
+
+        MediaUpload.objects.filter(upload_id=expired['upload_id']).update(status='PENDING')
+        response = self.client.post(reverse('chat:complete_media_upload', args=[expired['upload_id']]))
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(MediaUpload.objects.get(upload_id=expired['upload_id']).status, 'ABORTED')
+        self.assertEqual(Chats.objects.count(), 1)
+
+    def test_form_upload_is_stored(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('chat:send_media_message'), {
+            'receiver_id': str(self.partner.user_id), 'message_type': 'IMAGE',
+            'media_file': SimpleUploadedFile('cover.png', b'\x89PNG' * 700, content_type='image/png'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['media_size'], 2800)
+        self.assertEqual(os.path.getsize(self._stored(response.data['media_url'])), 2800)
+
+    def test_stale_uploads_are_aborted(self):
+        stale = self._start(100)
+        self._put_part(stale['parts'][0], b'x' * 100)
+        MediaUpload.objects.filter(upload_id=stale['upload_id']).update(
+            created_at=timezone.now() - timedelta(hours=25)
+        )
+        fresh = self._start(100)
+
+        self.assertEqual(expire_media_uploads(), 1)
+        self.assertEqual(MediaUpload.objects.get(upload_id=stale['upload_id']).status, 'ABORTED')
+        self.assertEqual(MediaUpload.objects.get(upload_id=fresh['upload_id']).status, 'PENDING')
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, '.multipart'))), 1)
+
+        response = self.client.delete(reverse('chat:media_upload', args=[fresh['upload_id']]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(os.listdir(os.path.join(self.media_root, '.multipart')))
+
+
+def _ogg_page(granule, body):
+    return b'OggS' + struct.pack('<BBqIIIB', 0, 0, granule, 1, 0, 0, 1) + bytes([len(body)]) + body
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+)
+class MediaProcessingTests(ChatTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.partner = self._partner('quentin')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+    def _media(self, message_type, name, data):
+        return store_media_file(self.user, self.partner, message_type, SimpleUploadedFile(name, data))
+
+    def _wav(self, seconds, rate=8000):
+        t = np.arange(seconds * rate) / rate
+        # Gets louder towards the end
+        samples = (np.sin(2 * np.pi * 440 * t) * 30000 * t / seconds).astype('<i2')
+        output = BytesIO()
+        with wave.open(output, 'wb') as audio:
+            audio.setnchannels(1)
+            audio.setsampwidth(2)
+            audio.setframerate(rate)
+            audio.writeframes(samples.tobytes())
+        return output.getvalue()
+
+    def test_previews_are_extracted_in_one_batch(self):
+        png = BytesIO()
+        Image.new('RGB', (1000, 500), 'teal').save(png, 'PNG')
+        image = self._media('IMAGE', 'cover.png', png.getvalue())
+        voice = self._media('VOICE_NOTE', 'note.wav', self._wav(2))
+        opus_head = b'OpusHead' + struct.pack('<BBHIhB', 1, 1, 312, 48000, 0, 0)
+        ogg = self._media('AUDIO', 'song.ogg', _ogg_page(0, opus_head) + _ogg_page(312 + 3 * 48000, b'\x00' * 8))
+        broken = self._media('IMAGE', 'broken.png', b'not an image')
+        document = self._media('FILE', 'notes.pdf', b'%PDF-1.4')
+
+        self.assertEqual(process_pending_media(batch_size=10), 5)
+        self.assertEqual(process_pending_media(batch_size=10), 0)
+
+        image.refresh_from_db()
+        with Image.open(os.path.join(self.media_root, image.media_thumbnail.removeprefix('/media/'))) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 160))
+        self.assertIsNotNone(image.media_processed_at)
+
+        voice.refresh_from_db()
+        self.assertEqual(voice.media_duration, 2)
+        self.assertEqual(len(voice.media_waveform), 64)
+        self.assertEqual(max(voice.media_waveform), 100)
+        self.assertLess(voice.media_waveform[0], voice.media_waveform[-1])
+
+        ogg.refresh_from_db()
+        self.assertEqual((ogg.media_duration, ogg.media_waveform), (3, None))
+
+        for chat in (broken, document):
+            chat.refresh_from_db()
+            self.assertIsNotNone(chat.media_processed_at)
+            self.assertIsNone(chat.media_thumbnail)
+
+    def test_inbox_previews_carry_only_the_thumbnail(self):
+        self._media('VOICE_NOTE', 'note.wav', self._wav(1))
+        process_pending_media()
+
+        latest = self._inbox()['results'][0]['latest_message']
+        self.assertEqual(latest['media_duration'], 1)
+        self.assertNotIn('media_url', latest)
+        self.assertNotIn('media_waveform', latest)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('chat:message_list'), {'receiver_id': str(self.partner.user_id)})
+        self.assertEqual(len(response.data['results'][0]['media_waveform']), 64)
@@ -1,9 +1,11 @@
 from django.urls import path
 from .views import (
-    SendMessageView, EditMessageView, DeleteMessageView, MessageListView, MarkReadView,
+    SendMessageView, EditMessageView, DeleteMessageView, DeleteConversationView, MessageListView, MessageSyncView, MessageSearchView, MarkReadView,
+    ConversationReceiptView,
     AddReactionView, ListReactionsView, CreateSocietyView, JoinSocietyView, LeaveSocietyView,
-    SocietyListView, SendSocietyMessageView, EditSocietyMessageView, DeleteSocietyMessageView,
-    SocietyMessageListView, PinMessageView, SendMediaMessageView, TypingStatusView
+    SocietyListView, SendSocietyMessageView, MarkSocietyReadView, EditSocietyMessageView, DeleteSocietyMessageView,
+    SocietyMessageListView, PinMessageView, SendMediaMessageView, StartMediaUploadView, MediaUploadView,
+    MediaUploadPartView, CompleteMediaUploadView, TypingStatusView
 )
 from backend.discussions.views import (
     CreateSocietyEventView, SocietyEventListView
@@ -14,18 +16,27 @@ app_name = 'chat'
 urlpatterns = [
     path('messages/send/', SendMessageView.as_view(), name='send_message'),
     path('messages/send-media/', SendMediaMessageView.as_view(), name='send_media_message'),
+    path('messages/media/uploads/', StartMediaUploadView.as_view(), name='start_media_upload'),
+    path('messages/media/uploads/<uuid:upload_id>/', MediaUploadView.as_view(), name='media_upload'),
+    path('messages/media/uploads/<uuid:upload_id>/parts/<int:part_number>/', MediaUploadPartView.as_view(), name='media_upload_part'),
+    path('messages/media/uploads/<uuid:upload_id>/complete/', CompleteMediaUploadView.as_view(), name='complete_media_upload'),
     path('messages/<uuid:chat_id>/edit/', EditMessageView.as_view(), name='edit_message'),
     path('messages/<uuid:chat_id>/delete/', DeleteMessageView.as_view(), name='delete_message'),
     path('messages/<uuid:chat_id>/read/', MarkReadView.as_view(), name='mark_read'),
     path('messages/<uuid:chat_id>/react/', AddReactionView.as_view(), name='add_reaction'),
     path('messages/<uuid:chat_id>/reactions/', ListReactionsView.as_view(), name='list_reactions'),
     path('messages/', MessageListView.as_view(), name='message_list'),
+    path('messages/sync/', MessageSyncView.as_view(), name='message_sync'),
+    path('messages/search/', MessageSearchView.as_view(), name='message_search'),
+    path('messages/conversations/<uuid:partner_id>/receipts/', ConversationReceiptView.as_view(), name='conversation_receipt'),
+    path('messages/conversations/<uuid:partner_id>/delete/', DeleteConversationView.as_view(), name='delete_conversation'),
     path('typing/', TypingStatusView.as_view(), name='typing_status'),
     path('societies/create/', CreateSocietyView.as_view(), name='create_society'),
     path('societies/<uuid:society_id>/join/', JoinSocietyView.as_view(), name='join_society'),
     path('societies/<uuid:society_id>/leave/', LeaveSocietyView.as_view(), name='leave_society'),
     path('societies/', SocietyListView.as_view(), name='list_societies'),
     path('societies/<uuid:society_id>/messages/', SocietyMessageListView.as_view(), name='society_messages'),
+    path('societies/<uuid:society_id>/read/', MarkSocietyReadView.as_view(), name='mark_society_read'),
     path('societies/<uuid:society_id>/messages/send/', SendSocietyMessageView.as_view(), name='send_society_message'),
     path('societies/<uuid:society_id>/messages/<uuid:message_id>/edit/', EditSocietyMessageView.as_view(), name='edit_society_message'),
     path('societies/<uuid:society_id>/messages/<uuid:message_id>/delete/', DeleteSocietyMessageView.as_view(), name='delete_society_message'),
@@ -8,17 +8,28 @@ from rest_framework.pagination import PageNumberPagination
 from django.db.models import Q
 from backend.discussions.models import Society, SocietyMember, SocietyMessage
 from backend.users.models import CustomUser, Follows
+from backend.users.presence import set_typing, typing_event
 from backend.swaps.models import Notification
 from backend.utils.websocket import send_notification_to_user
-from .models import Chats
+from .models import Chats, MediaUpload
+from .conversations import (
+    delete_conversation, deleted_conversations, hidden_by_deletion, inbox, pair_messages, record_read,
+    refresh_last_message, visible_since
+)
+from .media import MediaUploadError, MediaUploadExpired, abort_upload, complete_upload, start_upload, upload_part
+from .reactions import own_reactions, unreact
+from .receipts import acknowledge_messages, parse_receipt
+from .society_fanout import mark_society_read, society_unread_counts
+from .pagination import MessageCursorPagination, decode_cursor, encode_cursor
+from .search import SEARCH_SCOPES, search_messages
 from .serializers import (
     ChatSerializer, ChatReadStatusSerializer, SocietyCreateSerializer,
     SocietySerializer, SocietyMessageSerializer, MessageReactionSerializer,
-    MediaMessageSerializer
+    MediaMessageSerializer, MediaUploadSerializer
 )
-from .models import Chats, ChatTypingStatus
 import os
 import uuid
+from datetime import timedelta
 from django.conf import settings
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
@@ -27,10 +38,17 @@ from .models import Chats, MessageReaction
 from django.db.models import Q
 from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
-from django.core.cache import cache
+from django.urls import reverse
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from django.utils import timezone
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from botocore.exceptions import ClientError
+
+# Upper bound on changes returned by one sync call; clients repeat while has_more
+MESSAGE_SYNC_LIMIT = 200
+MESSAGE_SEARCH_PAGE_SIZE = 20
 
 class SendMessageView(APIView):
     permission_classes = [IsAuthenticated]
@@ -80,9 +98,20 @@ class DeleteMessageView(APIView):
 
         chat.is_deleted_by_sender = True
         chat.save()
+        refresh_last_message(chat)
         return Response({"message": "Message deleted successfully."}, status=status.HTTP_200_OK)
 
 
+class DeleteConversationView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, partner_id):
+        # Only hides the conversation from the requesting user; new messages bring it back
+        if not delete_conversation(request.user.user_id, partner_id):
+            return Response({"error": "Conversation not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"message": "Conversation deleted successfully."}, status=status.HTTP_200_OK)
+
+
 class MessageListView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -98,59 +127,46 @@ class MessageListView(APIView):
             except CustomUser.DoesNotExist:
                 return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
-            messages = Chats.objects.filter(
-                Q(sender=user, receiver=receiver) | Q(sender=receiver, receiver=user)
-            ).filter(
+            messages = pair_messages(user.user_id, receiver.user_id).filter(
                 Q(is_deleted_by_sender=False, sender=user) | Q(is_deleted_by_receiver=False, receiver=user)
-            ).order_by('created_at')
-
-            paginator = PageNumberPagination()
-            paginator.page_size = 50
+            ).select_related('sender', 'receiver', 'book')
+            deleted_before = visible_since(user.user_id, receiver.user_id)
+            if deleted_before:
+                messages = messages.filter(created_at__gt=deleted_before)
+
+            if 'page' in request.query_params:
+                # Page numbers are still accepted from older clients
+                paginator = PageNumberPagination()
+                paginator.page_size = 50
+                messages = messages.order_by('created_at')
+            else:
+                # before=<cursor> / after=<cursor> keyset pages, newest page by default
+                paginator = MessageCursorPagination()
             result_page = paginator.paginate_queryset(messages, request)
-            serializer = ChatSerializer(result_page, many=True)
+            serializer = ChatSerializer(
+                result_page, many=True, context={'own_reactions': own_reactions(user, result_page)}
+            )
             return paginator.get_paginated_response(serializer.data)
         else:
-            # Get conversation list (latest message from each conversation)
+            # Conversation list from the denormalized inbox, latest first
+            rows = list(inbox(user))
+            context = {
+                'preview': True,
+                'own_reactions': own_reactions(user, [conversation.last_message for conversation in rows]),
+            }
             conversations = []
-
-            # Get all users the current user has chatted with
-            sent_to = Chats.objects.filter(sender=user, is_deleted_by_sender=False).values_list('receiver', flat=True).distinct()
-            received_from = Chats.objects.filter(receiver=user, is_deleted_by_receiver=False).values_list('sender', flat=True).distinct()
-
-            all_chat_partners = set(list(sent_to) + list(received_from))
-
-            for partner_id in all_chat_partners:
-                if partner_id is None:
-                    continue
-
-                try:
-                    partner = CustomUser.objects.get(user_id=partner_id)
-                except CustomUser.DoesNotExist:
-                    continue
-
-                # Get the latest message in this conversation
-                latest_message = Chats.objects.filter(
-                    Q(sender=user, receiver=partner) | Q(sender=partner, receiver=user)
-                ).filter(
-                    Q(is_deleted_by_sender=False, sender=user) | Q(is_deleted_by_receiver=False, receiver=user)
-                ).order_by('-created_at').first()
-
-                if latest_message:
-                    conversation_data = {
-                        'partner': {
-                            'user_id': str(partner.user_id),
-                            'username': partner.username,
-                            'profile_picture': partner.profile_picture if partner.profile_picture else None,
-                        },
-                        'latest_message': ChatSerializer(latest_message).data,
-                        'unread_count': Chats.objects.filter(
-                            sender=partner, receiver=user, status__in=['SENT', 'DELIVERED']
-                        ).count()
-                    }
-                    conversations.append(conversation_data)
-
-            # Sort conversations by latest message time
-            conversations.sort(key=lambda x: x['latest_message']['created_at'], reverse=True)
+            for conversation in rows:
+                is_low = conversation.user_low_id == user.user_id
+                partner = conversation.user_high if is_low else conversation.user_low
+                conversations.append({
+                    'partner': {
+                        'user_id': str(partner.user_id),
+                        'username': partner.username,
+                        'profile_picture': partner.profile_picture if partner.profile_picture else None,
+                    },
+                    'latest_message': ChatSerializer(conversation.last_message, context=context).data,
+                    'unread_count': conversation.low_unread_count if is_low else conversation.high_unread_count
+                })
 
             return Response({
                 'results': conversations,
@@ -158,56 +174,191 @@ class MessageListView(APIView):
             })
 
 
+class MessageSyncView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Messages created, edited or deleted since ``since``, oldest change first
+
+        ``since`` is the ``watermark`` of the previous sync, or an ISO timestamp for
+        the first one. Deleted messages, including those hidden by deleting the
+        conversation, are returned as IDs only; ``deleted_conversations`` lists
+        the conversations cleared since, with the time up to which they were.
+
+        ``updated_at`` is stamped before commit, so once caught up the watermark
+        is held MESSAGE_SYNC_OVERLAP_SECONDS behind the present and recent
+        changes are returned again by the next sync. Clients must apply changes
+        idempotently, deduplicating by ``chat_id`` and ``partner_id``.
+        """
+        since = request.query_params.get('since')
+        if not since:
+            return Response({"error": "since is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            updated_at, chat_id = decode_cursor(since)
+            changed = Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, chat_id__gt=chat_id)
+        except NotFound:
+            updated_at = parse_datetime(since)
+            if updated_at is None:
+                return Response({"error": "Invalid since watermark."}, status=status.HTTP_400_BAD_REQUEST)
+            changed = Q(updated_at__gte=updated_at)
+
+        user = request.user
+        rows = list(
+            Chats.objects.filter(Q(sender=user) | Q(receiver=user)).filter(changed)
+            .annotate(before_deletion=hidden_by_deletion(user))
+            .select_related('sender', 'receiver', 'book')
+            .order_by('updated_at', 'chat_id')[:MESSAGE_SYNC_LIMIT + 1]
+        )
+        has_more = len(rows) > MESSAGE_SYNC_LIMIT
+        rows = rows[:MESSAGE_SYNC_LIMIT]
+
+        deleted, messages = [], []
+        for chat in rows:
+            hidden = chat.before_deletion or \
+                (chat.sender_id == user.user_id and chat.is_deleted_by_sender) or \
+                (chat.receiver_id == user.user_id and chat.is_deleted_by_receiver)
+            (deleted if hidden else messages).append(chat)
+
+        position = (rows[-1].updated_at, rows[-1].chat_id) if rows else None
+        # Deletions up to the end of this page; once caught up, all of them
+        cleared = deleted_conversations(user, updated_at, until=position[0] if has_more else None)
+        if not has_more:
+            # The nil ID keeps messages changed at the watermark's instant in the next sync
+            if cleared and (position is None or cleared[-1][1] > position[0]):
+                position = (cleared[-1][1], uuid.UUID(int=0))
+            settled = timezone.now() - timedelta(seconds=settings.MESSAGE_SYNC_OVERLAP_SECONDS)
+            if position and position[0] > settled:
+                position = (settled, uuid.UUID(int=0))
+        watermark = encode_cursor(*position) if position else since
+
+        return Response({
+            'messages': ChatSerializer(
+                messages, many=True, context={'own_reactions': own_reactions(user, messages)}
+            ).data,
+            'deleted': [str(chat.chat_id) for chat in deleted],
+            'deleted_conversations': [
+                {'partner_id': str(partner_id), 'deleted_before': deleted_before}
+                for partner_id, deleted_before in cleared
+            ],
+            'watermark': watermark,
+            'has_more': has_more,
+        })
+
+
+class MessageSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Full-text search over the user's conversations and active society memberships
+
+        ``q`` takes web search syntax; ``scope`` is 'all', 'private' or 'society'.
+        Results are newest first with highlighted snippets; pass ``next_cursor``
+        back as ``cursor`` for the next page.
+        """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({"error": "q is required."}, status=status.HTTP_400_BAD_REQUEST)
+        scope = request.query_params.get('scope', 'all')
+        if scope not in SEARCH_SCOPES:
+            return Response({"error": "Invalid scope."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(search_messages(
+            request.user, text, scope=scope,
+            cursor=request.query_params.get('cursor'), size=MESSAGE_SEARCH_PAGE_SIZE
+        ))
+
+
 class MarkReadView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, chat_id):
         try:
             chat = Chats.objects.get(chat_id=chat_id, receiver=request.user)
-            chat.status = 'READ'
-            chat.read_at = timezone.now()
-            chat.save()
-            return Response({"message": "Message marked as read."}, status=status.HTTP_200_OK)
         except Chats.DoesNotExist:
             return Response({"error": "Message not found."}, status=status.HTTP_404_NOT_FOUND)
 
+        with transaction.atomic():
+            # Only a message that was still unread comes off the conversation's unread count
+            now = timezone.now()
+            if Chats.objects.filter(chat_id=chat.chat_id, status__in=['SENT', 'DELIVERED']).update(
+                status='READ', read_at=now, updated_at=now
+            ):
+                record_read(request.user.user_id, chat.sender_id)
+        return Response({"message": "Message marked as read."}, status=status.HTTP_200_OK)
 
-class AddReactionView(APIView):
+
+class ConversationReceiptView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def post(self, request, chat_id):
+    def post(self, request, partner_id):
+        # Acknowledges everything the partner sent up to ``up_to`` in one statement
+        try:
+            receipt_status, up_to = parse_receipt(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            chat = Chats.objects.get(chat_id=chat_id)
+            count = acknowledge_messages(request.user.user_id, partner_id, receipt_status, up_to)
         except Chats.DoesNotExist:
             return Response({"error": "Message not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"status": receipt_status, "count": count}, status=status.HTTP_200_OK)
 
-        reaction_type = request.data.get('reaction_type')
-        if not reaction_type:
-            return Response({"error": "Reaction type is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        reaction, created = MessageReaction.objects.get_or_create(
-            message=chat,
-            user=request.user,
-            defaults={'reaction_type': reaction_type}
-        )
+def _reaction_target(user, chat_id=None, society_id=None, message_id=None):
+    """
+    The private or society message a reaction URL points to, if ``user`` may see it
+
+    Raises:
+        NotFound: If the message does not exist or belongs to someone else's conversation or society
+    """
+    if chat_id:
+        chat = Chats.objects.select_related('sender').filter(chat_id=chat_id).first()
+        if chat is None or user.user_id not in (chat.sender_id, chat.receiver_id):
+            raise NotFound("Message not found.")
+        return chat
+    message = SocietyMessage.objects.select_related('user').filter(
+        message_id=message_id, society_id=society_id, status__in=['ACTIVE', 'EDITED']
+    ).first()
+    if message is None or not SocietyMember.objects.filter(
+        society_id=society_id, user=user, status='ACTIVE'
+    ).exists():
+        raise NotFound("Message not found.")
+    return message
 
-        if not created:
-            reaction.reaction_type = reaction_type
-            reaction.save()
 
-        return Response(MessageReactionSerializer(reaction).data, status=status.HTTP_201_CREATED)
+class AddReactionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, chat_id=None, society_id=None, message_id=None):
+        target = _reaction_target(request.user, chat_id, society_id, message_id)
+        context_key = 'chat' if chat_id else 'society_message'
+        serializer = MessageReactionSerializer(
+            data=request.data, context={context_key: target, 'user': request.user}
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return Response(
+            {**serializer.data, 'reaction_counts': target.reaction_counts}, status=status.HTTP_201_CREATED
+        )
+
+    def delete(self, request, chat_id=None, society_id=None, message_id=None):
+        target = _reaction_target(request.user, chat_id, society_id, message_id)
+        if not unreact(request.user, target):
+            return Response({"error": "Reaction not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"reaction_counts": target.reaction_counts}, status=status.HTTP_200_OK)
 
 
 class ListReactionsView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, chat_id):
-        try:
-            chat = Chats.objects.get(chat_id=chat_id)
-        except Chats.DoesNotExist:
-            return Response({"error": "Message not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        reactions = MessageReaction.objects.filter(message=chat)
+    def get(self, request, chat_id=None, society_id=None, message_id=None):
+        # Who reacted; message payloads only carry the counts
+        target = _reaction_target(request.user, chat_id, society_id, message_id)
+        reactions = MessageReaction.objects.filter(
+            **({'chat': target} if chat_id else {'society_message': target})
+        ).select_related('user').order_by('created_at')
         serializer = MessageReactionSerializer(reactions, many=True)
         return Response(serializer.data)
 
@@ -234,36 +385,116 @@ class SendMediaMessageView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TypingStatusView(APIView):
+class StartMediaUploadView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        receiver_id = request.data.get('receiver_id')
-        is_typing = request.data.get('is_typing', False)
-
+        serializer = MediaUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
         try:
-            receiver = CustomUser.objects.get(user_id=receiver_id)
+            receiver = CustomUser.objects.get(user_id=data['receiver_id'])
         except CustomUser.DoesNotExist:
             return Response({"error": "Receiver not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Use cache to store typing status temporarily
-        cache_key = f"typing_{request.user.user_id}_{receiver.user_id}"
-        if is_typing:
-            cache.set(cache_key, True, timeout=10)  # 10 seconds timeout
-        else:
-            cache.delete(cache_key)
+        if not (Follows.objects.filter(follower=request.user, followed=receiver).exists() and
+                Follows.objects.filter(follower=receiver, followed=request.user).exists()):
+            return Response({"error": "Mutual follow required."}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            upload, urls = start_upload(
+                request.user, receiver, data['message_type'], data['filename'], data['size'],
+                data.get('content_type', '')
+            )
+        except MediaUploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Send typing status via WebSocket
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{receiver.user_id}",
+        # Parts without a presigned URL are PUT to the server, which streams them on
+        parts = [
             {
-                "type": "typing_status",
-                "user_id": str(request.user.user_id),
-                "username": request.user.username,
-                "is_typing": is_typing,
+                "part_number": number,
+                "url": url or request.build_absolute_uri(
+                    reverse('chat:media_upload_part', args=[upload.upload_id, number])
+                ),
+                "direct": url is not None,
             }
-        )
+            for number, url in enumerate(urls, start=1)
+        ]
+        return Response({
+            "upload_id": upload.upload_id,
+            "part_size": settings.MEDIA_UPLOAD_PART_SIZE,
+            "parts": parts,
+        }, status=status.HTTP_201_CREATED)
+
+
+class MediaUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, upload_id):
+        with transaction.atomic():
+            upload = get_object_or_404(
+                MediaUpload.objects.select_for_update(), upload_id=upload_id, sender=request.user, status='PENDING'
+            )
+            abort_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MediaUploadPartView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, upload_id, part_number):
+        upload = get_object_or_404(MediaUpload, upload_id=upload_id, sender=request.user, status='PENDING')
+        # DRF has no stream for an empty body or one without a Content-Length
+        if request.stream is None:
+            return Response({"error": "Part is empty."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # The raw body is streamed; request.data would buffer the whole part
+            etag = upload_part(upload, part_number, request.stream)
+        except MediaUploadExpired as e:
+            return Response({"error": str(e)}, status=status.HTTP_410_GONE)
+        except MediaUploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ClientError:
+            return Response({"error": "Storage rejected the part."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"part_number": part_number, "etag": etag}, status=status.HTTP_200_OK)
+
+
+class CompleteMediaUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        with transaction.atomic():
+            upload = get_object_or_404(
+                MediaUpload.objects.select_for_update().select_related('sender', 'receiver'),
+                upload_id=upload_id, sender=request.user, status='PENDING'
+            )
+            # Errors are returned inside the transaction so an upload marked ABORTED stays so
+            try:
+                chat = complete_upload(upload, request.data.get('content'))
+            except MediaUploadExpired as e:
+                return Response({"error": str(e)}, status=status.HTTP_410_GONE)
+            except MediaUploadError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except ClientError:
+                return Response({"error": "Storage rejected the upload."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ChatSerializer(chat).data, status=status.HTTP_201_CREATED)
+
+
+class TypingStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        # Older clients; current ones send typing events over the notification websocket
+        try:
+            receiver_id = uuid.UUID(str(request.data.get('receiver_id')))
+        except ValueError:
+            return Response({"error": "Receiver not found."}, status=status.HTTP_404_NOT_FOUND)
+        is_typing = bool(request.data.get('is_typing', False))
+
+        if set_typing(request.user.user_id, receiver_id, is_typing):
+            channel_layer = get_channel_layer()
+            async_to_sync(channel_layer.group_send)(f"user_{receiver_id}", typing_event(request.user, is_typing))
 
         return Response({"message": "Typing status updated."}, status=status.HTTP_200_OK)
 
@@ -331,7 +562,8 @@ class JoinSocietyView(APIView):
             society=society,
             user=request.user,
             role='member',
-            status='ACTIVE'
+            status='ACTIVE',
+            last_read_seq=society.message_seq
         )
 
         # Create notification
@@ -434,16 +666,16 @@ class SocietyListView(APIView):
                 Q(name__icontains=search) | Q(description__icontains=search)
             )
 
-        # Add member count and user membership status
+        # Add member count, user membership status and unread badge
+        unread_counts = society_unread_counts(request.user.user_id)
         societies = []
         for society in queryset.select_related('creator'):
             society_data = SocietySerializer(society).data
             society_data['member_count'] = SocietyMember.objects.filter(
                 society=society, status='ACTIVE'
             ).count()
-            society_data['is_member'] = SocietyMember.objects.filter(
-                society=society, user=request.user, status='ACTIVE'
-            ).exists()
+            society_data['is_member'] = society.society_id in unread_counts
+            society_data['unread_count'] = unread_counts.get(society.society_id, 0)
             societies.append(society_data)
 
         return Response({
@@ -476,6 +708,16 @@ class SendSocietyMessageView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class MarkSocietyReadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, society_id):
+        if not mark_society_read(society_id, request.user.user_id):
+            return Response({"error": "You must be a member to read messages."},
+                          status=status.HTTP_403_FORBIDDEN)
+        return Response({"message": "Society marked as read."}, status=status.HTTP_200_OK)
+
+
 class EditSocietyMessageView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -544,7 +786,7 @@ class SocietyMessageListView(APIView):
         # Get messages with pagination
         messages = SocietyMessage.objects.filter(
             society=society, status='ACTIVE'
-        ).select_related('user', 'book').prefetch_related('reactions').order_by('-created_at')
+        ).select_related('user', 'book').order_by('-created_at')
 
         # Simple pagination
         page = int(request.GET.get('page', 1))
@@ -552,8 +794,11 @@ class SocietyMessageListView(APIView):
         start = (page - 1) * page_size
         end = start + page_size
 
-        paginated_messages = messages[start:end]
-        serialized_messages = SocietyMessageSerializer(paginated_messages, many=True).data
+        paginated_messages = list(messages[start:end])
+        serialized_messages = SocietyMessageSerializer(
+            paginated_messages, many=True,
+            context={'own_reactions': own_reactions(request.user, paginated_messages)}
+        ).data
 
         return Response({
             "results": serialized_messages,
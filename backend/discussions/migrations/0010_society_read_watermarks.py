@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-19 00:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0009_message_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='society',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, db_comment='When the latest message was posted', null=True),
+        ),
+        migrations.AddField(
+            model_name='society',
+            name='message_seq',
+            field=models.PositiveBigIntegerField(db_comment='Number of messages posted so far; members count unread messages from their read watermark', default=0),
+        ),
+        migrations.AddField(
+            model_name='societymember',
+            name='digest_seq',
+            field=models.PositiveBigIntegerField(db_comment='Society message_seq covered by the last digest sent to the member', default=0),
+        ),
+        migrations.AddField(
+            model_name='societymember',
+            name='digested_at',
+            field=models.DateTimeField(blank=True, db_comment='When the last digest was sent', null=True),
+        ),
+        migrations.AddField(
+            model_name='societymember',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='societymember',
+            name='last_read_seq',
+            field=models.PositiveBigIntegerField(db_comment='Society message_seq when the member last read it; the unread badge is the difference', default=0),
+        ),
+        migrations.AddIndex(
+            model_name='society',
+            index=models.Index(fields=['last_message_at'], name='societies_last_message_idx'),
+        ),
+    ]
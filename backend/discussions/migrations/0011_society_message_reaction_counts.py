@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussions', '0010_society_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='societymessage',
+            name='reaction_counts',
+            field=models.JSONField(blank=True, db_comment='Reaction type to number of reactions, maintained with the reactions', default=dict),
+        ),
+    ]
@@ -1,7 +1,10 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.conf import settings
 import uuid
 from backend.library.models import Book
+from backend.utils.search import SearchVectorMixin
 
 class Discussion(models.Model):
     discussion_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -109,12 +112,21 @@ class Society(models.Model):
         db_comment='UUID for Book or genre string'
     )
     icon_url = models.URLField(blank=True, null=True)
+    message_seq = models.PositiveBigIntegerField(
+        default=0,
+        db_comment='Number of messages posted so far; members count unread messages from their read watermark'
+    )
+    last_message_at = models.DateTimeField(blank=True, null=True, db_comment='When the latest message was posted')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'societies'
         db_table_comment = 'Stores Societies for discussions and group chats'
-        indexes = [models.Index(fields=['focus_type', 'focus_id'])]
+        indexes = [
+            models.Index(fields=['focus_type', 'focus_id']),
+            # Societies with recent messages, for member digests
+            models.Index(fields=['last_message_at'], name='societies_last_message_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.focus_type or 'General'})"
@@ -137,6 +149,16 @@ class SocietyMember(models.Model):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='member')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ACTIVE')
     joined_at = models.DateTimeField(auto_now_add=True)
+    last_read_seq = models.PositiveBigIntegerField(
+        default=0,
+        db_comment='Society message_seq when the member last read it; the unread badge is the difference'
+    )
+    last_read_at = models.DateTimeField(blank=True, null=True)
+    digest_seq = models.PositiveBigIntegerField(
+        default=0,
+        db_comment='Society message_seq covered by the last digest sent to the member'
+    )
+    digested_at = models.DateTimeField(blank=True, null=True, db_comment='When the last digest was sent')
 
     class Meta:
         db_table = 'society_members'
@@ -161,7 +183,7 @@ class SocietyEvent(models.Model):
         db_table = 'society_events'
         db_table_comment = 'Stores Society events'
 
-class SocietyMessage(models.Model):
+class SocietyMessage(SearchVectorMixin, models.Model):
     STATUS_CHOICES = (
         ('ACTIVE', 'Active'),
         ('EDITED', 'Edited'),
@@ -183,6 +205,16 @@ class SocietyMessage(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ACTIVE')
     created_at = models.DateTimeField(auto_now_add=True)
     edited_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        db_comment='Full-text search vector of content, maintained on create and edit'
+    )
+    reaction_counts = models.JSONField(
+        default=dict,
+        blank=True,
+        db_comment='Reaction type to number of reactions, maintained with the reactions'
+    )
 
     class Meta:
         db_table = 'society_messages'
@@ -190,6 +222,7 @@ class SocietyMessage(models.Model):
         indexes = [
             models.Index(fields=['society']),
             models.Index(fields=['created_at']),
+            GinIndex(fields=['search_vector'], name='society_messages_search_idx'),
         ]
 
     def __str__(self):
@@ -21,6 +21,7 @@ from .serializers import (
 from backend.users.models import Follows
 from backend.library.models import Bookmark
 from backend.swaps.models import Notification
+from backend.swaps.notification_coalescing import buffer_notification
 from backend.utils.websocket import send_notification_to_user
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
@@ -211,30 +212,13 @@ class AddNoteView(generics.CreateAPIView):
 
         serializer = self.get_serializer(data=request.data, context={'discussion': discussion, 'request': request})
         serializer.is_valid(raise_exception=True)
-        note = serializer.save()
+        serializer.save()
 
-        try:
-            notification = Notification.objects.create(
-                user=discussion.user,
-                type='note_added',
-                message=f"{request.user.username} commented on your discussion: {discussion.title}"[:500],
-                content_type='note',
-                content_id=note.note_id
-            )
-            # Send notification via WebSocket to the user's group
-            send_notification_to_user(
-                discussion.user.user_id,
-                {
-                    "notification_id": str(notification.notification_id),
-                    "message": f"{request.user.username} commented on your discussion: {discussion.title}"[:500],
-                    "type": "note_added",
-                    "content_type": "note",
-                    "content_id": str(note.note_id),
-                    "follow_id": None
-                }
-            )
-        except Exception as e:
-            print(f"Notification creation failed: {str(e)}")
+        # Notes on one discussion are coalesced into a single notification per window
+        buffer_notification(
+            discussion.user_id, 'note_added', 'discussion', discussion.discussion_id,
+            actor_id=request.user.user_id, actor=request.user.username, subject=discussion.title
+        )
 
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
@@ -293,28 +277,10 @@ class LikeCommentView(generics.UpdateAPIView):
                 action = 'liked'
 
         if action == 'liked' and note.user != user:
-            try:
-                notification = Notification.objects.create(
-                    user=note.user,
-                    type='note_liked',
-                    message=f"{user.username} liked your comment on {note.discussion.title}"[:500],
-                    content_type='note',
-                    content_id=note.note_id
-                )
-                # Send notification via WebSocket to the note owner's group
-                send_notification_to_user(
-                    note.user.user_id,
-                    {
-                        "notification_id": str(notification.notification_id),
-                        "message": f"{user.username} liked your comment on {note.discussion.title}"[:500],
-                        "type": "note_liked",
-                        "content_type": "note",
-                        "content_id": str(note.note_id),
-                        "follow_id": None
-                    }
-                )
-            except Exception as e:
-                print(f"Notification creation failed: {str(e)}")
+            buffer_notification(
+                note.user_id, 'note_liked', 'note', note.note_id,
+                actor_id=user.user_id, actor=user.username, subject=note.discussion.title
+            )
 
         note = Note.objects.filter(note_id=note.note_id).annotate(likes_count=Count('likes')).first()
         serializer = self.get_serializer(note)
@@ -359,28 +325,10 @@ class UpvotePostView(APIView):
                 action = 'upvoted'
 
         if action == 'upvoted' and discussion.user != user:
-            try:
-                notification = Notification.objects.create(
-                    user=discussion.user,
-                    type='discussion_upvoted',
-                    message=f"{user.username} upvoted your discussion: {discussion.title}"[:500],
-                    content_type='discussion',
-                    content_id=discussion.discussion_id
-                )
-                # Send notification via WebSocket to the user's group
-                send_notification_to_user(
-                    discussion.user.user_id,
-                    {
-                        "notification_id": str(notification.notification_id),
-                        "message": f"{user.username} upvoted your discussion: {discussion.title}"[:500],
-                        "type": "discussion_upvoted",
-                        "content_type": "discussion",
-                        "content_id": str(discussion.discussion_id),
-                        "follow_id": None
-                    }
-                )
-            except Exception as e:
-                print(f"Notification creation failed: {str(e)}")
+            buffer_notification(
+                discussion.user_id, 'discussion_upvoted', 'discussion', discussion.discussion_id,
+                actor_id=user.user_id, actor=user.username, subject=discussion.title
+            )
 
         discussion = Discussion.objects.filter(discussion_id=discussion.discussion_id).annotate(
             upvotes_count=Count('upvotes'),
@@ -617,7 +565,8 @@ class JoinSocietyView(generics.CreateAPIView):
             society=society,
             user=request.user,
             role='member',
-            joined_at=now()
+            joined_at=now(),
+            last_read_seq=society.message_seq
         )
         notification = Notification.objects.create(
             user=request.user,
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_remove_isbn_unique_constraint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('locked_until__isnull', False)), fields=['locked_until'], name='books_locked_until_idx'),
+        ),
+    ]
@@ -94,6 +94,12 @@ class Book(models.Model):
             models.Index(fields=['user']),
             models.Index(fields=['isbn']),
             models.Index(fields=['available_for_exchange', 'available_for_borrow']),
+            # Only locked books, so the scheduler's expiry query stays small
+            models.Index(
+                fields=['locked_until'],
+                name='books_locked_until_idx',
+                condition=models.Q(locked_until__isnull=False)
+            ),
         ]
 
     def __str__(self):
@@ -21,7 +21,8 @@ from .serializers import (
     BookHistorySerializer, BookmarkSerializer, FavoriteSerializer, PopularBookSerializer
 )
 from backend.swaps.models import Notification
-from backend.utils.websocket import send_notification_to_user
+from backend.utils.websocket import queue_notifications, send_notification_to_user
+from backend.swaps.matching import mark_wants_changed
 
 logger = logging.getLogger(__name__)
 
@@ -206,19 +207,21 @@ class BookAvailabilityUpdateView(generics.UpdateAPIView):
                 for bookmark in bookmarks
             ]
             Notification.objects.bulk_create(notifications)
-            # Send notifications via WebSocket to each bookmarking user's group
-            for notification in notifications:
-                send_notification_to_user(
+            # Queue the WebSocket pushes for all bookmarking users in one INSERT
+            queue_notifications([
+                (
                     notification.user.user_id,
                     {
                         "notification_id": str(notification.notification_id),
-                        "message": f"{book.title} is now available for {'exchange' if book.available_for_exchange else 'borrowing'}.",
+                        "message": notification.message,
                         "type": "book_available",
                         "content_type": "book",
                         "content_id": str(book.book_id),
                         "follow_id": None
                     }
                 )
+                for notification in notifications
+            ])
 
         return Response(BookDetailSerializer(book).data, status=status.HTTP_200_OK)
 
@@ -311,6 +314,7 @@ class BookmarkBookView(generics.CreateAPIView):
             serializer = self.get_serializer(data={'book_id': self.kwargs['book_id'], **request.data})
             serializer.is_valid(raise_exception=True)
             bookmark = serializer.save()
+            mark_wants_changed(request.user.user_id)
             return Response(BookmarkSerializer(bookmark).data, status=status.HTTP_201_CREATED)
         except ValidationError as e:
             # Handle structured validation errors from serializer
@@ -353,6 +357,7 @@ class RemoveBookmarkView(generics.DestroyAPIView):
     def perform_destroy(self, instance):
         instance.active = False
         instance.save()
+        mark_wants_changed(instance.user_id)
 
 class FavoriteBookView(generics.CreateAPIView):
     serializer_class = FavoriteSerializer
@@ -363,6 +368,7 @@ class FavoriteBookView(generics.CreateAPIView):
             serializer = self.get_serializer(data={'book_id': self.kwargs['book_id'], **request.data})
             serializer.is_valid(raise_exception=True)
             favorite = serializer.save()
+            mark_wants_changed(request.user.user_id)
             return Response(FavoriteSerializer(favorite).data, status=status.HTTP_201_CREATED)
         except ValidationError as e:
             # Handle structured validation errors from serializer
@@ -405,6 +411,7 @@ class UnfavoriteBookView(generics.DestroyAPIView):
     def perform_destroy(self, instance):
         instance.active = False
         instance.save()
+        mark_wants_changed(instance.user_id)
 
 class MyBookmarksView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import timedelta
@@ -57,6 +58,7 @@ INSTALLED_APPS = [
     "django.contrib.sites",
     'corsheaders',
     'rest_framework',
+    'adrf',
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
     'django_filters',
@@ -188,6 +190,35 @@ CACHES = {
 
 GOOGLE_MAPS_API_KEY = 'YOUR_API_KEY'
 
+# Accept Fernet swap QR tokens issued before the compact format (they expire within 24h)
+QR_ACCEPT_LEGACY_TOKENS = os.getenv('QR_ACCEPT_LEGACY_TOKENS', 'True') == 'True'
+
+# Read or archived notifications older than this are dropped with their monthly partition
+NOTIFICATION_RETENTION_DAYS = int(os.getenv('NOTIFICATION_RETENTION_DAYS', '180'))
+
+# Upvotes, likes and notes on the same content within this many seconds become one notification
+NOTIFICATION_COALESCE_WINDOW = int(os.getenv('NOTIFICATION_COALESCE_WINDOW', '60'))
+
+# A websocket without a heartbeat for this many seconds counts as offline
+PRESENCE_TIMEOUT = int(os.getenv('PRESENCE_TIMEOUT', '60'))
+
+# CustomUser.last_active is written at most once per this many minutes per user
+LAST_ACTIVE_WRITE_MINUTES = int(os.getenv('LAST_ACTIVE_WRITE_MINUTES', '5'))
+
+# Chat attachments: largest accepted file, multipart part size (S3 minimum is 5 MB)
+# and how long an unfinished upload is kept before it is aborted
+MEDIA_UPLOAD_MAX_SIZE = int(os.getenv('MEDIA_UPLOAD_MAX_SIZE', str(100 * 1024 * 1024)))
+MEDIA_UPLOAD_PART_SIZE = int(os.getenv('MEDIA_UPLOAD_PART_SIZE', str(8 * 1024 * 1024)))
+MEDIA_UPLOAD_TTL_HOURS = int(os.getenv('MEDIA_UPLOAD_TTL_HOURS', '24'))
+
+# Members with unread society messages get at most one digest per this many minutes,
+# and only once they have not read the society for as long
+SOCIETY_DIGEST_INTERVAL_MINUTES = int(os.getenv('SOCIETY_DIGEST_INTERVAL_MINUTES', '60'))
+
+# Message sync watermarks stay this far behind the present, so changes stamped by
+# transactions that commit late (e.g. media uploads completing) are scanned again
+MESSAGE_SYNC_OVERLAP_SECONDS = int(os.getenv('MESSAGE_SYNC_OVERLAP_SECONDS', '60'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -231,6 +262,13 @@ CHANNEL_LAYERS = {
     },
 }
 
+# manage.py test uses its own Redis database, so tests never touch live cache, presence or channel state
+TESTING = sys.argv[1:2] == ['test']
+REDIS_TEST_URL = os.getenv('REDIS_TEST_URL', 'redis://redis:6379/15')
+if TESTING:
+    CACHES['default']['LOCATION'] = REDIS_TEST_URL
+    CHANNEL_LAYERS['default']['CONFIG']['hosts'] = [REDIS_TEST_URL]
+
 ASGI_APPLICATION = 'backend.asgi.application'
 
 # MinIO Configuration
@@ -6,7 +6,11 @@ import json
 from math import radians, sin, cos, sqrt, atan2, degrees, atan
 from django.conf import settings
 from django.core.cache import cache
+from django.db.models import Avg, Count
+from django.db.models.functions import Coalesce
+from asgiref.sync import async_to_sync, sync_to_async
 from .models import Location
+from .route_utils import route_midpoint_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,24 +35,23 @@ class LocationDiscoveryService:
         Returns:
             dict: Optimal midpoint with suggested locations
         """
+        return async_to_sync(self.acalculate_optimal_midpoint)(coord1, coord2, preferences)
+    
+    async def acalculate_optimal_midpoint(self, coord1, coord2, preferences=None):
+        """Async variant of calculate_optimal_midpoint for use in async views"""
         # Basic geometric midpoint
         basic_midpoint = {
             'latitude': (coord1['latitude'] + coord2['latitude']) / 2,
             'longitude': (coord1['longitude'] + coord2['longitude']) / 2
         }
         
-        # If Google Maps API is available, get route-based midpoint
-        if self.google_api_key:
-            route_midpoint = self._get_route_based_midpoint(coord1, coord2, preferences)
-            if route_midpoint:
-                midpoint = route_midpoint
-            else:
-                midpoint = basic_midpoint
-        else:
-            midpoint = basic_midpoint
+        # Prefer the halfway point along the travel route when Google Maps API is available
+        transport_mode = preferences.get('transport_mode', 'driving') if preferences else 'driving'
+        route_midpoint = await route_midpoint_service.get_route_midpoint(coord1, coord2, transport_mode)
+        midpoint = route_midpoint or basic_midpoint
         
         # Find optimal public places near midpoint
-        suggested_locations = self._find_optimal_locations(
+        suggested_locations = await sync_to_async(self._find_optimal_locations)(
             midpoint, 
             coord1, 
             coord2, 
@@ -62,56 +65,6 @@ class LocationDiscoveryService:
             'distance_from_user2': self._calculate_distance(coord2, midpoint)
         }
     
-    def _get_route_based_midpoint(self, coord1, coord2, preferences=None):
-        """Get midpoint based on actual travel routes"""
-        try:
-            transport_mode = preferences.get('transport_mode', 'driving') if preferences else 'driving'
-            
-            # Get route from Google Directions API
-            url = f"{self.places_api_url}/../directions/json"
-            params = {
-                'origin': f"{coord1['latitude']},{coord1['longitude']}",
-                'destination': f"{coord2['latitude']},{coord2['longitude']}",
-                'mode': transport_mode,
-                'key': self.google_api_key
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data['status'] == 'OK' and data['routes']:
-                route = data['routes'][0]
-                legs = route['legs']
-                
-                # Find midpoint along the route
-                total_distance = sum(leg['distance']['value'] for leg in legs)
-                target_distance = total_distance / 2
-                
-                current_distance = 0
-                for leg in legs:
-                    if current_distance + leg['distance']['value'] >= target_distance:
-                        # Midpoint is in this leg
-                        steps = leg['steps']
-                        remaining_distance = target_distance - current_distance
-                        
-                        step_distance = 0
-                        for step in steps:
-                            if step_distance + step['distance']['value'] >= remaining_distance:
-                                # Return the end location of this step as midpoint
-                                return {
-                                    'latitude': step['end_location']['lat'],
-                                    'longitude': step['end_location']['lng']
-                                }
-                            step_distance += step['distance']['value']
-                    current_distance += leg['distance']['value']
-            
-            return None
-            
-        except Exception as e:
-            logger.warning(f"Failed to get route-based midpoint: {e}")
-            return None
-    
     def _find_optimal_locations(self, midpoint, coord1, coord2, preferences=None):
         """Find optimal public places near the midpoint"""
         # Define search radius (5km)
@@ -187,6 +140,7 @@ class LocationDiscoveryService:
                     'rating': location.rating or 0,
                     'safety_score': location.safety_score,
                     'usage_count': location.usage_count,
+                    'popularity_score': location.popularity_score,
                     'amenities': location.amenities,
                     'opening_hours': location.opening_hours,
                     'source': 'database',
@@ -244,6 +198,7 @@ class LocationDiscoveryService:
                             'rating': place.get('rating', 0),
                             'safety_score': 4.0,  # Default safety score
                             'usage_count': 0,
+                            'popularity_score': None,
                             'amenities': [],
                             'opening_hours': place.get('opening_hours', {}),
                             'source': 'google_places',
@@ -312,8 +267,11 @@ class LocationDiscoveryService:
         balance_factor = 1 - abs(dist1 - dist2) / max(dist1, dist2, 1)
         score += balance_factor * 15
         
-        # Rating factor
-        score += (location.get('rating', 0) / 5) * 10
+        # Popularity factor (precomputed Bayesian rating, raw rating for external places)
+        popularity = location.get('popularity_score')
+        if popularity is None:
+            popularity = location.get('rating', 0)
+        score += (popularity / 5) * 10
         
         # Safety factor
         score += (location.get('safety_score', 0) / 5) * 10
@@ -346,3 +304,47 @@ class LocationDiscoveryService:
 
 # Global instance
 location_service = LocationDiscoveryService()
+
+
+def recompute_location_popularity(prior_weight=5, batch_size=500):
+    """
+    Recompute usage_count and popularity_score for all locations
+
+    usage_count is the number of confirmed or completed swaps that met at the
+    location (the exchange location wins over the planned meetup location).
+    popularity_score is a Bayesian average of the location rating, using
+    usage_count as the number of votes and the mean rating as the prior.
+
+    Args:
+        prior_weight: Number of swaps the prior rating counts for
+        batch_size: Rows per bulk UPDATE
+
+    Returns:
+        int: Number of locations updated
+    """
+    from .models import Swap
+
+    usage = dict(
+        Swap.objects.filter(status__in=['Confirmed', 'Completed'])
+        .annotate(used_location=Coalesce('exchange__location', 'meetup_location'))
+        .exclude(used_location__isnull=True)
+        .values_list('used_location')
+        .annotate(count=Count('swap_id'))
+        .order_by()
+    )
+    mean_rating = Location.objects.filter(rating__isnull=False).aggregate(avg=Avg('rating'))['avg'] or 0
+
+    changed = []
+    for location in Location.objects.only('location_id', 'rating', 'usage_count', 'popularity_score').iterator():
+        usage_count = usage.get(location.location_id, 0)
+        rating = location.rating if location.rating is not None else mean_rating
+        popularity_score = round(
+            (usage_count * rating + prior_weight * mean_rating) / (usage_count + prior_weight), 4
+        )
+        if location.usage_count != usage_count or location.popularity_score != popularity_score:
+            location.usage_count = usage_count
+            location.popularity_score = popularity_score
+            changed.append(location)
+
+    Location.objects.bulk_update(changed, ['usage_count', 'popularity_score'], batch_size=batch_size)
+    return len(changed)
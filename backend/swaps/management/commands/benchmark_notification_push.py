@@ -0,0 +1,53 @@
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, channel_layers, get_channel_layer
+from django.core.management.base import BaseCommand
+from backend.utils.websocket import notification_event, send_notifications_bulk_sync
+
+
+class Command(BaseCommand):
+    help = 'Compare per-recipient async_to_sync(group_send) against send_notifications_bulk_sync'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=1000, help='Number of distinct recipients')
+        parser.add_argument('--concurrency', type=int, default=64, help='group_send calls in flight for the bulk path')
+        parser.add_argument(
+            '--in-memory', action='store_true',
+            help='Use the in-memory channel layer instead of the configured (Redis) one'
+        )
+
+    def handle(self, *args, **options):
+        if options['in_memory']:
+            channel_layers.set('default', InMemoryChannelLayer())
+        channel_layer = get_channel_layer()
+        notifications = [
+            (uuid.uuid4(), {
+                'notification_id': uuid.uuid4(),
+                'message': 'Benchmark notification',
+                'type': 'swap_proposed',
+                'content_type': 'swap',
+                'content_id': uuid.uuid4()
+            })
+            for _ in range(options['recipients'])
+        ]
+
+        # Previous behaviour: one event loop bridge and group_send per recipient
+        start = time.perf_counter()
+        for user_id, notification_data in notifications:
+            async_to_sync(channel_layer.group_send)(
+                f"user_{user_id}",
+                {"type": "notification", **notification_event(notification_data)}
+            )
+        loop_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        failures = send_notifications_bulk_sync(notifications, concurrency=options['concurrency'])
+        bulk_seconds = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{len(notifications)} recipients on {type(channel_layer).__name__}: "
+            f"loop {loop_seconds * 1000:.0f} ms, bulk {bulk_seconds * 1000:.0f} ms "
+            f"({loop_seconds / bulk_seconds:.1f}x), {len(failures)} failures"
+        )
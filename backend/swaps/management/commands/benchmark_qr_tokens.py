@@ -0,0 +1,53 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import qrcode
+from django.core.management.base import BaseCommand
+from backend.swaps.qr_utils import qr_manager
+
+
+class Command(BaseCommand):
+    help = 'Compare size and sign/verify throughput of compact swap QR tokens against legacy Fernet tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10000, help='Tokens signed and verified per format')
+
+    def _legacy_payload(self, swap_id, user_id):
+        return {'qr_data': qr_manager._encrypt({
+            'swap_id': str(swap_id),
+            'user_id': str(user_id),
+            'timestamp': datetime.now().isoformat(),
+            'expires_at': (datetime.now() + timedelta(hours=24)).isoformat(),
+            'verification_token': uuid.uuid4().hex,
+            'location_coords': None
+        })}
+
+    def _qr_version(self, data):
+        qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L)
+        qr.add_data(data)
+        qr.make(fit=True)
+        return qr.version
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        swap_id, user_id = uuid.uuid4(), uuid.uuid4()
+        formats = [
+            ('compact', lambda: qr_manager.create_swap_qr_payload(swap_id, user_id)),
+            ('legacy', lambda: self._legacy_payload(swap_id, user_id)),
+        ]
+
+        for name, create in formats:
+            start = time.perf_counter()
+            tokens = [create()['qr_data'] for _ in range(iterations)]
+            sign_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for token in tokens:
+                assert qr_manager.verify_qr_code(token, swap_id, user_id)['success']
+            verify_seconds = time.perf_counter() - start
+
+            self.stdout.write(
+                f'{name}: {len(tokens[0])} chars, QR version {self._qr_version(tokens[0])}, '
+                f'sign {iterations / sign_seconds:,.0f}/s, verify {iterations / verify_seconds:,.0f}/s'
+            )
@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from backend.swaps.outbox import dispatch_outbox, purge_delivered
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued websocket notifications from the notification outbox (long-running worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Outbox rows claimed per transaction')
+        parser.add_argument('--poll-interval', type=float, default=0.2, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--retention-hours', type=int, default=24, help='Delivered and undeliverable rows older than this are deleted')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        retention = timedelta(hours=options['retention_hours'])
+        last_purge = 0
+        try:
+            while True:
+                delivered = dispatch_outbox(batch_size=options['batch_size'])
+                if time.monotonic() - last_purge > 3600:
+                    purge_delivered(retention)
+                    last_purge = time.monotonic()
+                if delivered < options['batch_size']:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            return
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from backend.swaps.notification_partitions import apply_retention, ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly notification partitions and drop expired ones (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=2, help='Future monthly partitions to keep ready')
+        parser.add_argument(
+            '--retention-days', type=int, default=settings.NOTIFICATION_RETENTION_DAYS,
+            help='Age after which read or archived notifications are removed'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per batch from the default partition')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write('Notification partitioning requires PostgreSQL.')
+            return
+        with connection.cursor() as cursor:
+            if not is_partitioned(cursor):
+                self.stderr.write('The notifications table is not partitioned; run migrations first.')
+                return
+
+        created = ensure_partitions(months_ahead=options['months_ahead'])
+        result = apply_retention(retention_days=options['retention_days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} partitions, dropped {result['partitions_dropped']} expired partitions "
+            f"and deleted {result['rows_deleted']} old notifications."
+        ))
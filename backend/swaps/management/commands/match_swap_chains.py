@@ -0,0 +1,43 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from backend.swaps.matching import WantGraph, clear_dirty_users, peek_dirty_users, save_swap_chains
+
+
+class Command(BaseCommand):
+    help = 'Find multi-party swap cycles in the want-graph and store them as proposed swap chains'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only recompute chains for users whose bookmarks/favorites changed since the last run'
+        )
+        parser.add_argument('--max-length', type=int, default=4, choices=[2, 3, 4], help='Longest cycle to search for')
+        parser.add_argument('--limit-per-user', type=int, default=20, help='Maximum chains found per starting user')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        dirty_users = None
+        if options['incremental']:
+            dirty_users = [uuid.UUID(user_id) for user_id in peek_dirty_users()]
+            if not dirty_users:
+                self.stdout.write('No changed users queued.')
+                return
+
+        graph = WantGraph.from_database()
+        self.stdout.write(f'Loaded want-graph: {graph.node_count} users, {graph.edge_count} edges')
+
+        if dirty_users is None:
+            cycles = graph.find_all_cycles(options['max_length'], options['limit_per_user'])
+        else:
+            cycles = graph.find_cycles_through(dirty_users, options['max_length'], options['limit_per_user'])
+
+        created = save_swap_chains(graph, cycles, replace_user_ids=dirty_users)
+        # Only dequeue once the chains are committed; a failed run retries the same users
+        if dirty_users:
+            clear_dirty_users(dirty_users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {created} swap chains in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from backend.swaps.unread_counts import reconcile_unread_counts
+
+
+class Command(BaseCommand):
+    help = 'Correct Redis unread notification counters that drifted from the notifications table (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Counters checked per database query')
+
+    def handle(self, *args, **options):
+        corrected = reconcile_unread_counts(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Corrected {corrected} unread notification counters.'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from backend.swaps.models import Swap
+from backend.swaps.qr_utils import qr_manager
+
+
+class Command(BaseCommand):
+    help = 'Pre-render QR code images for open swaps that only have a QR payload (run periodically or as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500, help='Maximum number of swaps to render per run')
+
+    def handle(self, *args, **options):
+        pending = Swap.objects.filter(
+            status__in=['Requested', 'Accepted'],
+            qr_code_url__isnull=True,
+            qr_code_data__isnull=False
+        ).values_list('swap_id', 'qr_code_data')[:options['limit']]
+
+        rendered = 0
+        for swap_id, qr_code_data in pending:
+            qr_code_url = qr_manager.render_qr_code(qr_code_data)
+            rendered += Swap.objects.filter(swap_id=swap_id, qr_code_url__isnull=True).update(
+                qr_code_url=qr_code_url
+            )
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} swap QR codes.'))
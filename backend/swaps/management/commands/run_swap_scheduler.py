@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from backend.swaps.scheduler import run_scheduled_jobs
+
+
+class Command(BaseCommand):
+    help = 'Expire book locks and extension requests, flag overdue returns, flush coalesced notifications, abort abandoned media uploads and send society digests, in a loop (or once with --once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between runs')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows claimed per transaction')
+        parser.add_argument('--once', action='store_true', help='Run every job once and exit (for cron)')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            results = run_scheduled_jobs(batch_size=options['batch_size'])
+            summary = ', '.join(f'{name}={count}' for name, count in results.items())
+            self.stdout.write(f'Scheduler run: {summary}')
+            if options['once']:
+                return
+            try:
+                time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
+            except KeyboardInterrupt:
+                return
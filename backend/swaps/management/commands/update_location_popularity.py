@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from backend.swaps.location_utils import recompute_location_popularity
+
+
+class Command(BaseCommand):
+    help = 'Recompute Location usage_count and popularity_score from completed swaps (run periodically, e.g. hourly cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prior-weight', type=int, default=5,
+            help='Number of swaps the mean rating counts for when smoothing popularity_score'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk UPDATE')
+
+    def handle(self, *args, **options):
+        updated = recompute_location_popularity(
+            prior_weight=options['prior_weight'],
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Updated popularity for {updated} locations.'))
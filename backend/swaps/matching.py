@@ -0,0 +1,251 @@
+"""
+Multi-party swap matching: finds short exchange cycles in the users' want-graph
+"""
+import logging
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+DIRTY_USERS_KEY = 'swap_chain_dirty_users'
+
+
+def mark_wants_changed(user_id):
+    """Queue a user for incremental chain recomputation after their bookmarks/favorites change"""
+    try:
+        get_redis_connection('default').sadd(DIRTY_USERS_KEY, str(user_id))
+    except Exception as e:
+        # The periodic full rebuild picks the change up anyway
+        logger.warning(f"Failed to queue user {user_id} for swap chain matching: {e}")
+
+
+def peek_dirty_users(count=10000):
+    """
+    Up to ``count`` queued user ids, left in the queue
+
+    Callers remove them with clear_dirty_users once their chains are saved, so a
+    failed run leaves them queued for the next one.
+    """
+    members = islice(get_redis_connection('default').sscan_iter(DIRTY_USERS_KEY, count=1000), count)
+    return [member.decode() if isinstance(member, bytes) else member for member in members]
+
+
+def clear_dirty_users(user_ids):
+    """Remove users whose chains have been recomputed from the queue"""
+    if user_ids:
+        get_redis_connection('default').srem(DIRTY_USERS_KEY, *[str(user_id) for user_id in user_ids])
+
+
+class WantGraph:
+    """
+    Directed want-graph over users stored as CSR adjacency arrays
+
+    An edge u -> v means user u wants a book currently owned by user v. Each
+    edge keeps one representative book so cycles can be turned into swap chains.
+    """
+
+    def __init__(self, src, dst, edge_books, user_ids, book_ids):
+        n = len(user_ids)
+        self.user_ids = user_ids
+        self.book_ids = book_ids
+        self.node_index = {user_id: i for i, user_id in enumerate(user_ids)}
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        edge_books = np.asarray(edge_books, dtype=np.int64)
+
+        # Drop self-loops and collapse parallel edges, keeping the first book seen
+        keep = src != dst
+        src, dst, edge_books = src[keep], dst[keep], edge_books[keep]
+        keys, first = np.unique(src * n + dst, return_index=True)
+        src, dst = keys // n, keys % n
+        self.edge_books = edge_books[first]
+
+        # Outgoing CSR: rows sorted by source, neighbors sorted within each row
+        self.out_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.out_indptr[1:])
+        self.out_indices = dst
+
+        # Incoming CSR built from the transposed edge list
+        order = np.lexsort((src, dst))
+        self.in_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(dst, minlength=n), out=self.in_indptr[1:])
+        self.in_indices = src[order]
+
+    @classmethod
+    def from_edges(cls, edges):
+        """Build a graph from an iterable of (wanter_id, owner_id, book_id) tuples"""
+        node_index = {}
+        book_index = {}
+        src, dst, books = [], [], []
+        for wanter_id, owner_id, book_id in edges:
+            src.append(node_index.setdefault(wanter_id, len(node_index)))
+            dst.append(node_index.setdefault(owner_id, len(node_index)))
+            books.append(book_index.setdefault(book_id, len(book_index)))
+        return cls(src, dst, books, list(node_index), list(book_index))
+
+    @classmethod
+    def from_database(cls, chunk_size=20000):
+        """Build the graph from active bookmarks and favorites on swappable books"""
+        from backend.library.models import Bookmark, Favorite
+
+        now = timezone.now()
+        swappable = (
+            Q(active=True, book__available_for_exchange=True, book__user__isnull=False)
+            & (Q(book__locked_until__isnull=True) | Q(book__locked_until__lte=now))
+        )
+
+        def edges():
+            for model in (Bookmark, Favorite):
+                rows = model.objects.filter(swappable).values_list('user_id', 'book__user_id', 'book_id')
+                yield from rows.order_by().iterator(chunk_size=chunk_size)
+
+        return cls.from_edges(edges())
+
+    @property
+    def node_count(self):
+        return len(self.user_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.out_indices)
+
+    def out_neighbors(self, node):
+        return self.out_indices[self.out_indptr[node]:self.out_indptr[node + 1]]
+
+    def in_neighbors(self, node):
+        return self.in_indices[self.in_indptr[node]:self.in_indptr[node + 1]]
+
+    def edge_book(self, u, v):
+        """Book id backing the edge u -> v"""
+        start = self.out_indptr[u]
+        position = start + np.searchsorted(self.out_neighbors(u), v)
+        return self.book_ids[self.edge_books[position]]
+
+    def cycles_from(self, start, max_length=4, canonical=True, limit=None):
+        """
+        Find simple cycles of length 2..max_length passing through ``start``
+
+        With ``canonical`` set only cycles whose smallest node is ``start`` are
+        returned, so iterating over every node reports each cycle exactly once.
+        Cycles are returned shortest first as tuples of node indices.
+        """
+        def allowed(nodes):
+            return nodes[nodes > start] if canonical else nodes[nodes != start]
+
+        out_s = allowed(self.out_neighbors(start))
+        in_s = allowed(self.in_neighbors(start))
+        if not len(out_s) or not len(in_s):
+            return []
+
+        cycles = []
+
+        def add(cycle):
+            cycles.append(cycle)
+            return limit is not None and len(cycles) >= limit
+
+        # Length 2: start wants from v and v wants from start
+        for v in np.intersect1d(out_s, in_s, assume_unique=True):
+            if add((start, int(v))):
+                return cycles
+
+        if max_length >= 3:
+            for a in out_s:
+                for b in np.intersect1d(allowed(self.out_neighbors(a)), in_s, assume_unique=True):
+                    if b != a and add((start, int(a), int(b))):
+                        return cycles
+
+        if max_length >= 4:
+            # Nodes that reach start in exactly two hops prune the middle of the path
+            two_back = np.unique(np.concatenate([self.in_neighbors(c) for c in in_s]))
+            two_back = allowed(two_back)
+            for a in out_s:
+                for b in np.intersect1d(allowed(self.out_neighbors(a)), two_back, assume_unique=True):
+                    if b == a:
+                        continue
+                    for c in np.intersect1d(allowed(self.out_neighbors(b)), in_s, assume_unique=True):
+                        if c != a and c != b and add((start, int(a), int(b), int(c))):
+                            return cycles
+
+        return cycles
+
+    def find_all_cycles(self, max_length=4, limit_per_node=20):
+        """Enumerate every short cycle in the graph once"""
+        cycles = []
+        for node in range(self.node_count):
+            cycles.extend(self.cycles_from(node, max_length, canonical=True, limit=limit_per_node))
+        return cycles
+
+    def find_cycles_through(self, user_ids, max_length=4, limit_per_node=20):
+        """Enumerate short cycles touching any of ``user_ids``, deduplicated"""
+        seen = set()
+        cycles = []
+        for user_id in user_ids:
+            node = self.node_index.get(user_id)
+            if node is None:
+                continue
+            for cycle in self.cycles_from(node, max_length, canonical=False, limit=limit_per_node):
+                # Rotate so the smallest node leads; the same cycle found from another user matches
+                pivot = cycle.index(min(cycle))
+                key = cycle[pivot:] + cycle[:pivot]
+                if key not in seen:
+                    seen.add(key)
+                    cycles.append(key)
+        return cycles
+
+    def chain_links(self, cycle):
+        """
+        Turn a cycle into swap chain links
+
+        Returns:
+            list: (giver_id, receiver_id, book_id) per link, in cycle order
+        """
+        links = []
+        for i, receiver in enumerate(cycle):
+            giver = cycle[(i + 1) % len(cycle)]
+            links.append((self.user_ids[giver], self.user_ids[receiver], self.edge_book(receiver, giver)))
+        return links
+
+
+def save_swap_chains(graph, cycles, replace_user_ids=None):
+    """
+    Persist cycles as proposed swap chains
+
+    Args:
+        graph: WantGraph the cycles were found in
+        cycles: Node-index tuples from the graph
+        replace_user_ids: When given, only proposed chains involving these users are
+            replaced (incremental run); otherwise all proposed chains are replaced
+
+    Returns:
+        int: Number of chains created
+    """
+    from .models import SwapChain, SwapChainLink
+
+    chains = []
+    links = []
+    for cycle in cycles:
+        chain = SwapChain(length=len(cycle))
+        chains.append(chain)
+        for position, (giver_id, receiver_id, book_id) in enumerate(graph.chain_links(cycle)):
+            links.append(SwapChainLink(
+                chain=chain,
+                position=position,
+                giver_id=giver_id,
+                receiver_id=receiver_id,
+                book_id=book_id
+            ))
+
+    with transaction.atomic():
+        stale = SwapChain.objects.filter(status='proposed')
+        if replace_user_ids is not None:
+            stale = stale.filter(links__giver_id__in=replace_user_ids).distinct()
+        SwapChain.objects.filter(chain_id__in=stale.values('chain_id')).delete()
+        SwapChain.objects.bulk_create(chains, batch_size=1000)
+        SwapChainLink.objects.bulk_create(links, batch_size=2000)
+    return len(chains)
@@ -0,0 +1,50 @@
+# Generated by Django 5.2 on 2026-10-18 23:30
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_remove_isbn_unique_constraint'),
+        ('swaps', '0012_location_accessibility_features_location_address_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SwapChain',
+            fields=[
+                ('chain_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('proposed', 'Proposed'), ('accepted', 'Accepted'), ('declined', 'Declined'), ('expired', 'Expired')], db_comment='Lifecycle state of the proposed chain', default='proposed', max_length=20)),
+                ('length', models.PositiveSmallIntegerField(db_comment='Number of users (and books) in the cycle')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_comment='When the matcher proposed the chain')),
+            ],
+            options={
+                'db_table': 'swap_chains',
+                'db_table_comment': 'Multi-party swap cycles proposed by the want-graph matcher',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='swap_chains_status_f85da1_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SwapChainLink',
+            fields=[
+                ('link_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('position', models.PositiveSmallIntegerField(db_comment='Order of the link within the chain')),
+                ('book', models.ForeignKey(db_comment='Book changing hands', on_delete=django.db.models.deletion.CASCADE, related_name='swap_chain_links', to='library.book')),
+                ('chain', models.ForeignKey(db_comment='Chain this link belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='links', to='swaps.swapchain')),
+                ('giver', models.ForeignKey(db_comment='User handing over the book', on_delete=django.db.models.deletion.CASCADE, related_name='swap_chain_gives', to=settings.AUTH_USER_MODEL)),
+                ('receiver', models.ForeignKey(db_comment='User who wants the book', on_delete=django.db.models.deletion.CASCADE, related_name='swap_chain_receives', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'swap_chain_links',
+                'db_table_comment': 'Individual book handovers making up a swap chain',
+                'ordering': ['position'],
+                'indexes': [models.Index(fields=['giver'], name='swap_chain__giver_i_3b7e2b_idx'), models.Index(fields=['receiver'], name='swap_chain__receive_c66223_idx')],
+                'unique_together': {('chain', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swaps', '0013_swapchain_swapchainlink'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='swap',
+            name='initiator_confirmed',
+            field=models.BooleanField(db_comment='Whether the initiator confirmed the swap', default=False),
+        ),
+        migrations.AddField(
+            model_name='swap',
+            name='initiator_verified',
+            field=models.BooleanField(db_comment="Whether the initiator scanned the receiver's QR code at the meetup", default=False),
+        ),
+        migrations.AddField(
+            model_name='swap',
+            name='receiver_confirmed',
+            field=models.BooleanField(db_comment='Whether the receiver confirmed the swap', default=False),
+        ),
+        migrations.AddField(
+            model_name='swap',
+            name='receiver_verified',
+            field=models.BooleanField(db_comment="Whether the receiver scanned the initiator's QR code at the meetup", default=False),
+        ),
+    ]
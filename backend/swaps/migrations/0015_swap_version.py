@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swaps', '0014_swap_confirmation_flags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='swap',
+            name='version',
+            field=models.PositiveIntegerField(db_comment='Incremented on every status change for optimistic locking', default=0),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 23:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_book_locked_until_index'),
+        ('swaps', '0015_swap_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='swap',
+            name='return_overdue_notified_at',
+            field=models.DateTimeField(blank=True, db_comment='When the parties were notified that the return deadline passed', null=True),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('swap_proposed', 'Swap Proposed'), ('swap_accepted', 'Swap Accepted'), ('swap_confirmed', 'Swap Confirmed'), ('swap_completed', 'Swap Completed'), ('swap_cancelled', 'Swap Cancelled'), ('message_received', 'Message Received'), ('message_edited', 'Message Edited'), ('message_read', 'Message Read'), ('message_reaction', 'Message Reaction'), ('discussion_deleted', 'Discussion Deleted'), ('note_added', 'Note Added'), ('note_liked', 'Note Liked'), ('discussion_upvoted', 'Discussion Upvoted'), ('discussion_reprinted', 'Discussion Reprinted'), ('swap_return_overdue', 'Swap Return Overdue'), ('extension_expired', 'Extension Expired')], db_comment='Type of notification for UI and tracking', max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='extensionrequest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='extension_requests_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='swap',
+            index=models.Index(condition=models.Q(('is_borrowing', True), ('return_overdue_notified_at__isnull', True), ('status', 'Completed')), fields=['return_deadline'], name='swaps_return_due_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 23:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swaps', '0016_swap_scheduler'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('outbox_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('recipient_id', models.UUIDField(db_comment='User whose notification group receives the push')),
+                ('payload', models.JSONField(db_comment='Notification event sent to the websocket consumer')),
+                ('attempts', models.PositiveSmallIntegerField(db_comment='Failed delivery attempts', default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_comment='When the push was queued')),
+                ('delivered_at', models.DateTimeField(blank=True, db_comment='When the dispatcher sent the push to the channel layer', null=True)),
+            ],
+            options={
+                'db_table': 'notification_outbox',
+                'db_table_comment': 'Transactional outbox of websocket notification pushes',
+                'indexes': [models.Index(condition=models.Q(('delivered_at__isnull', True)), fields=['outbox_id'], name='notification_outbox_pending'), models.Index(fields=['delivered_at'], name='notificatio_deliver_a87f2b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2 on 2026-10-18 23:55
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copies of what backend.swaps.notification_partitions did when this migration was written
+DEFAULT_PARTITION = 'notifications_default'
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def create_partition(cursor, start):
+    # Partitions are created while the default partition is still empty, so no rows need moving
+    cursor.execute(
+        f"CREATE TABLE notifications_p{start.year:04d}_{start.month:02d} PARTITION OF notifications "
+        "FOR VALUES FROM (%s) TO (%s)",
+        [start, next_month(start)]
+    )
+
+
+def _rebuild_notifications(schema_editor, partitioned):
+    """
+    Recreate the notifications table, copying its rows, indexes and foreign keys
+
+    Index and constraint names are read from the catalog and replayed unchanged,
+    so the migration state Django keeps for the model stays valid.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'notifications'::regclass)"
+        )
+        if cursor.fetchone()[0] == partitioned:
+            return
+
+        cursor.execute(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+            "WHERE indrelid = 'notifications'::regclass AND NOT indisprimary"
+        )
+        # Indexes on a partitioned parent are reported as ON ONLY, which would skip the partitions
+        index_definitions = [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'notifications'::regclass AND contype = 'f'"
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute("SELECT obj_description('notifications'::regclass, 'pg_class')")
+        table_comment = cursor.fetchone()[0]
+
+        cursor.execute("ALTER TABLE notifications RENAME TO notifications_old")
+        cursor.execute("ALTER TABLE notifications_old RENAME CONSTRAINT notifications_pkey TO notifications_old_pkey")
+
+        if partitioned:
+            cursor.execute(
+                "CREATE TABLE notifications (LIKE notifications_old INCLUDING DEFAULTS INCLUDING COMMENTS) "
+                "PARTITION BY RANGE (created_at)"
+            )
+            # Unique constraints on a partitioned table must include the partition key
+            cursor.execute(
+                "ALTER TABLE notifications ADD CONSTRAINT notifications_pkey PRIMARY KEY (notification_id, created_at)"
+            )
+            cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF notifications DEFAULT")
+            cursor.execute("SELECT min(created_at) FROM notifications_old")
+            now = timezone.now()
+            start = month_start(cursor.fetchone()[0] or now)
+            end = next_month(next_month(next_month(month_start(now))))
+            while start < end:
+                create_partition(cursor, start)
+                start = next_month(start)
+        else:
+            cursor.execute("CREATE TABLE notifications (LIKE notifications_old INCLUDING DEFAULTS INCLUDING COMMENTS)")
+            cursor.execute("ALTER TABLE notifications ADD CONSTRAINT notifications_pkey PRIMARY KEY (notification_id)")
+
+        cursor.execute("INSERT INTO notifications SELECT * FROM notifications_old")
+        cursor.execute("DROP TABLE notifications_old CASCADE")
+
+        for definition in index_definitions:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE notifications ADD CONSTRAINT "{name}" {definition}')
+        if table_comment:
+            cursor.execute("COMMENT ON TABLE notifications IS %s", [table_comment])
+
+
+def partition_notifications(apps, schema_editor):
+    _rebuild_notifications(schema_editor, partitioned=True)
+
+
+def unpartition_notifications(apps, schema_editor):
+    _rebuild_notifications(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swaps', '0017_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notificatio_user_id_a4dd5c_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at'], name='notifications_user_unread_idx'),
+        ),
+        migrations.RunPython(partition_notifications, unpartition_notifications),
+    ]
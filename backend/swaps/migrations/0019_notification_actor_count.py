@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swaps', '0018_partition_notifications'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(db_comment='Number of events coalesced into this notification (e.g. upvotes on one discussion)', default=1),
+        ),
+    ]
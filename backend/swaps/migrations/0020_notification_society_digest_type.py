@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swaps', '0019_notification_actor_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('swap_proposed', 'Swap Proposed'), ('swap_accepted', 'Swap Accepted'), ('swap_confirmed', 'Swap Confirmed'), ('swap_completed', 'Swap Completed'), ('swap_cancelled', 'Swap Cancelled'), ('message_received', 'Message Received'), ('message_edited', 'Message Edited'), ('message_read', 'Message Read'), ('message_reaction', 'Message Reaction'), ('discussion_deleted', 'Discussion Deleted'), ('note_added', 'Note Added'), ('note_liked', 'Note Liked'), ('discussion_upvoted', 'Discussion Upvoted'), ('discussion_reprinted', 'Discussion Reprinted'), ('swap_return_overdue', 'Swap Return Overdue'), ('extension_expired', 'Extension Expired'), ('society_digest', 'Society Digest')], db_comment='Type of notification for UI and tracking', max_length=50),
+        ),
+    ]
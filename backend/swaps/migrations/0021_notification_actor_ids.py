@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swaps', '0020_notification_society_digest_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_ids',
+            field=models.JSONField(blank=True, db_comment='IDs of the distinct users coalesced into this notification, merged with later events', default=list),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(db_comment='Number of distinct users whose events were coalesced into this notification', default=1),
+        ),
+    ]
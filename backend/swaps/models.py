@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connection, models
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
@@ -6,6 +6,7 @@ from backend.users.models import CustomUser
 #from backend.library.models import Book
 from django.conf import settings
 from django.utils import timezone
+from .swap_list_cache import invalidate_swap_lists
 
 
 def validate_coords(value):
@@ -250,10 +251,35 @@ class Swap(models.Model):
         default=False,
         db_comment='True if this is a borrowing swap (temporary), False if permanent exchange'
     )
+    return_overdue_notified_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_comment='When the parties were notified that the return deadline passed'
+    )
     location_verified = models.BooleanField(
         default=False,
         db_comment='Whether both parties are at the meetup location'
     )
+    initiator_confirmed = models.BooleanField(
+        default=False,
+        db_comment='Whether the initiator confirmed the swap'
+    )
+    receiver_confirmed = models.BooleanField(
+        default=False,
+        db_comment='Whether the receiver confirmed the swap'
+    )
+    initiator_verified = models.BooleanField(
+        default=False,
+        db_comment="Whether the initiator scanned the receiver's QR code at the meetup"
+    )
+    receiver_verified = models.BooleanField(
+        default=False,
+        db_comment="Whether the receiver scanned the initiator's QR code at the meetup"
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        db_comment='Incremented on every status change for optimistic locking'
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         db_comment='When swap was created'
@@ -271,6 +297,12 @@ class Swap(models.Model):
             models.Index(fields=['receiver']),
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
+            # Borrowing swaps still waiting for the overdue check, for the scheduler
+            models.Index(
+                fields=['return_deadline'],
+                name='swaps_return_due_idx',
+                condition=models.Q(is_borrowing=True, status='Completed', return_overdue_notified_at__isnull=True)
+            ),
         ]
 
     def __str__(self):
@@ -280,26 +312,102 @@ class Swap(models.Model):
 
     def clean(self):
         """Validate swap constraints."""
-        if self.initiator == self.receiver:
+        if self.initiator_id and self.initiator_id == self.receiver_id:
             raise ValidationError("Initiator and receiver cannot be the same user.")
-        if self.initiator_book and self.initiator and self.initiator_book.user != self.initiator:
+        if self.initiator_book and self.initiator_id and self.initiator_book.user_id != self.initiator_id:
             raise ValidationError("Initiator book must belong to initiator.")
-        if self.receiver_book and self.receiver and self.receiver_book.user != self.receiver:
+        if self.receiver_book and self.receiver_id and self.receiver_book.user_id != self.receiver_id:
             raise ValidationError("Receiver book must belong to receiver.")
 
     def set_status(self, new_status):
         """Update status with valid transitions."""
-        valid_transitions = {
-            'Requested': ['Accepted', 'Cancelled'],
-            'Accepted': ['Confirmed', 'Cancelled'],
-            'Confirmed': ['Completed', 'Cancelled'],
-            'Completed': [],
-            'Cancelled': []
-        }
-        if new_status not in valid_transitions[self.status]:
-            raise ValidationError(f"Invalid status transition: {self.status} to {new_status}")
-        self.status = new_status
-        self.save()
+        from .transitions import transition_swap
+        transition_swap(self, new_status)
+
+    def _participant_role(self, user):
+        if user.pk == self.initiator_id:
+            return 'initiator', 'receiver'
+        if user.pk == self.receiver_id:
+            return 'receiver', 'initiator'
+        raise ValidationError("User is not part of this swap.")
+
+    def record_confirmation(self, user):
+        """
+        Record a participant's confirmation and advance the status in one statement.
+
+        The flag, the status and the completion decision are applied by a single
+        conditional UPDATE ... RETURNING, so concurrent confirmations can neither
+        lose a flag nor both miss (or both take) the completion.
+
+        Returns the new status ('Confirmed' or 'Completed'), or None if the user
+        already confirmed or the swap is not awaiting confirmation.
+        """
+        own, other = self._participant_role(user)
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE swaps
+                SET {own}_confirmed = TRUE,
+                    status = CASE WHEN {other}_confirmed THEN 'Completed' ELSE 'Confirmed' END,
+                    version = version + 1,
+                    updated_at = %s
+                WHERE swap_id = %s
+                  AND status IN ('Accepted', 'Confirmed')
+                  AND NOT {own}_confirmed
+                RETURNING status, version, {other}_confirmed
+                """,
+                [now, self.swap_id]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        self.status, self.version, other_confirmed = row
+        invalidate_swap_lists(self.initiator_id, self.receiver_id)
+        setattr(self, f'{own}_confirmed', True)
+        setattr(self, f'{other}_confirmed', other_confirmed)
+        self.updated_at = now
+        return self.status
+
+    def record_verification(self, user):
+        """
+        Record that a participant verified the other party's QR code at the meetup.
+
+        Like record_confirmation, the flag and the move to 'Confirmed' once both
+        parties have verified happen in a single conditional UPDATE ... RETURNING.
+
+        Returns the new status ('Accepted' or 'Confirmed'), or None if the user
+        already verified or the swap is not in the Accepted state.
+        """
+        own, other = self._participant_role(user)
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE swaps
+                SET {own}_verified = TRUE,
+                    location_verified = {other}_verified,
+                    status = CASE WHEN {other}_verified THEN 'Confirmed' ELSE status END,
+                    version = version + 1,
+                    updated_at = %s
+                WHERE swap_id = %s
+                  AND status = 'Accepted'
+                  AND NOT {own}_verified
+                RETURNING status, version, {other}_verified
+                """,
+                [now, self.swap_id]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        self.status, self.version, other_verified = row
+        if self.status == 'Confirmed':
+            invalidate_swap_lists(self.initiator_id, self.receiver_id)
+        setattr(self, f'{own}_verified', True)
+        setattr(self, f'{other}_verified', other_verified)
+        self.location_verified = other_verified
+        self.updated_at = now
+        return self.status
 
     def calculate_midpoint(self):
         """Calculate midpoint between initiator and receiver locations."""
@@ -311,11 +419,94 @@ class Swap(models.Model):
         return Location.calculate_midpoint(coord1, coord2)
 
     def save(self, *args, **kwargs):
-        """Validate before saving."""
-        self.clean()
+        """Validate before creating; ownership legitimately changes once a swap completes."""
+        if self._state.adding:
+            self.clean()
         super().save(*args, **kwargs)
 
 
+class SwapChain(models.Model):
+    """
+    A proposed multi-party swap: a cycle of users where each receives a book they want
+    from the next user in the chain. Produced by the matcher in swaps/matching.py.
+    """
+    STATUS_CHOICES = [
+        ('proposed', 'Proposed'),
+        ('accepted', 'Accepted'),
+        ('declined', 'Declined'),
+        ('expired', 'Expired')
+    ]
+
+    chain_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='proposed',
+        db_comment='Lifecycle state of the proposed chain'
+    )
+    length = models.PositiveSmallIntegerField(
+        db_comment='Number of users (and books) in the cycle'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_comment='When the matcher proposed the chain'
+    )
+
+    class Meta:
+        db_table = 'swap_chains'
+        db_table_comment = 'Multi-party swap cycles proposed by the want-graph matcher'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Swap chain {self.chain_id} ({self.length} users)"
+
+
+class SwapChainLink(models.Model):
+    link_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    chain = models.ForeignKey(
+        SwapChain,
+        related_name='links',
+        on_delete=models.CASCADE,
+        db_comment='Chain this link belongs to'
+    )
+    position = models.PositiveSmallIntegerField(
+        db_comment='Order of the link within the chain'
+    )
+    giver = models.ForeignKey(
+        CustomUser,
+        related_name='swap_chain_gives',
+        on_delete=models.CASCADE,
+        db_comment='User handing over the book'
+    )
+    receiver = models.ForeignKey(
+        CustomUser,
+        related_name='swap_chain_receives',
+        on_delete=models.CASCADE,
+        db_comment='User who wants the book'
+    )
+    book = models.ForeignKey(
+        'library.Book',
+        related_name='swap_chain_links',
+        on_delete=models.CASCADE,
+        db_comment='Book changing hands'
+    )
+
+    class Meta:
+        db_table = 'swap_chain_links'
+        db_table_comment = 'Individual book handovers making up a swap chain'
+        ordering = ['position']
+        unique_together = (('chain', 'position'),)
+        indexes = [
+            models.Index(fields=['giver']),
+            models.Index(fields=['receiver']),
+        ]
+
+    def __str__(self):
+        return f"{self.giver_id} → {self.receiver_id}: {self.book_id}"
+
+
 class Share(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -415,6 +606,15 @@ class Share(models.Model):
         self.clean()
         super().save(*args, **kwargs)
 
+class NotificationQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        from .unread_counts import adjust_unread_counts, count_new_notifications
+
+        created = super().bulk_create(objs, *args, **kwargs)
+        adjust_unread_counts(count_new_notifications(created))
+        return created
+
+
 class Notification(models.Model):
     TYPE_CHOICES = [
         ('swap_proposed', 'Swap Proposed'),
@@ -431,6 +631,9 @@ class Notification(models.Model):
         ('note_liked', 'Note Liked'),
         ('discussion_upvoted', 'Discussion Upvoted'),
         ('discussion_reprinted', 'Discussion Reprinted'), 
+        ('swap_return_overdue', 'Swap Return Overdue'),
+        ('extension_expired', 'Extension Expired'),
+        ('society_digest', 'Society Digest'),
     ]
 
     notification_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -483,6 +686,15 @@ class Notification(models.Model):
         default=False,
         db_comment='Tracks archived state'
     )
+    actor_count = models.PositiveIntegerField(
+        default=1,
+        db_comment='Number of distinct users whose events were coalesced into this notification'
+    )
+    actor_ids = models.JSONField(
+        default=list,
+        blank=True,
+        db_comment='IDs of the distinct users coalesced into this notification, merged with later events'
+    )
     delivered_at = models.DateTimeField(
         blank=True,
         null=True,
@@ -496,17 +708,79 @@ class Notification(models.Model):
     class Meta:
         db_table = 'notifications'
         db_table_comment = 'Sends alerts for swaps, messages, and other events'
+        # On PostgreSQL the table is range partitioned by month on created_at (see
+        # notification_partitions); the primary key there is (notification_id, created_at)
         indexes = [
-            models.Index(fields=['user', 'is_read']),
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notifications_user_unread_idx'),
             models.Index(fields=['created_at']),
             models.Index(fields=['swap']),
             models.Index(fields=['content_type', 'content_id']),
         ]
 
+    objects = NotificationQuerySet.as_manager()
+
     def __str__(self):
         username = self.user.username if self.user else 'Anonymous'
         return f"{username}: {self.type} notification"
+
+    def save(self, *args, **kwargs):
+        """Count new unread notifications towards the recipient's unread counter."""
+        from .unread_counts import adjust_unread_counts, count_new_notifications
+
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            adjust_unread_counts(count_new_notifications([self]))
+
+    def delete(self, *args, **kwargs):
+        from .unread_counts import adjust_unread_counts
+
+        result = super().delete(*args, **kwargs)
+        if not self.is_read:
+            adjust_unread_counts({self.user_id: -1})
+        return result
     
+class NotificationOutbox(models.Model):
+    """
+    Websocket pushes written in the same transaction as the event that caused them.
+    A dispatcher process delivers undelivered rows, so rolled-back events never push.
+    """
+    outbox_id = models.BigAutoField(primary_key=True)
+    recipient_id = models.UUIDField(
+        db_comment='User whose notification group receives the push'
+    )
+    payload = models.JSONField(
+        db_comment='Notification event sent to the websocket consumer'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        db_comment='Failed delivery attempts'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_comment='When the push was queued'
+    )
+    delivered_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_comment='When the dispatcher sent the push to the channel layer'
+    )
+
+    class Meta:
+        db_table = 'notification_outbox'
+        db_table_comment = 'Transactional outbox of websocket notification pushes'
+        indexes = [
+            models.Index(
+                fields=['outbox_id'],
+                name='notification_outbox_pending',
+                condition=models.Q(delivered_at__isnull=True)
+            ),
+            models.Index(fields=['delivered_at']),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.outbox_id} for {self.recipient_id}"
+
 class Exchange(models.Model):
     """
     Tracks the actual exchange event of books between users after a swap is confirmed.
@@ -583,16 +857,11 @@ class Exchange(models.Model):
         
         # If both users confirmed, update the swap status to completed
         if self.is_complete():
+            from .transitions import transfer_books
             self.swap.set_status('Completed')
             
             # Update book ownership
-            if self.swap.initiator_book and self.swap.receiver:
-                self.swap.initiator_book.owner = self.swap.receiver
-                self.swap.initiator_book.save()
-                
-            if self.swap.receiver_book and self.swap.initiator:
-                self.swap.receiver_book.owner = self.swap.initiator
-                self.swap.receiver_book.save()
+            transfer_books(self.swap)
 
 
 class ExtensionRequest(models.Model):
@@ -654,6 +923,11 @@ class ExtensionRequest(models.Model):
             models.Index(fields=['requester']),
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
+            models.Index(
+                fields=['created_at'],
+                name='extension_requests_pending_idx',
+                condition=models.Q(status='pending')
+            ),
         ]
 
     def __str__(self):
@@ -672,7 +946,12 @@ class ExtensionRequest(models.Model):
         if self.swap.return_deadline:
             self.swap.return_deadline += timedelta(days=self.days_requested)
             self.swap.extension_approved = True
-            self.swap.save()
+            # Re-arm the overdue notification for the new deadline
+            self.swap.return_overdue_notified_at = None
+            self.swap.save(update_fields=[
+                'return_deadline', 'extension_approved', 'return_overdue_notified_at', 'updated_at'
+            ])
+            invalidate_swap_lists(self.swap.initiator_id, self.swap.receiver_id)
 
     def deny(self, owner_response=None):
         """Deny the extension request"""
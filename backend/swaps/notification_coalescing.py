@@ -0,0 +1,227 @@
+"""
+Coalescing of high-volume notifications (upvotes, likes, notes)
+
+Events are not written as they happen. Each one adds its actor to a Redis set
+per (recipient, type, content), and the scheduler flushes buffers older than
+NOTIFICATION_COALESCE_WINDOW into a single notification with the number of
+distinct actors ("dana and 41 others upvoted ..."), so toggling an upvote off
+and on again counts once. An unread notification for the same content from
+the last day is updated instead of adding another row, merging its actors.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from backend.utils.websocket import queue_notifications
+
+logger = logging.getLogger(__name__)
+
+COALESCE_KEY = 'notif_coalesce:{}:{}:{}:{}'
+# Set of the distinct actor IDs of a buffer
+ACTORS_KEY = '{}:actors'
+PENDING_KEY = 'notif_coalesce:pending'
+# Buffers the flush never reached are dropped eventually instead of piling up
+BUFFER_TTL = 60 * 60 * 24
+# Actor IDs passed to one script call, well below Lua's unpack limit
+ACTOR_CHUNK_SIZE = 1000
+# Unread notifications younger than this absorb new events for the same content
+MERGE_WINDOW = timedelta(days=1)
+
+MESSAGES = {
+    'discussion_upvoted': 'upvoted your discussion: {}',
+    'note_liked': 'liked your comment on {}',
+    'note_added': 'commented on your discussion: {}',
+}
+
+# Add actors (ARGV[5] onwards) to a buffer and schedule it by the time of its first event
+BUFFER_SCRIPT = """
+redis.call('SADD', KEYS[3], unpack(ARGV, 5))
+redis.call('HSET', KEYS[1], 'actor', ARGV[1], 'subject', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+redis.call('ZADD', KEYS[2], 'NX', ARGV[4], KEYS[1])
+return 1
+"""
+
+# Atomically take up to ARGV[2] buffers whose first event is at or before ARGV[1]
+POP_SCRIPT = """
+local keys = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local result = {}
+for _, key in ipairs(keys) do
+    redis.call('ZREM', KEYS[1], key)
+    local values = redis.call('HMGET', key, 'actor', 'subject')
+    local actors = redis.call('SMEMBERS', key .. ':actors')
+    redis.call('DEL', key, key .. ':actors')
+    if values[1] then
+        table.insert(result, {key, values[1], values[2], actors})
+    end
+end
+return result
+"""
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def coalesced_message(notification_type, actor, count, subject):
+    action = MESSAGES[notification_type].format(subject)
+    if count <= 1:
+        return f"{actor} {action}"[:500]
+    others = count - 1
+    return f"{actor} and {others} {'other' if others == 1 else 'others'} {action}"[:500]
+
+
+def _buffer(redis, key, actor_ids, actor, subject, score):
+    actor_ids = list(actor_ids)
+    for start in range(0, len(actor_ids), ACTOR_CHUNK_SIZE):
+        redis.eval(
+            BUFFER_SCRIPT, 3, key, PENDING_KEY, ACTORS_KEY.format(key),
+            actor, subject, BUFFER_TTL, score, *actor_ids[start:start + ACTOR_CHUNK_SIZE]
+        )
+
+
+def buffer_notification(user_id, notification_type, content_type, content_id, actor_id, actor, subject):
+    """
+    Record one coalescable event once the current transaction commits
+
+    Args:
+        user_id: Recipient of the notification
+        notification_type: One of the MESSAGES types
+        content_type: Type of the content events are grouped by
+        content_id: ID of the content events are grouped by
+        actor_id: ID of the user who triggered the event; each user is counted once
+        actor: Username of the user who triggered the event
+        subject: Text completing the message, such as the discussion title
+    """
+    def apply():
+        key = COALESCE_KEY.format(user_id, notification_type, content_type, content_id)
+        try:
+            _buffer(_redis(), key, [str(actor_id)], actor, subject, time.time())
+        except Exception as e:
+            # Without Redis the event is written straight away rather than lost
+            logger.warning(f"Notification buffer unavailable, writing directly: {e}")
+            write_coalesced_notifications([
+                (str(user_id), notification_type, content_type, str(content_id), {str(actor_id)}, actor, subject)
+            ])
+
+    transaction.on_commit(apply)
+
+
+def write_coalesced_notifications(groups, now=None):
+    """
+    Turn flushed buffers into notifications and queue one push per notification
+
+    Args:
+        groups: (user_id, type, content_type, content_id, actor_ids, actor, subject) tuples,
+            where actor_ids is the set of distinct actor IDs
+
+    Returns:
+        int: Number of notifications created or updated
+    """
+    from .models import Notification
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        existing = {}
+        for notification in Notification.objects.filter(
+            user_id__in={group[0] for group in groups},
+            type__in={group[1] for group in groups},
+            content_id__in={group[3] for group in groups},
+            is_read=False,
+            is_archived=False,
+            created_at__gte=now - MERGE_WINDOW
+        ).order_by('created_at'):
+            key = (str(notification.user_id), notification.type, notification.content_type, str(notification.content_id))
+            existing[key] = notification
+
+        updated, created = [], []
+        for user_id, notification_type, content_type, content_id, actor_ids, actor, subject in groups:
+            notification = existing.get((user_id, notification_type, content_type, content_id))
+            if notification:
+                actor_ids = set(notification.actor_ids) | actor_ids
+                notification.actor_ids = sorted(actor_ids)
+                notification.actor_count = len(actor_ids)
+                notification.message = coalesced_message(notification_type, actor, notification.actor_count, subject)
+                updated.append(notification)
+            else:
+                created.append(Notification(
+                    user_id=user_id,
+                    type=notification_type,
+                    content_type=content_type,
+                    content_id=content_id,
+                    actor_ids=sorted(actor_ids),
+                    actor_count=len(actor_ids),
+                    message=coalesced_message(notification_type, actor, len(actor_ids), subject)
+                ))
+
+        Notification.objects.bulk_update(updated, ['actor_ids', 'actor_count', 'message'])
+        Notification.objects.bulk_create(created)
+        # Clients replace a notification they already show when the same notification_id arrives again
+        queue_notifications([
+            (notification.user_id, {
+                "notification_id": notification.notification_id,
+                "message": notification.message,
+                "type": notification.type,
+                "content_type": notification.content_type,
+                "content_id": notification.content_id,
+            })
+            for notification in updated + created
+        ])
+    return len(updated) + len(created)
+
+
+def flush_coalesced_notifications(now=None, batch_size=500):
+    """
+    Write out every buffer whose first event is older than NOTIFICATION_COALESCE_WINDOW
+
+    When a batch fails, its groups are written one at a time and the ones that
+    still fail are logged and dropped, so one bad group cannot block everyone
+    else's notifications. If every group fails the cause is likely transient
+    (e.g. the database is down): the batch goes back into the buffer to retry.
+
+    Returns:
+        int: Number of notifications created or updated
+    """
+    now = now or timezone.now()
+    cutoff = now.timestamp() - settings.NOTIFICATION_COALESCE_WINDOW
+    redis = _redis()
+    total = 0
+    while True:
+        rows = redis.eval(POP_SCRIPT, 1, PENDING_KEY, cutoff, batch_size)
+        groups = []
+        for key, actor, subject, actor_ids in rows:
+            _, user_id, notification_type, content_type, content_id = key.decode().split(':')
+            groups.append((
+                user_id, notification_type, content_type, content_id,
+                {actor_id.decode() for actor_id in actor_ids}, actor.decode(), subject.decode()
+            ))
+        if groups:
+            try:
+                total += write_coalesced_notifications(groups, now=now)
+            except Exception as e:
+                logger.warning(f"Writing {len(groups)} coalesced notifications failed, retrying one by one: {e}")
+                written = failed = 0
+                for group in groups:
+                    try:
+                        written += write_coalesced_notifications([group], now=now)
+                    except Exception as group_error:
+                        failed += 1
+                        logger.error(
+                            f"Dropping coalesced {group[1]} notification for user {group[0]} "
+                            f"on {group[2]} {group[3]}: {group_error}"
+                        )
+                if failed == len(groups):
+                    # Put the events back so the next run retries them
+                    for user_id, notification_type, content_type, content_id, actor_ids, actor, subject in groups:
+                        key = COALESCE_KEY.format(user_id, notification_type, content_type, content_id)
+                        _buffer(redis, key, actor_ids, actor, subject, cutoff)
+                    raise
+                total += written
+        if len(rows) < batch_size:
+            return total
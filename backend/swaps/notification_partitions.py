@@ -0,0 +1,183 @@
+"""
+Monthly range partitions of the notifications table and their retention
+
+``notifications`` is partitioned by ``created_at`` into ``notifications_pYYYY_MM``
+tables plus ``notifications_default``. Expired months are detached and dropped
+as a whole; only their unread, unarchived rows are carried over into the
+default partition, so retention never runs a large DELETE.
+"""
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'notifications'
+DEFAULT_PARTITION = 'notifications_default'
+PARTITION_NAME = re.compile(r'^notifications_p(\d{4})_(\d{2})$')
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(start):
+    return f"notifications_p{start.year:04d}_{start.month:02d}"
+
+
+def is_partitioned(cursor):
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)",
+        [PARENT_TABLE]
+    )
+    return cursor.fetchone()[0]
+
+
+def list_partitions(cursor):
+    """
+    Monthly partitions currently attached to the notifications table
+
+    Returns:
+        list: (name, range start) tuples ordered by month
+    """
+    cursor.execute(
+        """
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = %s::regclass
+        """,
+        [PARENT_TABLE]
+    )
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(cursor, start):
+    """
+    Create the partition for the month starting at ``start`` if it does not exist
+
+    Rows already routed to the default partition for that month are moved into it.
+    """
+    name = partition_name(start)
+    end = next_month(start)
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+    if cursor.fetchone()[0]:
+        return False
+
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s)",
+        [start, end]
+    )
+    if cursor.fetchone()[0]:
+        # A new range may not overlap rows in the default partition, so move them across
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM (%s) TO (%s)",
+            [start, end]
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved",
+            [start, end]
+        )
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+    else:
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM (%s) TO (%s)",
+            [start, end]
+        )
+    return True
+
+
+def ensure_partitions(months_ahead=2, now=None):
+    """
+    Make sure partitions exist for the current month and ``months_ahead`` months after it
+
+    Returns:
+        int: Number of partitions created
+    """
+    start = month_start(now or timezone.now())
+    created = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            created += create_partition(cursor, start)
+            start = next_month(start)
+    return created
+
+
+def _forget_unread(cursor, table, condition, params):
+    """Counter deltas for unread notifications about to be removed by ``condition``"""
+    cursor.execute(
+        f"SELECT user_id, count(*) FROM {table} WHERE NOT is_read AND ({condition}) GROUP BY user_id",
+        params
+    )
+    return Counter({user_id: -count for user_id, count in cursor.fetchall()})
+
+
+def apply_retention(retention_days=None, now=None, batch_size=5000):
+    """
+    Drop read and archived notifications older than ``retention_days``
+
+    Whole expired months are detached and dropped; unread, unarchived rows in
+    them are kept by moving them into the default partition. Old rows in the
+    default partition are deleted in small batches.
+
+    Returns:
+        dict: Number of partitions dropped and default-partition rows deleted
+    """
+    from .unread_counts import adjust_unread_counts
+
+    if retention_days is None:
+        retention_days = settings.NOTIFICATION_RETENTION_DAYS
+    cutoff = (now or timezone.now()) - timedelta(days=retention_days)
+    expired = 'is_read OR is_archived'
+    dropped = deleted = 0
+
+    with connection.cursor() as cursor:
+        for name, start in list_partitions(cursor):
+            if next_month(start) > cutoff:
+                break
+            with transaction.atomic():
+                cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+                deltas = _forget_unread(cursor, name, expired, [])
+                cursor.execute(
+                    f"INSERT INTO {PARENT_TABLE} SELECT * FROM {name} WHERE NOT ({expired})"
+                )
+                cursor.execute(f"DROP TABLE {name}")
+                adjust_unread_counts(deltas)
+            dropped += 1
+
+        while True:
+            with transaction.atomic():
+                cursor.execute(
+                    f"""
+                    DELETE FROM {DEFAULT_PARTITION} WHERE ctid = ANY(ARRAY(
+                        SELECT ctid FROM {DEFAULT_PARTITION}
+                        WHERE created_at < %s AND ({expired}) LIMIT %s
+                    ))
+                    RETURNING user_id, is_read
+                    """,
+                    [cutoff, batch_size]
+                )
+                rows = cursor.fetchall()
+                unread = Counter(user_id for user_id, is_read in rows if not is_read)
+                adjust_unread_counts({user_id: -count for user_id, count in unread.items()})
+            deleted += len(rows)
+            if len(rows) < batch_size:
+                break
+
+    logger.info(f"Notification retention dropped {dropped} partitions and deleted {deleted} rows")
+    return {'partitions_dropped': dropped, 'rows_deleted': deleted}
@@ -0,0 +1,88 @@
+"""
+Delivery side of the notification outbox
+
+Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several dispatcher
+processes can run at once without pushing the same notification twice.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from backend.utils.websocket import push_notification_batches
+from .unread_counts import get_unread_counts
+
+logger = logging.getLogger(__name__)
+
+# Undelivered rows are retried this many times before the dispatcher gives up on them
+MAX_DELIVERY_ATTEMPTS = 5
+
+
+def dispatch_outbox(batch_size=500):
+    """
+    Deliver one batch of pending outbox rows, grouped into one channel-layer send per recipient
+
+    Returns:
+        int: Number of rows delivered
+    """
+    from .models import NotificationOutbox
+
+    with transaction.atomic():
+        rows = list(
+            NotificationOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(delivered_at__isnull=True, attempts__lt=MAX_DELIVERY_ATTEMPTS)
+            .order_by('outbox_id')[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        batches = defaultdict(list)
+        row_ids = defaultdict(list)
+        for row in rows:
+            batches[row.recipient_id].append(row.payload)
+            row_ids[row.recipient_id].append(row.outbox_id)
+
+        # Clients get their current unread count with every push instead of polling for it
+        failures = push_notification_batches(batches, unread_counts=get_unread_counts(batches))
+        for user_id, error in failures.items():
+            logger.warning(f"Failed to push {len(row_ids[user_id])} notifications to user {user_id}: {error}")
+
+        delivered = [outbox_id for user_id, ids in row_ids.items() if user_id not in failures for outbox_id in ids]
+        failed = [outbox_id for user_id in failures for outbox_id in row_ids[user_id]]
+        NotificationOutbox.objects.filter(outbox_id__in=delivered).update(delivered_at=timezone.now())
+        if failed:
+            NotificationOutbox.objects.filter(outbox_id__in=failed).update(attempts=F('attempts') + 1)
+    return len(delivered)
+
+
+def purge_delivered(older_than=timedelta(days=1)):
+    """
+    Delete delivered rows past the retention window, and rows the dispatcher gave up on
+
+    Rows that failed MAX_DELIVERY_ATTEMPTS times are never retried. They are
+    logged and dropped once past the same window; the notifications themselves
+    stay in the notifications table for clients to fetch.
+
+    Returns:
+        int: Number of rows deleted
+    """
+    from .models import NotificationOutbox
+
+    cutoff = timezone.now() - older_than
+    deleted, _ = NotificationOutbox.objects.filter(delivered_at__lt=cutoff).delete()
+
+    dead = NotificationOutbox.objects.filter(
+        delivered_at__isnull=True, attempts__gte=MAX_DELIVERY_ATTEMPTS, created_at__lt=cutoff
+    )
+    recipients = set(dead.values_list('recipient_id', flat=True).distinct()[:10])
+    dropped, _ = dead.delete()
+    if dropped:
+        logger.error(
+            f"Dropped {dropped} notification pushes that failed {MAX_DELIVERY_ATTEMPTS} delivery attempts "
+            f"(recipients include {', '.join(str(recipient) for recipient in recipients)})"
+        )
+    return deleted + dropped
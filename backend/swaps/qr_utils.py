@@ -3,16 +3,60 @@ QR Code generation and verification utilities for swap system
 """
 import qrcode
 import json
+import logging
 import base64
 import hashlib
+import hmac
 import secrets
+import struct
+import time
+import uuid
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.core.cache import cache
+from django_redis import get_redis_connection
 from cryptography.fernet import Fernet
 from io import BytesIO
-import uuid
+
+logger = logging.getLogger(__name__)
+
+# Compact tokens start with this prefix; anything else is a legacy Fernet token
+QR_TOKEN_PREFIX = 'BS:'
+QR_TOKEN_VERSION = 1
+QR_TOKEN_TTL = 60 * 60 * 24
+QR_TOKEN_TAG_SIZE = 16
+
+# Redis key marking a token's nonce as used; expires together with the token
+QR_NONCE_KEY = 'qr_nonce:{}'
+
+# version, flags, swap_id, user_id, expiry (epoch seconds), nonce
+TOKEN_HEADER = struct.Struct('>BB16s16sI8s')
+# Optional meetup coordinates in microdegrees
+TOKEN_LOCATION = struct.Struct('>ii')
+FLAG_LOCATION = 0x01
+
+
+def encode_token_bytes(data):
+    """Base32 without padding: uppercase letters and digits only, so QR codes use alphanumeric mode"""
+    return base64.b32encode(data).decode().rstrip('=')
+
+
+# RFC 4648 base32 digits mapped onto the digits int(..., 32) understands
+BASE32_TO_INT_DIGITS = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', '0123456789ABCDEFGHIJKLMNOPQRSTUV')
+
+
+def decode_token_bytes(text):
+    """
+    Reverse encode_token_bytes, raising ValueError on malformed input
+
+    The text is parsed as a single base-32 integer, which runs in C unlike
+    base64.b32decode. Stray characters only ever fail the signature check.
+    """
+    size = len(text) * 5 // 8
+    value = int(text.translate(BASE32_TO_INT_DIGITS), 32) >> (len(text) * 5 - size * 8)
+    return value.to_bytes(size, 'big')
 
 
 class QRCodeManager:
@@ -22,6 +66,8 @@ class QRCodeManager:
         # Use Django secret key for encryption
         key = hashlib.sha256(settings.SECRET_KEY.encode()).digest()
         self.cipher = Fernet(base64.urlsafe_b64encode(key))
+        # Separate key for signing compact tokens
+        self.signing_key = hashlib.sha256(b'swap-qr-token:' + settings.SECRET_KEY.encode()).digest()
     
     def generate_swap_qr_code(self, swap_id, user_id, location_coords=None):
         """
@@ -35,51 +81,121 @@ class QRCodeManager:
         Returns:
             dict: Contains qr_code_url, qr_data, and verification_token
         """
-        # Create verification data
-        verification_data = {
-            'swap_id': str(swap_id),
-            'user_id': str(user_id),
-            'timestamp': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(hours=24)).isoformat(),
-            'verification_token': secrets.token_urlsafe(32),
-            'location_coords': location_coords
-        }
-        
-        # Encrypt the data
-        encrypted_data = self.cipher.encrypt(json.dumps(verification_data).encode())
-        qr_data = base64.urlsafe_b64encode(encrypted_data).decode()
+        payload = self.create_swap_qr_payload(swap_id, user_id, location_coords)
+        payload['qr_code_url'] = self.render_qr_code(payload['qr_data'])
+        return payload
+    
+    def create_swap_qr_payload(self, swap_id, user_id, location_coords=None):
+        """
+        Create the signed QR token for a swap without rendering an image
         
-        # Generate QR code image
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
+        Returns:
+            dict: Contains qr_data and verification_token
+        """
+        nonce = secrets.token_bytes(8)
+        flags = FLAG_LOCATION if location_coords else 0
+        message = TOKEN_HEADER.pack(
+            QR_TOKEN_VERSION,
+            flags,
+            uuid.UUID(str(swap_id)).bytes,
+            uuid.UUID(str(user_id)).bytes,
+            int(time.time()) + QR_TOKEN_TTL,
+            nonce
         )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
+        if location_coords:
+            message += TOKEN_LOCATION.pack(
+                round(float(location_coords['latitude']) * 1e6),
+                round(float(location_coords['longitude']) * 1e6)
+            )
         
-        # Create QR code image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to storage
-        img_buffer = BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        
-        # Generate unique filename
-        filename = f"qr_codes/{swap_id}_{user_id}_{uuid.uuid4().hex[:8]}.png"
+        qr_data = QR_TOKEN_PREFIX + encode_token_bytes(message + self._sign(message))
+        return {
+            'qr_data': qr_data,
+            'verification_token': nonce.hex()
+        }
+    
+    def is_compact_token(self, qr_data):
+        """Whether qr_data uses the compact signed format rather than a legacy Fernet token"""
+        return bool(qr_data) and qr_data.startswith(QR_TOKEN_PREFIX)
+    
+    def _sign(self, message):
+        return hmac.digest(self.signing_key, message, 'sha256')[:QR_TOKEN_TAG_SIZE]
+    
+    def _encrypt(self, data):
+        """Fernet-encrypt a JSON-serializable dict (legacy token format)"""
+        encrypted_data = self.cipher.encrypt(json.dumps(data).encode())
+        return base64.urlsafe_b64encode(encrypted_data).decode()
+    
+    def _decrypt(self, token):
+        encrypted_data = base64.urlsafe_b64decode(token.encode())
+        return json.loads(self.cipher.decrypt(encrypted_data).decode())
+    
+    def _decode_compact_token(self, qr_data):
+        """Check the signature of a compact token and unpack its fields (None if tampered)"""
+        raw = decode_token_bytes(qr_data[len(QR_TOKEN_PREFIX):])
+        message, tag = raw[:-QR_TOKEN_TAG_SIZE], raw[-QR_TOKEN_TAG_SIZE:]
+        if len(message) < TOKEN_HEADER.size or not hmac.compare_digest(tag, self._sign(message)):
+            return None
         
-        # Save to storage (S3 or local)
-        file_path = default_storage.save(filename, ContentFile(img_buffer.getvalue()))
-        qr_code_url = default_storage.url(file_path)
+        version, flags, swap_id, user_id, expires_at, nonce = TOKEN_HEADER.unpack_from(message)
+        if version != QR_TOKEN_VERSION:
+            raise ValueError(f'Unsupported token version {version}')
+        location_coords = None
+        if flags & FLAG_LOCATION:
+            latitude, longitude = TOKEN_LOCATION.unpack_from(message, TOKEN_HEADER.size)
+            location_coords = {'latitude': latitude / 1e6, 'longitude': longitude / 1e6}
         
         return {
-            'qr_code_url': qr_code_url,
-            'qr_data': qr_data,
-            'verification_token': verification_data['verification_token']
+            'swap_id': str(uuid.UUID(bytes=swap_id)),
+            'user_id': str(uuid.UUID(bytes=user_id)),
+            'expires_at': expires_at,
+            'verification_token': nonce.hex(),
+            'location_coords': location_coords
         }
     
+    def _decode_legacy_token(self, qr_data):
+        verification_data = self._decrypt(qr_data)
+        verification_data['expires_at'] = datetime.fromisoformat(verification_data['expires_at']).timestamp()
+        return verification_data
+    
+    def render_qr_code(self, qr_data):
+        """
+        Render qr_data as a PNG in storage and return its URL
+        
+        Images are stored under a hash of their content, so the same payload is
+        rendered and uploaded at most once.
+        """
+        digest = hashlib.sha256(qr_data.encode()).hexdigest()
+        cache_key = f"qr_png_{digest}"
+        qr_code_url = cache.get(cache_key)
+        if qr_code_url:
+            return qr_code_url
+        
+        filename = f"qr_codes/{digest}.png"
+        if not default_storage.exists(filename):
+            # Generate QR code image
+            qr = qrcode.QRCode(
+                version=1,
+                error_correction=qrcode.constants.ERROR_CORRECT_L,
+                box_size=10,
+                border=4,
+            )
+            qr.add_data(qr_data)
+            qr.make(fit=True)
+            
+            # Create QR code image
+            img = qr.make_image(fill_color="black", back_color="white")
+            
+            img_buffer = BytesIO()
+            img.save(img_buffer, format='PNG')
+            
+            # Save to storage (S3 or local)
+            filename = default_storage.save(filename, ContentFile(img_buffer.getvalue()))
+        
+        qr_code_url = default_storage.url(filename)
+        cache.set(cache_key, qr_code_url, timeout=60 * 60 * 24)
+        return qr_code_url
+    
     def verify_qr_code(self, qr_data, expected_swap_id, expected_user_id, current_location=None):
         """
         Verify a QR code for swap confirmation
@@ -94,14 +210,26 @@ class QRCodeManager:
             dict: Verification result with success status and details
         """
         try:
-            # Decode and decrypt the data
-            encrypted_data = base64.urlsafe_b64decode(qr_data.encode())
-            decrypted_data = self.cipher.decrypt(encrypted_data)
-            verification_data = json.loads(decrypted_data.decode())
+            if self.is_compact_token(qr_data):
+                verification_data = self._decode_compact_token(qr_data)
+                if verification_data is None:
+                    return {
+                        'success': False,
+                        'error': 'Invalid QR code signature',
+                        'error_code': 'INVALID_SIGNATURE'
+                    }
+            elif getattr(settings, 'QR_ACCEPT_LEGACY_TOKENS', True):
+                # Fernet tokens issued before the compact format stay valid until they expire
+                verification_data = self._decode_legacy_token(qr_data)
+            else:
+                return {
+                    'success': False,
+                    'error': 'Unsupported QR code format',
+                    'error_code': 'UNSUPPORTED_FORMAT'
+                }
             
             # Check expiration
-            expires_at = datetime.fromisoformat(verification_data['expires_at'])
-            if datetime.now() > expires_at:
+            if time.time() > verification_data['expires_at']:
                 return {
                     'success': False,
                     'error': 'QR code has expired',
@@ -151,6 +279,35 @@ class QRCodeManager:
                 'error_code': 'VERIFICATION_ERROR'
             }
     
+    def consume_verification_tokens(self, verifications):
+        """
+        Atomically mark verified tokens as used, one SET NX per token in a single round trip
+        
+        Args:
+            verifications: verification_data dicts returned by verify_qr_code
+            
+        Returns:
+            list: True for each token consumed now, False if it was already used
+        """
+        now = time.time()
+        try:
+            pipe = get_redis_connection('default').pipeline(transaction=False)
+            for data in verifications:
+                ttl = max(int(data['expires_at'] - now), 1)
+                pipe.set(QR_NONCE_KEY.format(data['verification_token']), 1, nx=True, ex=ttl)
+            return [bool(consumed) for consumed in pipe.execute()]
+        except Exception as e:
+            # Recording a verification is idempotent, so a replay only costs a DB round trip
+            logger.warning(f"QR nonce store unavailable, skipping replay check: {e}")
+            return [True] * len(verifications)
+    
+    def release_verification_token(self, verification_data):
+        """Make a consumed token usable again, e.g. after the verification failed to save"""
+        try:
+            get_redis_connection('default').delete(QR_NONCE_KEY.format(verification_data['verification_token']))
+        except Exception as e:
+            logger.warning(f"Failed to release QR nonce: {e}")
+    
     def _calculate_distance(self, coord1, coord2):
         """Calculate distance between two coordinates in kilometers"""
         from math import radians, sin, cos, sqrt, atan2
@@ -178,15 +335,12 @@ class QRCodeManager:
             'expires_at': (datetime.now() + timedelta(minutes=30)).isoformat()
         }
         
-        encrypted_data = self.cipher.encrypt(json.dumps(data).encode())
-        return base64.urlsafe_b64encode(encrypted_data).decode()
+        return self._encrypt(data)
     
     def verify_location_code(self, code, expected_location_id, expected_user_id):
         """Verify a location verification code"""
         try:
-            encrypted_data = base64.urlsafe_b64decode(code.encode())
-            decrypted_data = self.cipher.decrypt(encrypted_data)
-            data = json.loads(decrypted_data.decode())
+            data = self._decrypt(code)
             
             # Check expiration
             expires_at = datetime.fromisoformat(data['expires_at'])
@@ -0,0 +1,161 @@
+"""
+Route-based midpoint calculation for swap meetups
+"""
+import hashlib
+import logging
+
+import httpx
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000
+
+
+def decode_polyline(encoded):
+    """
+    Decode a Google encoded polyline into an (N, 2) array of [lat, lng] pairs
+
+    Args:
+        encoded: Polyline string as returned in ``overview_polyline.points``
+
+    Returns:
+        numpy.ndarray: Float array of shape (N, 2)
+    """
+    values = []
+    index = 0
+    length = len(encoded)
+    while index < length:
+        result = 0
+        shift = 0
+        while True:
+            byte = ord(encoded[index]) - 63
+            index += 1
+            result |= (byte & 0x1f) << shift
+            shift += 5
+            if byte < 0x20:
+                break
+        values.append(~(result >> 1) if result & 1 else result >> 1)
+
+    if not values:
+        return np.empty((0, 2))
+
+    # Values are alternating lat/lng deltas scaled by 1e5
+    deltas = np.asarray(values, dtype=np.int64).reshape(-1, 2)
+    return np.cumsum(deltas, axis=0) / 1e5
+
+
+def segment_lengths(points):
+    """Haversine length in meters of each segment of an (N, 2) lat/lng array"""
+    lat = np.radians(points[:, 0])
+    lng = np.radians(points[:, 1])
+    dlat = np.diff(lat)
+    dlng = np.diff(lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def interpolate_half_distance(points):
+    """
+    Find the point lying exactly halfway along a polyline
+
+    Args:
+        points: (N, 2) array of [lat, lng] pairs
+
+    Returns:
+        dict: Midpoint coordinates, or None for an empty polyline
+    """
+    if len(points) == 0:
+        return None
+    if len(points) == 1:
+        return {'latitude': float(points[0, 0]), 'longitude': float(points[0, 1])}
+
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_lengths(points))))
+    target = cumulative[-1] / 2
+
+    # Index of the segment containing the target distance
+    i = int(np.searchsorted(cumulative, target, side='right')) - 1
+    i = min(max(i, 0), len(points) - 2)
+    seg_length = cumulative[i + 1] - cumulative[i]
+    fraction = (target - cumulative[i]) / seg_length if seg_length > 0 else 0.0
+
+    midpoint = points[i] + fraction * (points[i + 1] - points[i])
+    return {'latitude': float(midpoint[0]), 'longitude': float(midpoint[1])}
+
+
+class RouteMidpointService:
+    """Async service that finds the halfway point along a travel route"""
+
+    directions_url = "https://maps.googleapis.com/maps/api/directions/json"
+
+    # 3 decimals is roughly 110m, close enough to share a route between requests
+    quantize_decimals = 3
+    cache_timeout = 60 * 60 * 24
+
+    def __init__(self, api_key=None, transport=None):
+        self.api_key = api_key if api_key is not None else getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
+        # Allows tests to inject an httpx.MockTransport with recorded responses
+        self.transport = transport
+
+    def _quantize(self, coord):
+        return (
+            round(float(coord['latitude']), self.quantize_decimals),
+            round(float(coord['longitude']), self.quantize_decimals),
+        )
+
+    def _cache_key(self, coord1, coord2, transport_mode):
+        raw = f"{transport_mode}:{self._quantize(coord1)}:{self._quantize(coord2)}"
+        return f"route_polyline_{hashlib.md5(raw.encode()).hexdigest()}"
+
+    async def _fetch_polyline(self, coord1, coord2, transport_mode):
+        """Request a route from the Directions API and return its overview polyline ('' if none)"""
+        lat1, lon1 = self._quantize(coord1)
+        lat2, lon2 = self._quantize(coord2)
+        params = {
+            'origin': f"{lat1},{lon1}",
+            'destination': f"{lat2},{lon2}",
+            'mode': transport_mode,
+            'key': self.api_key
+        }
+        async with httpx.AsyncClient(timeout=10, transport=self.transport) as client:
+            response = await client.get(self.directions_url, params=params)
+            response.raise_for_status()
+            data = response.json()
+
+        if data.get('status') != 'OK' or not data.get('routes'):
+            return ''
+        return data['routes'][0]['overview_polyline']['points']
+
+    async def get_route_midpoint(self, coord1, coord2, transport_mode='driving'):
+        """
+        Get the point halfway along the travel route between two coordinates
+
+        Args:
+            coord1: First user's coordinates
+            coord2: Second user's coordinates
+            transport_mode: Directions API travel mode
+
+        Returns:
+            dict: Midpoint coordinates, or None if no route is available
+        """
+        if not self.api_key:
+            return None
+
+        cache_key = self._cache_key(coord1, coord2, transport_mode)
+        polyline = await cache.aget(cache_key)
+        if polyline is None:
+            try:
+                polyline = await self._fetch_polyline(coord1, coord2, transport_mode)
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                logger.warning(f"Failed to get route-based midpoint: {e}")
+                return None
+            # An empty polyline caches "no route" so it isn't re-requested
+            await cache.aset(cache_key, polyline or '', timeout=self.cache_timeout)
+
+        return interpolate_half_distance(decode_polyline(polyline))
+
+
+# Global instance
+route_midpoint_service = RouteMidpointService()
@@ -0,0 +1,181 @@
+"""
+Periodic jobs for time-based swap state: expired book locks, overdue returns
+and unanswered extension requests, plus the flush of coalesced notifications,
+the cleanup of abandoned chat media uploads and society message digests
+
+Every job claims due rows through a partial index with
+SELECT ... FOR UPDATE SKIP LOCKED in fixed-size batches, so several scheduler
+processes can run side by side and no job scans a whole table.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from backend.chat.media import expire_media_uploads
+from backend.chat.society_fanout import send_society_digests
+from backend.utils.websocket import queue_notifications
+from .notification_coalescing import flush_coalesced_notifications
+
+logger = logging.getLogger(__name__)
+
+# Pending extension requests the owner has not answered within this window expire
+EXTENSION_REQUEST_TTL = timedelta(days=3)
+
+
+def _claim_batch(queryset, batch_size):
+    """Lock up to ``batch_size`` due rows not already claimed by another worker"""
+    return list(queryset.select_for_update(skip_locked=True).order_by()[:batch_size])
+
+
+def _create_notifications(notifications):
+    """Insert notifications and queue their websocket pushes in the current transaction"""
+    from .models import Notification
+
+    Notification.objects.bulk_create(notifications)
+    queue_notifications([
+        (notification.user_id, {
+            "notification_id": notification.notification_id,
+            "message": notification.message,
+            "type": notification.type,
+            "content_type": notification.content_type,
+            "content_id": notification.content_id,
+        })
+        for notification in notifications
+    ])
+
+
+def expire_book_locks(now=None, batch_size=500):
+    """
+    Clear ``Book.locked_until`` once it has passed
+
+    Returns:
+        int: Number of books unlocked
+    """
+    from backend.library.models import Book
+
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            books = _claim_batch(Book.objects.filter(locked_until__lte=now).only('pk'), batch_size)
+            if books:
+                Book.objects.filter(pk__in=[book.pk for book in books]).update(locked_until=None)
+        total += len(books)
+        if len(books) < batch_size:
+            return total
+
+
+def process_overdue_returns(now=None, batch_size=500):
+    """
+    Notify both parties of completed borrowing swaps whose return deadline passed
+
+    Each swap is notified once per deadline; approving an extension re-arms it.
+
+    Returns:
+        int: Number of overdue swaps processed
+    """
+    from .models import Notification, Swap
+
+    now = now or timezone.now()
+    due = Swap.objects.filter(
+        is_borrowing=True,
+        status='Completed',
+        return_overdue_notified_at__isnull=True,
+        return_deadline__lte=now
+    ).only('pk', 'initiator_id', 'receiver_id', 'initiator_book_id')
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            swaps = _claim_batch(due, batch_size)
+            if swaps:
+                Swap.objects.filter(pk__in=[swap.pk for swap in swaps]).update(return_overdue_notified_at=now)
+                _create_notifications([
+                    Notification(
+                        user_id=user_id,
+                        swap_id=swap.pk,
+                        book_id=swap.initiator_book_id,
+                        type='swap_return_overdue',
+                        message=message,
+                        content_type='swap',
+                        content_id=swap.pk
+                    )
+                    for swap in swaps
+                    for user_id, message in (
+                        (swap.receiver_id, "Your borrowed book is overdue. Please return it or request an extension."),
+                        (swap.initiator_id, "A book you lent is past its return deadline."),
+                    )
+                ])
+        total += len(swaps)
+        if len(swaps) < batch_size:
+            return total
+
+
+def expire_extension_requests(now=None, batch_size=500):
+    """
+    Mark pending extension requests older than EXTENSION_REQUEST_TTL as expired
+
+    Returns:
+        int: Number of requests expired
+    """
+    from .models import ExtensionRequest, Notification
+
+    now = now or timezone.now()
+    due = ExtensionRequest.objects.filter(
+        status='pending',
+        created_at__lte=now - EXTENSION_REQUEST_TTL
+    ).only('pk', 'swap_id', 'requester_id')
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            requests = _claim_batch(due, batch_size)
+            if requests:
+                ExtensionRequest.objects.filter(pk__in=[request.pk for request in requests]).update(
+                    status='expired',
+                    responded_at=now
+                )
+                _create_notifications([
+                    Notification(
+                        user_id=request.requester_id,
+                        swap_id=request.swap_id,
+                        type='extension_expired',
+                        message="Your extension request expired without a response.",
+                        content_type='swap',
+                        content_id=request.swap_id
+                    )
+                    for request in requests
+                ])
+        total += len(requests)
+        if len(requests) < batch_size:
+            return total
+
+
+SCHEDULED_JOBS = [
+    ('book_locks', expire_book_locks),
+    ('overdue_returns', process_overdue_returns),
+    ('extension_requests', expire_extension_requests),
+    ('coalesced_notifications', flush_coalesced_notifications),
+    ('media_uploads', expire_media_uploads),
+    ('society_digests', send_society_digests),
+]
+
+
+def run_scheduled_jobs(now=None, batch_size=500):
+    """
+    Run every scheduled job once
+
+    Returns:
+        dict: Rows processed per job name
+    """
+    results = {}
+    for name, job in SCHEDULED_JOBS:
+        try:
+            results[name] = job(now=now, batch_size=batch_size)
+        except Exception as e:
+            # One failing job must not block the others
+            logger.exception(f"Scheduled job {name} failed: {e}")
+            results[name] = None
+    return results
@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from .models import Swap, Location, Notification, Share
+from .models import Swap, Location, Notification, Share, SwapChain, SwapChainLink
+from .transitions import transition_swap
 from backend.users.models import CustomUser, Follows
 from backend.library.models import Book
 from datetime import timedelta
@@ -95,14 +96,20 @@ class SwapCreateSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
-        qr_code_url = self.context.get('qr_code_url')
+        # swap_id and the QR payload are prepared by the view so the swap is inserted once
+        extra = {}
+        if self.context.get('swap_id'):
+            extra['swap_id'] = self.context['swap_id']
         return Swap.objects.create(
             initiator=validated_data['initiator'],
             receiver=validated_data['receiver'],
             initiator_book=validated_data['initiator_book'],
             receiver_book=validated_data.get('receiver_book'),
-            qr_code_url=qr_code_url,
-            status='Requested'
+            qr_code_data=self.context.get('qr_code_data'),
+            is_borrowing=self.context.get('is_borrowing', False),
+            return_deadline=self.context.get('return_deadline'),
+            status='Requested',
+            **extra
         )
 
 class SwapSerializer(serializers.ModelSerializer):
@@ -155,19 +162,18 @@ class SwapAcceptSerializer(serializers.ModelSerializer):
         return data
 
     def update(self, instance, validated_data):
-        instance.status = validated_data.get('status', instance.status)
+        changes = {}
         if 'meetup_location_id' in validated_data:
-            instance.meetup_location = validated_data['meetup_location_id']
+            changes['meetup_location'] = validated_data['meetup_location_id']
         if 'meetup_time' in validated_data:
-            instance.meetup_time = validated_data['meetup_time']
-        instance.save()
-        return instance
+            changes['meetup_time'] = validated_data['meetup_time']
+        return transition_swap(instance, validated_data.get('status', 'Accepted'), **changes)
 
 class SwapConfirmSerializer(serializers.Serializer):
     qr_code_url = serializers.URLField()
 
     def validate_qr_code_url(self, value):
-        if not Swap.objects.filter(qr_code_url=value, status='Accepted').exists():
+        if not Swap.objects.filter(qr_code_url=value, status__in=['Accepted', 'Confirmed']).exists():
             raise serializers.ValidationError("Invalid or inactive QR code.")
         return value
 
@@ -184,6 +190,22 @@ class SwapHistorySerializer(serializers.ModelSerializer):
             'status', 'created_at', 'updated_at'
         ]
 
+class SwapChainLinkSerializer(serializers.ModelSerializer):
+    giver = UserMiniSerializer(read_only=True)
+    receiver = UserMiniSerializer(read_only=True)
+    book = BookMiniSerializer(read_only=True)
+
+    class Meta:
+        model = SwapChainLink
+        fields = ['position', 'giver', 'receiver', 'book']
+
+class SwapChainSerializer(serializers.ModelSerializer):
+    links = SwapChainLinkSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = SwapChain
+        fields = ['chain_id', 'status', 'length', 'links', 'created_at']
+
 class NotificationSerializer(serializers.ModelSerializer):
     book = BookMiniSerializer(read_only=True)
     swap = SwapSerializer(read_only=True)
@@ -194,7 +216,7 @@ class NotificationSerializer(serializers.ModelSerializer):
         model = Notification
         fields = [
             'notification_id', 'user', 'book', 'swap', 'type', 'message',
-            'is_read', 'is_archived', 'delivered_at', 'created_at',
+            'is_read', 'is_archived', 'actor_count', 'delivered_at', 'created_at',
             'book_title', 'swap_id'
         ]
 
@@ -0,0 +1,118 @@
+"""
+Per-user cache of the paginated swap list
+
+Every cached page key contains the user's swap list version. Writes to a swap
+bump the version of both participants once the transaction commits, which
+orphans all of their cached pages and status filters at once, and then warm
+the first page so the swaps tab is served from cache right after a change.
+"""
+import logging
+import time
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+SWAP_LIST_VERSION_KEY = 'swaps_list_version_{}'
+SWAP_LIST_KEY = 'swaps_list_{}_v{}_{}_p{}'
+SWAP_LIST_TIMEOUT = 300
+SWAP_LIST_RELATED_FIELDS = ('initiator', 'receiver', 'initiator_book', 'receiver_book', 'meetup_location')
+
+
+def _initial_version():
+    # Counters restart from the clock, so a counter evicted from the cache never reuses an old version
+    return time.time_ns() // 1000
+
+
+def get_swap_list_version(user_id):
+    key = SWAP_LIST_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = _initial_version()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_swap_list_version(user_id):
+    key = SWAP_LIST_VERSION_KEY.format(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _initial_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def build_swap_list_page(user_id, status, page_number):
+    """
+    Serialize one page of a user's swaps, newest first
+
+    Args:
+        status: Swap status to filter on, or 'all'
+        page_number: 1-based page number
+
+    Returns:
+        dict: count, num_pages and the serialized results
+
+    Raises:
+        django.core.paginator.InvalidPage: If the page does not exist
+    """
+    from .models import Swap
+    from .serializers import SwapSerializer
+
+    swaps = Swap.objects.filter(
+        Q(initiator_id=user_id) | Q(receiver_id=user_id)
+    ).select_related(*SWAP_LIST_RELATED_FIELDS)
+    if status != 'all':
+        swaps = swaps.filter(status=status)
+
+    page = Paginator(swaps.order_by('-created_at'), api_settings.PAGE_SIZE).page(page_number)
+    return {
+        'count': page.paginator.count,
+        'num_pages': page.paginator.num_pages,
+        'results': SwapSerializer(page.object_list, many=True).data,
+    }
+
+
+def get_swap_list_page(user_id, status, page_number):
+    """Cached build_swap_list_page; statuses outside the state machine are not cached"""
+    from .transitions import VALID_TRANSITIONS
+
+    if status != 'all' and status not in VALID_TRANSITIONS:
+        return build_swap_list_page(user_id, status, page_number)
+
+    key = SWAP_LIST_KEY.format(user_id, get_swap_list_version(user_id), status, page_number)
+    data = cache.get(key)
+    if data is None:
+        data = build_swap_list_page(user_id, status, page_number)
+        cache.set(key, data, timeout=SWAP_LIST_TIMEOUT)
+    return data
+
+
+def invalidate_swap_lists(*user_ids):
+    """
+    Bump the swap list version of each user after commit and warm their first page
+
+    Bumping after commit matters: a reader that sees the new version must also
+    see the committed swap, or it would cache the old state under the new key.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id}
+
+    def apply():
+        for user_id in user_ids:
+            try:
+                version = bump_swap_list_version(user_id)
+                cache.set(
+                    SWAP_LIST_KEY.format(user_id, version, 'all', 1),
+                    build_swap_list_page(user_id, 'all', 1),
+                    timeout=SWAP_LIST_TIMEOUT
+                )
+            except Exception as e:
+                logger.warning(f"Failed to refresh the swap list cache of user {user_id}: {e}")
+
+    transaction.on_commit(apply)
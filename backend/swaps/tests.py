@@ -1,3 +1,1145 @@
-from django.test import TestCase
+import itertools
+import random
+import threading
+import time
+import uuid
+from io import StringIO
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
 
-# Create your tests here.
+import httpx
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from channels.layers import get_channel_layer
+from rest_framework.test import APIClient
+
+from backend.discussions.models import Discussion
+from backend.library.models import Book, Bookmark, Favorite
+from backend.users.models import CustomUser, Follows
+from backend.utils.websocket import send_notification_to_user, send_notifications_bulk_sync
+from backend.utils.testing import clear_test_cache
+from .location_utils import location_service, recompute_location_popularity
+from .matching import WantGraph, mark_wants_changed, peek_dirty_users, save_swap_chains
+from .notification_coalescing import PENDING_KEY, coalesced_message, flush_coalesced_notifications
+from .notification_partitions import (
+    DEFAULT_PARTITION, apply_retention, create_partition, ensure_partitions, list_partitions, partition_name
+)
+from .models import Exchange, ExtensionRequest, Location, Notification, NotificationOutbox, Swap, SwapChain
+from .qr_utils import QR_NONCE_KEY, QR_TOKEN_PREFIX, qr_manager
+from .transitions import SwapConflictError, lock_books, transfer_books, transition_swap
+from .outbox import MAX_DELIVERY_ATTEMPTS, dispatch_outbox, purge_delivered
+from .scheduler import run_scheduled_jobs
+from .unread_counts import UNREAD_KEY, get_unread_count, reconcile_unread_counts
+from .route_utils import (
+    RouteMidpointService, decode_polyline, interpolate_half_distance, route_midpoint_service
+)
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Recorded Directions API response (trimmed to the fields the service reads)
+DIRECTIONS_RESPONSE = {
+    'status': 'OK',
+    'routes': [{
+        'summary': 'I-5 N',
+        'overview_polyline': {'points': '_p~iF~ps|U_ulLnnqC_mqNvxq`@'},
+        'legs': [{
+            'distance': {'text': '764 km', 'value': 764312},
+            'start_location': {'lat': 38.5, 'lng': -120.2},
+            'end_location': {'lat': 43.252, 'lng': -126.453},
+        }],
+    }],
+}
+
+ZERO_RESULTS_RESPONSE = {'status': 'ZERO_RESULTS', 'routes': []}
+
+
+class PolylineTests(SimpleTestCase):
+    def test_decode_polyline(self):
+        points = decode_polyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(points.shape, (3, 2))
+        self.assertAlmostEqual(points[0, 0], 38.5)
+        self.assertAlmostEqual(points[0, 1], -120.2)
+        self.assertAlmostEqual(points[2, 0], 43.252)
+        self.assertAlmostEqual(points[2, 1], -126.453)
+
+    def test_decode_empty_polyline(self):
+        self.assertEqual(decode_polyline('').shape, (0, 2))
+        self.assertIsNone(interpolate_half_distance(decode_polyline('')))
+
+    def test_interpolates_inside_segment(self):
+        # Two equal-length segments along the equator, halfway is the middle vertex
+        points = decode_polyline('???_ibE?_ibE')
+        midpoint = interpolate_half_distance(points)
+        self.assertAlmostEqual(midpoint['latitude'], 0.0)
+        self.assertAlmostEqual(midpoint['longitude'], 1.0)
+
+        # A single segment is split at its geometric center, not an endpoint
+        midpoint = interpolate_half_distance(points[[0, 2]])
+        self.assertAlmostEqual(midpoint['longitude'], 1.0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RouteMidpointServiceTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.requests = []
+
+    def _service(self, payload):
+        def handler(request):
+            self.requests.append(request)
+            return httpx.Response(200, json=payload)
+        return RouteMidpointService(api_key='test-key', transport=httpx.MockTransport(handler))
+
+    def test_route_midpoint_from_recorded_response(self):
+        service = self._service(DIRECTIONS_RESPONSE)
+        midpoint = async_to_sync(service.get_route_midpoint)(
+            {'latitude': 38.5, 'longitude': -120.2},
+            {'latitude': 43.252, 'longitude': -126.453}
+        )
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.requests[0].url.params['mode'], 'driving')
+        # The halfway point falls inside the second (longer) segment of the route
+        self.assertTrue(40.7 < midpoint['latitude'] < 43.252)
+        self.assertTrue(-126.453 < midpoint['longitude'] < -120.95)
+
+    def test_routes_are_cached_by_quantized_endpoints(self):
+        service = self._service(DIRECTIONS_RESPONSE)
+        first = async_to_sync(service.get_route_midpoint)(
+            {'latitude': 38.50001, 'longitude': -120.20001},
+            {'latitude': 43.252, 'longitude': -126.453}
+        )
+        second = async_to_sync(service.get_route_midpoint)(
+            {'latitude': 38.50004, 'longitude': -120.19998},
+            {'latitude': 43.25201, 'longitude': -126.453}
+        )
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(first, second)
+
+    def test_no_route_is_cached_and_returns_none(self):
+        service = self._service(ZERO_RESULTS_RESPONSE)
+        coord1 = {'latitude': 1.0, 'longitude': 1.0}
+        coord2 = {'latitude': 2.0, 'longitude': 2.0}
+        self.assertIsNone(async_to_sync(service.get_route_midpoint)(coord1, coord2))
+        self.assertIsNone(async_to_sync(service.get_route_midpoint)(coord1, coord2))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_without_api_key_no_request_is_made(self):
+        service = RouteMidpointService(api_key='')
+        self.assertIsNone(async_to_sync(service.get_route_midpoint)(
+            {'latitude': 1.0, 'longitude': 1.0},
+            {'latitude': 2.0, 'longitude': 2.0}
+        ))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MidpointViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('alice', 'alice@example.com', 'pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_midpoint_falls_back_to_geometric_midpoint(self):
+        with patch.object(route_midpoint_service, 'api_key', None), \
+                patch.object(location_service, 'google_api_key', None):
+            response = self.client.get(reverse('swaps:midpoint'), {
+                'user_lat': 1.0, 'user_lon': 1.0, 'other_lat': 3.0, 'other_lon': 5.0
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['midpoint'], {'latitude': 2.0, 'longitude': 3.0})
+
+    def test_midpoint_requires_coordinates(self):
+        response = self.client.get(reverse('swaps:midpoint'))
+        self.assertEqual(response.status_code, 400)
+
+
+class LocationPopularityTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice', 'alice@example.com', 'pass12345')
+        self.bob = CustomUser.objects.create_user('bob', 'bob@example.com', 'pass12345')
+        self.cafe = Location.objects.create(
+            name='Cafe', type='cafe', city='Nairobi', rating=5.0,
+            coords={'latitude': 1.0, 'longitude': 1.0}
+        )
+        self.library = Location.objects.create(
+            name='Library', type='library', city='Nairobi', rating=3.0,
+            coords={'latitude': 1.1, 'longitude': 1.1}
+        )
+        self.park = Location.objects.create(
+            name='Park', type='park', city='Nairobi',
+            coords={'latitude': 1.2, 'longitude': 1.2}
+        )
+
+    def _swap(self, status, meetup_location, exchange_location=None):
+        swap = Swap.objects.create(
+            initiator=self.alice,
+            receiver=self.bob,
+            initiator_book=Book.objects.create(title='Book', author='Author', user=self.alice),
+            meetup_location=meetup_location,
+            status=status
+        )
+        if exchange_location:
+            Exchange.objects.create(swap=swap, exchange_date=timezone.now(), location=exchange_location)
+        return swap
+
+    def test_recompute_counts_and_smoothed_score(self):
+        self._swap('Completed', self.cafe)
+        self._swap('Confirmed', self.cafe)
+        # Exchange location overrides the planned meetup location
+        self._swap('Completed', self.cafe, exchange_location=self.library)
+        # Pending and cancelled swaps do not count
+        self._swap('Requested', self.library)
+        self._swap('Cancelled', self.library)
+
+        self.assertEqual(recompute_location_popularity(prior_weight=2), 3)
+
+        self.cafe.refresh_from_db()
+        self.library.refresh_from_db()
+        self.park.refresh_from_db()
+        self.assertEqual(self.cafe.usage_count, 2)
+        self.assertEqual(self.library.usage_count, 1)
+        self.assertEqual(self.park.usage_count, 0)
+        # Mean rating is 4.0; unrated, unused locations sit on the prior
+        self.assertAlmostEqual(self.cafe.popularity_score, (2 * 5.0 + 2 * 4.0) / 4)
+        self.assertAlmostEqual(self.library.popularity_score, (1 * 3.0 + 2 * 4.0) / 3, places=4)
+        self.assertAlmostEqual(self.park.popularity_score, 4.0)
+
+        # A second run with no new swaps writes nothing
+        with self.assertNumQueries(3):
+            self.assertEqual(recompute_location_popularity(prior_weight=2), 0)
+
+
+class WantGraphTests(SimpleTestCase):
+    def _graph(self, edges):
+        # edges are (wanter, owner) pairs; each edge gets its own book
+        return WantGraph.from_edges((u, v, f'book-{u}-{v}') for u, v in edges)
+
+    def _user_cycles(self, graph, cycles):
+        return sorted(tuple(graph.user_ids[n] for n in cycle) for cycle in cycles)
+
+    def test_finds_cycles_of_length_two_to_four_once(self):
+        graph = self._graph([
+            ('a', 'b'), ('b', 'a'),                           # pair
+            ('c', 'd'), ('d', 'e'), ('e', 'c'),               # triangle
+            ('f', 'g'), ('g', 'h'), ('h', 'i'), ('i', 'f'),   # 4-cycle
+            ('j', 'k'), ('k', 'l'), ('l', 'm'), ('m', 'n'), ('n', 'j'),  # too long
+        ])
+        cycles = self._user_cycles(graph, graph.find_all_cycles())
+        self.assertEqual(cycles, [('a', 'b'), ('c', 'd', 'e'), ('f', 'g', 'h', 'i')])
+
+    def test_matches_brute_force_on_random_graph(self):
+        rng = random.Random(7)
+        edges = {(rng.randrange(20), rng.randrange(20)) for _ in range(80)}
+        graph = self._graph(edges)
+        index = graph.node_index
+        adjacency = {(index[u], index[v]) for u, v in edges if u != v}
+
+        expected = set()
+        for length in (2, 3, 4):
+            for nodes in itertools.permutations(range(graph.node_count), length):
+                if nodes[0] == min(nodes) and all(
+                    (nodes[i], nodes[(i + 1) % length]) in adjacency for i in range(length)
+                ):
+                    expected.add(nodes)
+
+        found = graph.find_all_cycles(limit_per_node=None)
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), expected)
+
+    def test_cycles_through_users_are_deduplicated(self):
+        graph = self._graph([('a', 'b'), ('b', 'c'), ('c', 'a'), ('x', 'y'), ('y', 'x')])
+        cycles = graph.find_cycles_through(['a', 'b', 'missing'])
+        self.assertEqual(self._user_cycles(graph, cycles), [('a', 'b', 'c')])
+
+    def test_chain_links_follow_wants(self):
+        graph = self._graph([('a', 'b'), ('b', 'c'), ('c', 'a')])
+        cycle = graph.find_all_cycles()[0]
+        for giver, receiver, book in graph.chain_links(cycle):
+            # The receiver wants the giver's book
+            self.assertEqual(book, f'book-{receiver}-{giver}')
+
+
+class SwapChainMatchingTests(TestCase):
+    def setUp(self):
+        clear_test_cache()
+        self.users = [
+            CustomUser.objects.create_user(name, f'{name}@example.com', 'pass12345')
+            for name in ('ann', 'ben', 'cat')
+        ]
+        self.books = [Book.objects.create(title=f'Book {i}', author='Author', user=user)
+                      for i, user in enumerate(self.users)]
+        # ann wants ben's book, ben wants cat's, cat wants ann's
+        Bookmark.objects.create(user=self.users[0], book=self.books[1])
+        Favorite.objects.create(user=self.users[1], book=self.books[2])
+        Bookmark.objects.create(user=self.users[2], book=self.books[0])
+
+    def test_full_run_stores_chain(self):
+        graph = WantGraph.from_database()
+        self.assertEqual(save_swap_chains(graph, graph.find_all_cycles()), 1)
+
+        chain = SwapChain.objects.get()
+        self.assertEqual(chain.length, 3)
+        links = {(link.receiver_id, link.giver_id, link.book_id) for link in chain.links.all()}
+        self.assertIn((self.users[0].user_id, self.users[1].user_id, self.books[1].book_id), links)
+
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        response = client.get(reverse('swaps:swap_chains'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(len(response.data['results'][0]['links']), 3)
+
+    def test_locked_books_are_not_matched(self):
+        Book.objects.filter(pk=self.books[2].pk).update(locked_until=timezone.now() + timedelta(hours=1))
+        graph = WantGraph.from_database()
+        self.assertEqual(graph.find_all_cycles(), [])
+
+    def test_incremental_run_replaces_chains_of_changed_users(self):
+        graph = WantGraph.from_database()
+        save_swap_chains(graph, graph.find_all_cycles())
+
+        Bookmark.objects.filter(user=self.users[2]).update(active=False)
+        graph = WantGraph.from_database()
+        changed = [self.users[2].user_id]
+        save_swap_chains(graph, graph.find_cycles_through(changed), replace_user_ids=changed)
+        self.assertFalse(SwapChain.objects.exists())
+
+    def test_changed_users_stay_queued_until_chains_are_saved(self):
+        clear_test_cache()
+        for user in self.users:
+            mark_wants_changed(user.user_id)
+        with patch('backend.swaps.management.commands.match_swap_chains.save_swap_chains', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                call_command('match_swap_chains', '--incremental', stdout=StringIO())
+        self.assertEqual(len(peek_dirty_users()), 3)
+
+        call_command('match_swap_chains', '--incremental', stdout=StringIO())
+        self.assertEqual(SwapChain.objects.count(), 1)
+        self.assertEqual(peek_dirty_users(), [])
+
+    def tearDown(self):
+        clear_test_cache()
+
+
+class SwapTestMixin:
+    def _create_swap(self, status='Accepted'):
+        self.alice = CustomUser.objects.create_user('alice', 'alice@example.com', 'pass12345')
+        self.bob = CustomUser.objects.create_user('bob', 'bob@example.com', 'pass12345')
+        self.alice_book = Book.objects.create(title='Dune', author='Herbert', user=self.alice)
+        self.bob_book = Book.objects.create(title='Emma', author='Austen', user=self.bob)
+        return Swap.objects.create(
+            initiator=self.alice,
+            receiver=self.bob,
+            initiator_book=self.alice_book,
+            receiver_book=self.bob_book,
+            qr_code_url='https://example.com/qr.png',
+            status=status
+        )
+
+
+@patch('backend.swaps.views.send_notification_to_user')
+class SwapConfirmationTests(SwapTestMixin, TestCase):
+    def setUp(self):
+        self.swap = self._create_swap()
+        self.client = APIClient()
+
+    def _confirm(self, user):
+        self.client.force_authenticate(user)
+        return self.client.patch(
+            reverse('swaps:confirm_swap', args=[self.swap.swap_id]),
+            {'qr_code_url': self.swap.qr_code_url},
+            format='json'
+        )
+
+    def test_both_confirmations_complete_the_swap(self, send):
+        self.assertEqual(self._confirm(self.alice).data['status'], 'Confirmed')
+        self.assertEqual(self._confirm(self.bob).data['status'], 'Completed')
+
+        self.swap.refresh_from_db()
+        self.assertTrue(self.swap.initiator_confirmed and self.swap.receiver_confirmed)
+        self.alice_book.refresh_from_db()
+        self.bob_book.refresh_from_db()
+        self.assertEqual(self.alice_book.user, self.bob)
+        self.assertEqual(self.bob_book.user, self.alice)
+        self.assertEqual(send.call_count, 2)
+
+    def test_repeated_confirmation_is_rejected(self, send):
+        self._confirm(self.alice)
+        response = self._confirm(self.alice)
+        self.assertEqual(response.status_code, 400)
+        self.swap.refresh_from_db()
+        self.assertEqual(self.swap.status, 'Confirmed')
+
+    def test_qr_verification_accumulates_in_database(self, send):
+        self.assertEqual(self.swap.record_verification(self.alice), 'Accepted')
+        self.assertIsNone(Swap.objects.get(pk=self.swap.pk).record_verification(self.alice))
+
+        # A fresh instance sees the first verification, so the second one confirms
+        swap = Swap.objects.get(pk=self.swap.pk)
+        self.assertEqual(swap.record_verification(self.bob), 'Confirmed')
+        swap.refresh_from_db()
+        self.assertTrue(swap.location_verified)
+
+
+class ConcurrentSwapConfirmationTests(SwapTestMixin, TransactionTestCase):
+    def test_concurrent_confirmations_complete_exactly_once(self):
+        swap = self._create_swap()
+        barrier = threading.Barrier(2)
+        results = []
+
+        def confirm(user):
+            try:
+                instance = Swap.objects.get(pk=swap.pk)
+                barrier.wait()
+                with transaction.atomic():
+                    results.append(instance.record_confirmation(user))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=confirm, args=(user,)) for user in (self.alice, self.bob)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), ['Completed', 'Confirmed'])
+        swap.refresh_from_db()
+        self.assertEqual(swap.status, 'Completed')
+
+
+class SwapTransitionTests(SwapTestMixin, TestCase):
+    def setUp(self):
+        self.swap = self._create_swap(status='Requested')
+        lock_books(self.swap, timezone.now() + timedelta(hours=24))
+
+    def test_transition_is_a_single_update(self):
+        with self.assertNumQueries(1):
+            transition_swap(self.swap, 'Accepted', meetup_time=timezone.now() + timedelta(days=1))
+        self.swap.refresh_from_db()
+        self.assertEqual((self.swap.status, self.swap.version), ('Accepted', 1))
+
+    def test_invalid_transition_is_rejected_without_queries(self):
+        with self.assertNumQueries(0), self.assertRaises(ValidationError):
+            transition_swap(self.swap, 'Completed')
+
+    def test_stale_instance_conflicts(self):
+        stale = Swap.objects.get(pk=self.swap.pk)
+        transition_swap(self.swap, 'Accepted')
+        with self.assertRaises(SwapConflictError):
+            transition_swap(stale, 'Cancelled')
+        self.swap.refresh_from_db()
+        self.assertEqual(self.swap.status, 'Accepted')
+
+    def test_book_ownership_and_locks_in_one_update(self):
+        with self.assertNumQueries(1):
+            transfer_books(self.swap)
+        self.alice_book.refresh_from_db()
+        self.bob_book.refresh_from_db()
+        self.assertEqual((self.alice_book.user, self.alice_book.locked_until), (self.bob, None))
+        self.assertEqual((self.bob_book.user, self.bob_book.locked_until), (self.alice, None))
+
+    def test_save_after_completion_skips_ownership_validation(self):
+        transfer_books(self.swap)
+        swap = Swap.objects.get(pk=self.swap.pk)
+        with self.assertNumQueries(1):
+            swap.save(update_fields=['extension_approved', 'updated_at'])
+
+
+@patch('backend.swaps.views.send_notification_to_user')
+class SwapTransitionViewQueryTests(SwapTestMixin, TestCase):
+    def setUp(self):
+        self.swap = self._create_swap(status='Requested')
+        self.client = APIClient()
+
+    def test_accept_query_count(self, send):
+        self.client.force_authenticate(self.bob)
+        # select swap, update swap, insert notification (+ savepoint pair)
+        with self.assertNumQueries(5):
+            response = self.client.patch(reverse('swaps:accept_swap', args=[self.swap.swap_id]), {}, format='json')
+        self.assertEqual(response.data['status'], 'Accepted')
+
+    def test_cancel_query_count(self, send):
+        self.client.force_authenticate(self.alice)
+        # select swap, update swap, update books, insert notification (+ savepoint pair)
+        with self.assertNumQueries(6):
+            response = self.client.patch(reverse('swaps:cancel_swap', args=[self.swap.swap_id]))
+        self.assertEqual(response.data['status'], 'Cancelled')
+
+    def test_completing_confirmation_query_count(self, send):
+        Swap.objects.filter(pk=self.swap.pk).update(status='Confirmed', initiator_confirmed=True)
+        self.client.force_authenticate(self.bob)
+        # select swap, serializer check, conditional update, books update, bulk notification insert
+        # (+ savepoint pair)
+        with self.assertNumQueries(7):
+            response = self.client.patch(
+                reverse('swaps:confirm_swap', args=[self.swap.swap_id]),
+                {'qr_code_url': self.swap.qr_code_url},
+                format='json'
+            )
+        self.assertEqual(response.data['status'], 'Completed')
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+@patch('backend.swaps.views.send_notification_to_user')
+@patch('backend.swaps.qr_utils.default_storage')
+class DeferredQRCodeTests(SwapTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def _configure_storage(self, storage):
+        saved = set()
+        storage.exists.side_effect = lambda name: name in saved
+        storage.save.side_effect = lambda name, content: saved.add(name) or name
+        storage.url.side_effect = lambda name: f'https://storage.example.com/{name}'
+
+    def test_initiate_swap_stores_payload_without_rendering(self, storage, send):
+        self._configure_storage(storage)
+        swap = self._create_swap()
+        Book.objects.filter(pk__in=[self.alice_book.pk, self.bob_book.pk]).update(available_for_exchange=True)
+        Follows.objects.create(follower=self.alice, followed=self.bob, active=True)
+        self.client.force_authenticate(self.alice)
+        response = self.client.post(reverse('swaps:initiate_swap'), {
+            'initiator_book_id': str(self.alice_book.book_id),
+            'receiver_id': str(self.bob.user_id),
+            'receiver_book_id': str(self.bob_book.book_id),
+            'is_borrowing': True
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        storage.save.assert_not_called()
+
+        created = Swap.objects.exclude(pk=swap.pk).get()
+        self.assertIsNone(created.qr_code_url)
+        self.assertTrue(created.is_borrowing)
+        self.assertTrue(
+            qr_manager.verify_qr_code(created.qr_code_data, created.swap_id, self.alice.user_id)['success']
+        )
+
+    def test_qr_code_rendered_once_on_first_request(self, storage, send):
+        self._configure_storage(storage)
+        swap = self._create_swap(status='Requested')
+        payload = qr_manager.create_swap_qr_payload(swap.swap_id, self.alice.user_id)
+        Swap.objects.filter(pk=swap.pk).update(qr_code_url=None, qr_code_data=payload['qr_data'])
+
+        self.client.force_authenticate(self.bob)
+        first = self.client.get(reverse('swaps:get_qr_code', args=[swap.swap_id]))
+        second = self.client.get(reverse('swaps:get_qr_code', args=[swap.swap_id]))
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data['qr_code_url'], second.data['qr_code_url'])
+        self.assertEqual(storage.save.call_count, 1)
+        swap.refresh_from_db()
+        self.assertEqual(swap.qr_code_url, first.data['qr_code_url'])
+
+    def test_legacy_token_is_reissued_and_png_is_optional(self, storage, send):
+        self._configure_storage(storage)
+        swap = self._create_swap(status='Accepted')
+        Swap.objects.filter(pk=swap.pk).update(qr_code_data=legacy_qr_token(swap.swap_id, self.alice.user_id))
+
+        self.client.force_authenticate(self.bob)
+        response = self.client.get(reverse('swaps:get_qr_code', args=[swap.swap_id]), {'include_png': 'false'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['qr_code_url'])
+        self.assertTrue(response.data['qr_token'].startswith(QR_TOKEN_PREFIX))
+        storage.save.assert_not_called()
+
+        swap.refresh_from_db()
+        self.assertEqual(swap.qr_code_data, response.data['qr_token'])
+        self.assertTrue(qr_manager.verify_qr_code(swap.qr_code_data, swap.swap_id, self.alice.user_id)['success'])
+
+    def test_render_is_keyed_by_content_hash(self, storage, send):
+        self._configure_storage(storage)
+        url = qr_manager.render_qr_code('payload-a')
+        cache.clear()
+        # Same content after the URL cache is lost reuses the stored file
+        self.assertEqual(qr_manager.render_qr_code('payload-a'), url)
+        self.assertNotEqual(qr_manager.render_qr_code('payload-b'), url)
+        self.assertEqual(storage.save.call_count, 2)
+
+
+def legacy_qr_token(swap_id, user_id, expires_at=None):
+    """Fernet token in the format issued before compact tokens"""
+    return qr_manager._encrypt({
+        'swap_id': str(swap_id),
+        'user_id': str(user_id),
+        'timestamp': datetime.now().isoformat(),
+        'expires_at': (expires_at or datetime.now() + timedelta(hours=24)).isoformat(),
+        'verification_token': 'legacy',
+        'location_coords': None
+    })
+
+
+class CompactQRTokenTests(SimpleTestCase):
+    def setUp(self):
+        self.swap_id = uuid.uuid4()
+        self.user_id = uuid.uuid4()
+
+    def test_token_is_small_and_qr_alphanumeric(self):
+        token = qr_manager.create_swap_qr_payload(self.swap_id, self.user_id)['qr_data']
+        self.assertTrue(token.startswith(QR_TOKEN_PREFIX))
+        self.assertLessEqual(len(token), 110)
+        self.assertTrue(set(token) <= set('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:'))
+
+        result = qr_manager.verify_qr_code(token, self.swap_id, self.user_id)
+        self.assertTrue(result['success'])
+        self.assertEqual(result['verification_data']['swap_id'], str(self.swap_id))
+
+    def test_location_round_trips(self):
+        coords = {'latitude': -1.286389, 'longitude': 36.817223}
+        token = qr_manager.create_swap_qr_payload(self.swap_id, self.user_id, coords)['qr_data']
+        self.assertTrue(qr_manager.verify_qr_code(token, self.swap_id, self.user_id, coords)['success'])
+        far = {'latitude': -1.3, 'longitude': 36.9}
+        result = qr_manager.verify_qr_code(token, self.swap_id, self.user_id, far)
+        self.assertEqual(result['error_code'], 'LOCATION_MISMATCH')
+
+    def test_tampered_and_expired_tokens_are_rejected(self):
+        token = qr_manager.create_swap_qr_payload(self.swap_id, self.user_id)['qr_data']
+        # Flip one character of the packed swap id
+        i = len(QR_TOKEN_PREFIX) + 5
+        tampered = token[:i] + ('A' if token[i] != 'A' else 'B') + token[i + 1:]
+        self.assertEqual(qr_manager.verify_qr_code(tampered, self.swap_id, self.user_id)['error_code'], 'INVALID_SIGNATURE')
+        self.assertEqual(qr_manager.verify_qr_code(token, uuid.uuid4(), self.user_id)['error_code'], 'INVALID_SWAP')
+
+        with patch('backend.swaps.qr_utils.time.time', return_value=time.time() + 25 * 3600):
+            self.assertEqual(qr_manager.verify_qr_code(token, self.swap_id, self.user_id)['error_code'], 'EXPIRED')
+
+    def test_legacy_tokens_are_accepted_until_disabled(self):
+        token = legacy_qr_token(self.swap_id, self.user_id)
+        self.assertTrue(qr_manager.verify_qr_code(token, self.swap_id, self.user_id)['success'])
+        expired = legacy_qr_token(self.swap_id, self.user_id, datetime.now() - timedelta(minutes=1))
+        self.assertEqual(qr_manager.verify_qr_code(expired, self.swap_id, self.user_id)['error_code'], 'EXPIRED')
+
+        with self.settings(QR_ACCEPT_LEGACY_TOKENS=False):
+            result = qr_manager.verify_qr_code(token, self.swap_id, self.user_id)
+        self.assertEqual(result['error_code'], 'UNSUPPORTED_FORMAT')
+
+
+@patch('backend.swaps.views.send_notification_to_user')
+class QRReplayProtectionTests(SwapTestMixin, TestCase):
+    def setUp(self):
+        clear_test_cache()
+        self.swap = self._create_swap()
+        self.token = qr_manager.create_swap_qr_payload(self.swap.swap_id, self.alice.user_id)
+        Swap.objects.filter(pk=self.swap.pk).update(qr_code_data=self.token['qr_data'])
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+
+    def tearDown(self):
+        clear_test_cache()
+
+    def _scan(self):
+        return self.client.post(
+            reverse('swaps:verify_qr', args=[self.swap.swap_id]),
+            {'qr_data': self.token['qr_data']},
+            format='json'
+        )
+
+    def test_duplicate_scan_returns_cached_result(self, send):
+        first = self._scan()
+        self.assertEqual(first.data['status'], 'partially_verified')
+        self.assertTrue(get_redis_connection('default').exists(QR_NONCE_KEY.format(self.token['verification_token'])))
+
+        with self.assertNumQueries(0):
+            second = self._scan()
+        self.assertEqual(second.data, first.data)
+
+    def test_consumed_token_without_result_is_rejected(self, send):
+        self._scan()
+        cache.delete_pattern('*qr_scan_result_*')
+        response = self._scan()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['error_code'], 'REPLAYED')
+
+    def test_swap_changed_during_scan_is_a_conflict(self, send):
+        consume = qr_manager.consume_verification_tokens
+
+        def cancel_then_consume(tokens):
+            Swap.objects.filter(pk=self.swap.pk).update(status='Cancelled')
+            return consume(tokens)
+
+        with patch.object(qr_manager, 'consume_verification_tokens', side_effect=cancel_then_consume):
+            response = self._scan()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['error_code'], 'SWAP_CHANGED')
+        self.swap.refresh_from_db()
+        self.assertFalse(self.swap.receiver_verified)
+        self.assertFalse(get_redis_connection('default').exists(QR_NONCE_KEY.format(self.token['verification_token'])))
+
+    def test_batch_verification(self, send):
+        carol = CustomUser.objects.create_user('carol', 'carol@example.com', 'pass12345')
+        carol_swap = Swap.objects.create(
+            initiator=carol,
+            receiver=self.bob,
+            initiator_book=Book.objects.create(title='Ulysses', author='Joyce', user=carol),
+            status='Accepted'
+        )
+        carol_token = qr_manager.create_swap_qr_payload(carol_swap.swap_id, carol.user_id)['qr_data']
+        self._scan()
+
+        response = self.client.post(reverse('swaps:batch_verify_qr'), {'verifications': [
+            {'swap_id': str(self.swap.swap_id), 'qr_data': self.token['qr_data']},
+            {'swap_id': str(carol_swap.swap_id), 'qr_data': carol_token},
+            {'swap_id': str(carol_swap.swap_id), 'qr_data': self.token['qr_data']},
+            {'swap_id': 'not-a-uuid', 'qr_data': carol_token},
+            {'swap_id': str(carol_swap.swap_id), 'qr_data': carol_token},
+        ]}, format='json')
+        results = response.data['results']
+        self.assertEqual(results[0]['status'], 'partially_verified')
+        self.assertEqual(results[1]['status'], 'partially_verified')
+        self.assertEqual(results[2]['error_code'], 'INVALID_SWAP')
+        self.assertEqual(results[3]['status_code'], 400)
+        # The same token twice in one batch gets the first scan's result, not a replay error
+        self.assertEqual(results[4], results[1])
+        carol_swap.refresh_from_db()
+        self.assertTrue(carol_swap.receiver_verified)
+
+
+class SwapSchedulerTests(SwapTestMixin, TestCase):
+    def setUp(self):
+        self.swap = self._create_swap(status='Completed')
+        self.now = timezone.now()
+
+    def _run(self):
+        return run_scheduled_jobs(now=self.now, batch_size=2)
+
+    def test_expired_book_locks_are_cleared(self):
+        Book.objects.filter(pk=self.alice_book.pk).update(locked_until=self.now - timedelta(minutes=1))
+        Book.objects.filter(pk=self.bob_book.pk).update(locked_until=self.now + timedelta(hours=1))
+        self.assertEqual(self._run()['book_locks'], 1)
+        self.alice_book.refresh_from_db()
+        self.bob_book.refresh_from_db()
+        self.assertIsNone(self.alice_book.locked_until)
+        self.assertIsNotNone(self.bob_book.locked_until)
+
+    def test_overdue_return_notified_once_per_deadline(self):
+        Swap.objects.filter(pk=self.swap.pk).update(is_borrowing=True, return_deadline=self.now - timedelta(days=1))
+        self.assertEqual(self._run()['overdue_returns'], 1)
+        self.assertEqual(self._run()['overdue_returns'], 0)
+        self.assertEqual(Notification.objects.filter(type='swap_return_overdue').count(), 2)
+        self.assertEqual(NotificationOutbox.objects.filter(recipient_id__in=[self.alice.pk, self.bob.pk]).count(), 2)
+
+        # An approved extension re-arms the check for the new deadline
+        self.swap.refresh_from_db()
+        extension = ExtensionRequest.objects.create(swap=self.swap, requester=self.bob, days_requested=2, reason='Busy')
+        extension.approve()
+        self.assertEqual(self._run()['overdue_returns'], 0)
+        self.now += timedelta(days=1)
+        self.assertEqual(self._run()['overdue_returns'], 1)
+
+    def test_unanswered_extension_requests_expire(self):
+        old = ExtensionRequest.objects.create(swap=self.swap, requester=self.bob, days_requested=3, reason='Busy')
+        recent = ExtensionRequest.objects.create(swap=self.swap, requester=self.bob, days_requested=3, reason='Busy')
+        ExtensionRequest.objects.filter(pk=old.pk).update(created_at=self.now - timedelta(days=4))
+        self.assertEqual(self._run()['extension_requests'], 1)
+        old.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((old.status, recent.status), ('expired', 'pending'))
+        self.assertTrue(Notification.objects.filter(user=self.bob, type='extension_expired').exists())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.user_id = uuid.uuid4()
+        self.other_id = uuid.uuid4()
+
+    def _notify(self, user_id, message):
+        send_notification_to_user(user_id, {
+            'notification_id': uuid.uuid4(),
+            'message': message,
+            'type': 'swap_proposed',
+            'content_type': 'swap',
+            'content_id': uuid.uuid4()
+        })
+
+    def test_rolled_back_event_is_never_queued(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self._notify(self.user_id, 'Hi')
+                raise RuntimeError
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_dispatch_sends_one_batch_per_recipient(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f"user_{self.user_id}", channel)
+        self._notify(self.user_id, 'First')
+        self._notify(self.user_id, 'Second')
+        self._notify(self.other_id, 'Other')
+
+        self.assertEqual(dispatch_outbox(), 3)
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual(event['type'], 'notification.batch')
+        self.assertEqual([n['message'] for n in event['notifications']], ['First', 'Second'])
+        self.assertEqual(event['notifications'][0]['notification_type'], 'swap_proposed')
+        self.assertEqual(event['unread_count'], 0)
+        self.assertFalse(NotificationOutbox.objects.filter(delivered_at__isnull=True).exists())
+        self.assertEqual(dispatch_outbox(), 0)
+
+    def test_bulk_send_groups_per_recipient_and_reports_failures(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f"user_{self.user_id}", channel)
+        notifications = [(self.user_id, {'message': 'A', 'type': 'swap_proposed'})]
+        notifications += [(uuid.uuid4(), {'message': 'B', 'type': 'swap_proposed'}) for _ in range(200)]
+        notifications.append((self.user_id, {'message': 'C', 'type': 'swap_accepted'}))
+
+        self.assertEqual(send_notifications_bulk_sync(notifications, concurrency=8), {})
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual([n['message'] for n in event['notifications']], ['A', 'C'])
+
+        with patch.object(type(layer), 'group_send', side_effect=ConnectionError('down')):
+            failures = send_notifications_bulk_sync(notifications[:2])
+        self.assertEqual(len(failures), 2)
+
+    @patch('backend.swaps.outbox.push_notification_batches')
+    def test_failed_push_is_retried(self, push):
+        push.side_effect = lambda batches, **kwargs: {user_id: ConnectionError('down') for user_id in batches}
+        self._notify(self.user_id, 'Hi')
+        self.assertEqual(dispatch_outbox(), 0)
+        row = NotificationOutbox.objects.get()
+        self.assertEqual((row.attempts, row.delivered_at), (1, None))
+
+        push.side_effect = lambda batches, **kwargs: {}
+        self.assertEqual(dispatch_outbox(), 1)
+
+    def test_purge_drops_old_delivered_and_dead_rows(self):
+        for message in ('Delivered', 'Dead', 'Retrying', 'Recent dead'):
+            self._notify(self.user_id, message)
+        old = timezone.now() - timedelta(days=2)
+        NotificationOutbox.objects.filter(payload__message='Delivered').update(delivered_at=old)
+        NotificationOutbox.objects.filter(payload__message__in=['Dead', 'Retrying']).update(created_at=old)
+        NotificationOutbox.objects.filter(payload__message__in=['Dead', 'Recent dead']).update(
+            attempts=MAX_DELIVERY_ATTEMPTS
+        )
+
+        with self.assertLogs('backend.swaps.outbox', level='ERROR'):
+            self.assertEqual(purge_delivered(), 2)
+        self.assertEqual(
+            set(NotificationOutbox.objects.values_list('payload__message', flat=True)), {'Retrying', 'Recent dead'}
+        )
+
+
+class UnreadNotificationCounterTests(TestCase):
+    def setUp(self):
+        clear_test_cache()
+        self.user = CustomUser.objects.create_user('dana', 'dana@example.com', 'pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.redis = get_redis_connection('default')
+
+    def tearDown(self):
+        clear_test_cache()
+
+    def _notify(self, is_read=False):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(user=self.user, type='swap_proposed', message='Hi', is_read=is_read)
+
+    def _count(self):
+        return self.client.get(reverse('swaps:unread_notification_count')).data['unread_count']
+
+    def test_counter_is_seeded_then_maintained(self):
+        first = self._notify()
+        self._notify(is_read=True)
+        self.assertEqual(self._count(), 1)
+        self.assertEqual(int(self.redis.get(UNREAD_KEY.format(self.user.user_id))), 1)
+
+        second = self._notify()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('swaps:mark_notification_read', args=[first.notification_id]))
+            # Marking an already read notification does not decrement again
+            self.client.patch(reverse('swaps:mark_notification_read', args=[first.notification_id]))
+        self.assertEqual(self._count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('swaps:bulk_notification_operations'), {
+                'notification_ids': [str(first.notification_id), str(second.notification_id)],
+                'operation': 'mark_unread'
+            }, format='json')
+        self.assertEqual(self._count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('swaps:delete_notification', args=[second.notification_id]))
+        self.assertEqual(self._count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('swaps:mark_all_notifications_read'))
+        self.assertEqual(self._count(), 0)
+
+    def test_bulk_created_notifications_are_counted(self):
+        self.assertEqual(self._count(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.bulk_create([
+                Notification(user=self.user, type='swap_proposed', message=str(i)) for i in range(3)
+            ])
+        self.assertEqual(self._count(), 3)
+
+    def test_reconcile_corrects_drift(self):
+        self._notify()
+        self.assertEqual(self._count(), 1)
+        self.redis.set(UNREAD_KEY.format(self.user.user_id), 7)
+        self.assertEqual(reconcile_unread_counts(), 1)
+        self.assertEqual(self._count(), 1)
+
+
+class NotificationPartitionTests(TestCase):
+    def setUp(self):
+        clear_test_cache()
+        self.user = CustomUser.objects.create_user('erin', 'erin@example.com', 'pass12345')
+        self.now = timezone.now()
+
+    def tearDown(self):
+        clear_test_cache()
+
+    def _notify(self, created_at, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = Notification.objects.create(user=self.user, type='swap_proposed', message='Hi', **fields)
+        # Updating the partition key moves the row into the matching partition
+        Notification.objects.filter(pk=notification.pk).update(created_at=created_at)
+        return notification.pk
+
+    def _partition_of(self, notification_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tableoid::regclass::text FROM notifications WHERE notification_id = %s", [notification_id]
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def test_rows_are_routed_to_monthly_partitions(self):
+        ensure_partitions(months_ahead=1, now=self.now)
+        recent = self._notify(self.now)
+        stray = self._notify(datetime(2020, 3, 5, tzinfo=dt_timezone.utc))
+        self.assertEqual(self._partition_of(recent), partition_name(self.now))
+        self.assertEqual(self._partition_of(stray), DEFAULT_PARTITION)
+
+        # Creating a partition later takes over matching rows from the default partition
+        with connection.cursor() as cursor:
+            self.assertTrue(create_partition(cursor, datetime(2020, 3, 1, tzinfo=dt_timezone.utc)))
+        self.assertEqual(self._partition_of(stray), 'notifications_p2020_03')
+
+    def test_retention_drops_expired_partitions_and_keeps_unread(self):
+        old_month = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+        with connection.cursor() as cursor:
+            create_partition(cursor, old_month)
+        old = old_month + timedelta(days=10)
+        read = self._notify(old, is_read=True)
+        unread = self._notify(old)
+        archived = self._notify(old, is_archived=True)
+        stray_read = self._notify(datetime(2020, 6, 1, tzinfo=dt_timezone.utc), is_read=True)
+        recent_read = self._notify(self.now, is_read=True)
+        self.assertEqual(get_unread_count(self.user.user_id), 2)
+
+        with connection.cursor() as cursor:
+            # Partitions with deferred FK checks from this test's own transaction cannot be dropped
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        with self.captureOnCommitCallbacks(execute=True):
+            result = apply_retention(retention_days=30, now=self.now, batch_size=1)
+
+        self.assertEqual(result, {'partitions_dropped': 1, 'rows_deleted': 1})
+        with connection.cursor() as cursor:
+            self.assertNotIn('notifications_p2020_01', [name for name, start in list_partitions(cursor)])
+        remaining = set(Notification.objects.values_list('pk', flat=True))
+        self.assertEqual(remaining, {unread, recent_read})
+        self.assertNotIn(read, remaining)
+        self.assertNotIn(archived, remaining)
+        self.assertNotIn(stray_read, remaining)
+        self.assertEqual(self._partition_of(unread), DEFAULT_PARTITION)
+        self.assertEqual(get_unread_count(self.user.user_id), 1)
+
+    def test_retention_batch_decrements_each_unread_row(self):
+        stray = datetime(2020, 6, 1, tzinfo=dt_timezone.utc)
+        for _ in range(3):
+            self._notify(stray, is_archived=True)
+        kept = self._notify(self.now)
+        self.assertEqual(get_unread_count(self.user.user_id), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = apply_retention(retention_days=30, now=self.now, batch_size=10)
+
+        self.assertEqual(result, {'partitions_dropped': 0, 'rows_deleted': 3})
+        self.assertEqual(list(Notification.objects.values_list('pk', flat=True)), [kept])
+        self.assertEqual(get_unread_count(self.user.user_id), 1)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    NOTIFICATION_COALESCE_WINDOW=60
+)
+class NotificationCoalescingTests(TestCase):
+    def setUp(self):
+        clear_test_cache()
+        self.author = CustomUser.objects.create_user('fran', 'fran@example.com', 'pass12345')
+        self.voters = [
+            CustomUser.objects.create_user(f'voter{i}', f'voter{i}@example.com', 'pass12345') for i in range(3)
+        ]
+        self.discussion = Discussion.objects.create(
+            user=self.author, type='Article', title='Dune', content='Spice'
+        )
+        self.client = APIClient()
+
+    def tearDown(self):
+        clear_test_cache()
+
+    def _upvote(self, voter):
+        self.client.force_authenticate(voter)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('discussions:upvote_post', args=[self.discussion.discussion_id])
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def _flush(self, seconds_later=120):
+        with self.captureOnCommitCallbacks(execute=True):
+            return flush_coalesced_notifications(now=timezone.now() + timedelta(seconds=seconds_later))
+
+    def test_upvotes_within_window_become_one_notification(self):
+        for voter in self.voters:
+            self._upvote(voter)
+        self.assertFalse(Notification.objects.filter(user=self.author).exists())
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+        # Buffers younger than the window are left alone
+        self.assertEqual(self._flush(seconds_later=0), 0)
+        self.assertEqual(self._flush(), 1)
+
+        notification = Notification.objects.get(user=self.author)
+        self.assertEqual(notification.type, 'discussion_upvoted')
+        self.assertEqual(notification.content_id, self.discussion.discussion_id)
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.message, 'voter2 and 2 others upvoted your discussion: Dune')
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+        self.assertEqual(get_redis_connection('default').zcard(PENDING_KEY), 0)
+
+    def test_later_events_update_the_unread_notification(self):
+        self._upvote(self.voters[0])
+        self._flush()
+        notification = Notification.objects.get(user=self.author)
+        self.assertEqual(notification.message, 'voter0 upvoted your discussion: Dune')
+
+        self._upvote(self.voters[1])
+        self._flush()
+        notification.refresh_from_db()
+        self.assertEqual(Notification.objects.filter(user=self.author).count(), 1)
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.message, 'voter1 and 1 other upvoted your discussion: Dune')
+        self.assertEqual(
+            NotificationOutbox.objects.filter(payload__notification_id=str(notification.notification_id)).count(), 2
+        )
+
+        # Once read, new events start a fresh notification
+        Notification.objects.filter(pk=notification.pk).update(is_read=True)
+        self._upvote(self.voters[2])
+        self._flush()
+        self.assertEqual(Notification.objects.filter(user=self.author, is_read=False).get().actor_count, 1)
+
+    def test_failing_group_is_dropped_without_blocking_others(self):
+        other = Discussion.objects.create(user=self.voters[2], type='Article', title='Emma', content='Austen')
+        self._upvote(self.voters[0])
+        self.client.force_authenticate(self.voters[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('discussions:upvote_post', args=[other.discussion_id]))
+
+        message = coalesced_message
+
+        def fail_for_dune(notification_type, actor, count, subject):
+            if subject == 'Dune':
+                raise ValueError(subject)
+            return message(notification_type, actor, count, subject)
+
+        with patch('backend.swaps.notification_coalescing.coalesced_message', side_effect=fail_for_dune):
+            self.assertEqual(self._flush(), 1)
+        self.assertTrue(Notification.objects.filter(user=self.voters[2]).exists())
+        self.assertFalse(Notification.objects.filter(user=self.author).exists())
+        self.assertEqual(get_redis_connection('default').zcard(PENDING_KEY), 0)
+        self.assertEqual(self._flush(), 0)
+
+    def test_toggled_upvotes_count_each_voter_once(self):
+        for voter in (self.voters[0], self.voters[0], self.voters[0], self.voters[1]):
+            # Upvote, withdraw, upvote again
+            self._upvote(voter)
+        self._flush()
+        notification = Notification.objects.get(user=self.author)
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.message, 'voter1 and 1 other upvoted your discussion: Dune')
+
+        # Merging into the unread notification does not count the same voters again
+        self._upvote(self.voters[1])
+        self._upvote(self.voters[1])
+        self._flush()
+        notification.refresh_from_db()
+        self.assertEqual(notification.actor_count, 2)
+
+
+class SwapListCacheTests(SwapTestMixin, TestCase):
+    def setUp(self):
+        clear_test_cache()
+        self.swap = self._create_swap(status='Requested')
+        for _ in range(11):
+            Swap.objects.create(initiator=self.alice, receiver=self.bob, status='Cancelled')
+        Swap.objects.filter(pk=self.swap.pk).update(created_at=timezone.now())
+        self.client = APIClient()
+
+    def tearDown(self):
+        clear_test_cache()
+
+    def _list(self, user, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('swaps:swap_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_are_cached_separately(self):
+        first = self._list(self.alice)
+        second = self._list(self.alice, page=2)
+        self.assertEqual((first['count'], len(first['results'])), (12, 10))
+        self.assertEqual(len(second['results']), 2)
+        self.assertTrue(first['next'].endswith('page=2'))
+        self.assertIsNone(second['next'])
+        self.assertNotIn('page=', second['previous'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self._list(self.alice, page=2)['results'], second['results'])
+        self.assertEqual(self._list(self.alice, status='Requested')['count'], 1)
+
+    def test_transition_invalidates_and_warms_both_participants(self):
+        self.assertEqual(self._list(self.bob, status='Requested')['count'], 1)
+        self._list(self.alice)
+
+        self.client.force_authenticate(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('swaps:accept_swap', args=[self.swap.swap_id]), {}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        for user in (self.alice, self.bob):
+            with self.assertNumQueries(0):
+                results = self._list(user)['results']
+            statuses = {item['swap_id']: item['status'] for item in results}
+            self.assertEqual(statuses[str(self.swap.swap_id)], 'Accepted')
+        self.assertEqual(self._list(self.bob, status='Requested')['count'], 0)
+
+    def test_approved_extension_invalidates(self):
+        Swap.objects.filter(pk=self.swap.pk).update(status='Accepted', return_deadline=timezone.now())
+        before = self._list(self.alice)['results'][0]
+        self.swap.refresh_from_db()
+        extension = ExtensionRequest.objects.create(swap=self.swap, requester=self.bob, days_requested=2, reason='Busy')
+        with self.captureOnCommitCallbacks(execute=True):
+            extension.approve()
+
+        with self.assertNumQueries(0):
+            after = self._list(self.alice)['results'][0]
+        self.assertEqual(after['swap_id'], str(self.swap.swap_id))
+        self.assertNotEqual(after['updated_at'], before['updated_at'])
+
+    def test_invalid_page(self):
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.client.get(reverse('swaps:swap_list'), {'page': 5}).status_code, 404)
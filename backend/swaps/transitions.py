@@ -0,0 +1,95 @@
+"""
+Swap state machine with optimistic concurrency
+
+Transitions are validated in memory and applied with a single
+UPDATE ... WHERE status=<expected> AND version=<expected>, so a swap that
+changed since it was loaded is never silently overwritten. Book ownership
+and lock changes are written in one bulk UPDATE.
+"""
+from django.core.exceptions import ValidationError
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from .swap_list_cache import invalidate_swap_lists
+
+VALID_TRANSITIONS = {
+    'Requested': ['Accepted', 'Cancelled'],
+    'Accepted': ['Confirmed', 'Cancelled'],
+    'Confirmed': ['Completed', 'Cancelled'],
+    'Completed': [],
+    'Cancelled': []
+}
+
+
+class SwapConflictError(Exception):
+    """Raised when the swap was modified concurrently since it was loaded."""
+
+
+def validate_transition(current_status, new_status):
+    """Check a status change against the state machine without touching the database."""
+    if new_status not in VALID_TRANSITIONS.get(current_status, []):
+        raise ValidationError(f"Invalid status transition: {current_status} to {new_status}")
+
+
+def transition_swap(swap, new_status, **changes):
+    """
+    Move a swap to ``new_status`` and apply extra field ``changes`` in one UPDATE.
+
+    Raises ValidationError for an invalid transition and SwapConflictError if the
+    swap's status or version no longer match the loaded instance.
+    """
+    from .models import Swap
+
+    validate_transition(swap.status, new_status)
+    now = timezone.now()
+    updated = Swap.objects.filter(
+        pk=swap.pk,
+        status=swap.status,
+        version=swap.version
+    ).update(status=new_status, version=F('version') + 1, updated_at=now, **changes)
+    if not updated:
+        raise SwapConflictError(f"Swap {swap.pk} was modified concurrently.")
+
+    swap.status = new_status
+    swap.version += 1
+    swap.updated_at = now
+    for field, value in changes.items():
+        setattr(swap, field, value)
+    invalidate_swap_lists(swap.initiator_id, swap.receiver_id)
+    return swap
+
+
+def _swap_books(swap):
+    return [book for book in (swap.initiator_book, swap.receiver_book) if book is not None]
+
+
+def lock_books(swap, until):
+    """Lock both books of the swap until ``until`` in one UPDATE."""
+    from backend.library.models import Book
+
+    books = _swap_books(swap)
+    Book.objects.filter(pk__in=[book.pk for book in books]).update(locked_until=until)
+    for book in books:
+        book.locked_until = until
+
+
+def release_books(swap):
+    """Clear the swap locks on both books in one UPDATE."""
+    lock_books(swap, None)
+
+
+def transfer_books(swap):
+    """Hand each book to the other participant and release the locks in one UPDATE."""
+    from backend.library.models import Book
+
+    new_owners = {swap.initiator_book_id: swap.receiver_id}
+    if swap.receiver_book_id:
+        new_owners[swap.receiver_book_id] = swap.initiator_id
+
+    Book.objects.filter(pk__in=list(new_owners)).update(
+        user_id=Case(*[When(pk=book_id, then=owner_id) for book_id, owner_id in new_owners.items()]),
+        locked_until=None
+    )
+    for book in _swap_books(swap):
+        book.user_id = new_owners[book.pk]
+        book.locked_until = None
@@ -0,0 +1,143 @@
+"""
+Per-user unread notification counters kept in Redis
+
+A counter only exists once it was seeded from the database on first read.
+Adjustments are applied after commit and skip users without a counter, so a
+missing key always means "recount" rather than "zero". The reconciliation job
+corrects any drift.
+"""
+import logging
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+UNREAD_KEY = 'unread_notifications:{}'
+UNREAD_TTL = 60 * 60 * 24 * 7
+
+# Apply each delta only to existing counters, never below zero, and refresh the TTL
+ADJUST_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        if redis.call('INCRBY', key, ARGV[i + 1]) < 0 then
+            redis.call('SET', key, 0)
+        end
+        redis.call('EXPIRE', key, ARGV[1])
+    end
+end
+return #KEYS
+"""
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _count_unread_in_db(user_ids):
+    from .models import Notification
+
+    counts = {
+        str(user_id): unread
+        for user_id, unread in Notification.objects.filter(user_id__in=user_ids, is_read=False)
+        .values('user_id').annotate(unread=Count('pk')).values_list('user_id', 'unread')
+    }
+    return {user_id: counts.get(str(user_id), 0) for user_id in user_ids}
+
+
+def adjust_unread_counts(deltas):
+    """
+    Add per-user deltas to the counters once the current transaction commits
+
+    Args:
+        deltas: Mapping (or Counter) of user_id to change in unread notifications
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if user_id and delta}
+    if not deltas:
+        return
+
+    def apply():
+        keys = [UNREAD_KEY.format(user_id) for user_id in deltas]
+        try:
+            _redis().eval(ADJUST_SCRIPT, len(keys), *keys, UNREAD_TTL, *deltas.values())
+        except Exception as e:
+            logger.warning(f"Failed to adjust unread notification counters: {e}")
+
+    transaction.on_commit(apply)
+
+
+def count_new_notifications(notifications):
+    """Counter deltas for newly created notifications"""
+    return Counter(notification.user_id for notification in notifications if not notification.is_read)
+
+
+def get_unread_counts(user_ids):
+    """
+    Read unread counts for several users, seeding missing counters from the database
+
+    Returns:
+        dict: user_id to unread notification count
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    try:
+        redis = _redis()
+        values = redis.mget([UNREAD_KEY.format(user_id) for user_id in user_ids])
+    except Exception as e:
+        logger.warning(f"Unread counters unavailable, counting in the database: {e}")
+        return _count_unread_in_db(user_ids)
+
+    counts = {user_id: int(value) for user_id, value in zip(user_ids, values) if value is not None}
+    missing = [user_id for user_id in user_ids if user_id not in counts]
+    if missing:
+        seeded = _count_unread_in_db(missing)
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for user_id, count in seeded.items():
+                pipe.set(UNREAD_KEY.format(user_id), count, nx=True, ex=UNREAD_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to seed unread notification counters: {e}")
+        counts.update(seeded)
+    return counts
+
+
+def get_unread_count(user_id):
+    return get_unread_counts([user_id])[user_id]
+
+
+def reconcile_unread_counts(batch_size=500):
+    """
+    Overwrite existing counters that drifted from the database
+
+    Returns:
+        int: Number of counters corrected
+    """
+    redis = _redis()
+    corrected = 0
+    keys = []
+
+    def flush(keys):
+        user_ids = [key.decode().split(':', 1)[1] if isinstance(key, bytes) else key.split(':', 1)[1] for key in keys]
+        actual = _count_unread_in_db(user_ids)
+        cached = redis.mget(keys)
+        pipe = redis.pipeline(transaction=False)
+        changed = 0
+        for key, user_id, value in zip(keys, user_ids, cached):
+            if value is not None and int(value) != actual[user_id]:
+                pipe.set(key, actual[user_id], ex=UNREAD_TTL)
+                changed += 1
+        pipe.execute()
+        return changed
+
+    for key in redis.scan_iter(match=UNREAD_KEY.format('*'), count=batch_size):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            corrected += flush(keys)
+            keys = []
+    if keys:
+        corrected += flush(keys)
+    return corrected
@@ -4,7 +4,8 @@ from .views import (
     SwapListView, SwapHistoryView, AddLocationView, NotificationListView,
     MarkNotificationReadView, MarkAllNotificationsReadView, DeleteNotificationView,
     BulkNotificationOperationsView, ShareView, MidpointView, GetQRCodeView,
-    RequestExtensionView, RespondToExtensionView, QRVerificationView
+    RequestExtensionView, RespondToExtensionView, QRVerificationView, SwapChainListView,
+    BatchQRVerificationView, UnreadNotificationCountView
 )
 
 app_name = 'swaps'
@@ -16,9 +17,11 @@ urlpatterns = [
     path('<uuid:swap_id>/cancel/', CancelSwapView.as_view(), name='cancel_swap'),
     path('list/', SwapListView.as_view(), name='swap_list'),
     path('history/', SwapHistoryView.as_view(), name='swap_history'),
+    path('chains/', SwapChainListView.as_view(), name='swap_chains'),
     path('locations/add/', AddLocationView.as_view(), name='add_location'),
     path('notifications/', NotificationListView.as_view(), name='notification_list'),
     path('notifications/<uuid:notification_id>/read/', MarkNotificationReadView.as_view(), name='mark_notification_read'),
+    path('notifications/unread-count/', UnreadNotificationCountView.as_view(), name='unread_notification_count'),
     path('notifications/mark-all-read/', MarkAllNotificationsReadView.as_view(), name='mark_all_notifications_read'),
     path('notifications/<uuid:notification_id>/', DeleteNotificationView.as_view(), name='delete_notification'),
     path('notifications/bulk/', BulkNotificationOperationsView.as_view(), name='bulk_notification_operations'),
@@ -28,4 +31,5 @@ urlpatterns = [
     path('<uuid:swap_id>/request-extension/', RequestExtensionView.as_view(), name='request_extension'),
     path('extensions/<uuid:extension_id>/respond/', RespondToExtensionView.as_view(), name='respond_to_extension'),
     path('<uuid:swap_id>/verify-qr/', QRVerificationView.as_view(), name='verify_qr'),
+    path('verify-qr/batch/', BatchQRVerificationView.as_view(), name='batch_verify_qr'),
 ]
\ No newline at end of file
@@ -1,4 +1,5 @@
 from rest_framework.views import APIView
+from adrf.views import APIView as AsyncAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
@@ -8,23 +9,33 @@ from datetime import timedelta
 from django.db import transaction
 from django.core.cache import cache
 from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.core.paginator import InvalidPage
+from django.db.models import Q, Prefetch
 import requests
 from math import radians, sin, cos, sqrt, atan2
-from .models import Swap, Notification, Location, ExtensionRequest
+from .models import Swap, Notification, Location, ExtensionRequest, SwapChain, SwapChainLink, Exchange
 from .serializers import (
     SwapCreateSerializer, SwapSerializer, SwapAcceptSerializer,
     SwapConfirmSerializer, SwapHistorySerializer, LocationSerializer,
-    NotificationSerializer, ShareSerializer
+    NotificationSerializer, ShareSerializer, SwapChainSerializer
 )
 from .qr_utils import qr_manager
+from .transitions import SwapConflictError, lock_books, release_books, transfer_books, transition_swap
 from .location_utils import location_service
+from .unread_counts import adjust_unread_counts, get_unread_count
+from .swap_list_cache import get_swap_list_page, invalidate_swap_lists
 from backend.library.models import Book
 from backend.users.models import Follows
 from django.conf import settings
 import uuid
+import hashlib
+import time
 from backend.utils.websocket import send_notification_to_user
 
+SWAP_RELATED_FIELDS = ('initiator', 'receiver', 'initiator_book', 'receiver_book', 'meetup_location')
+QR_BATCH_VERIFY_LIMIT = 100
+
 def haversine(coord1, coord2):
     """Calculate distance (km) between two coordinates."""
     try:
@@ -51,42 +62,36 @@ class InitiateSwapView(APIView):
         if initiator_book.locked_until and initiator_book.locked_until > timezone.now():
             return Response({"error": "Book locked"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Generate secure QR code
-        qr_result = qr_manager.generate_swap_qr_code(
-            swap_id=uuid.uuid4(),  # Temporary ID, will be updated after creation
+        # Only the signed payload is created here; the PNG is rendered on first request
+        swap_id = uuid.uuid4()
+        qr_result = qr_manager.create_swap_qr_payload(
+            swap_id=swap_id,
             user_id=request.user.user_id
         )
 
+        # Set borrowing details if specified
+        is_borrowing = bool(request.data.get('is_borrowing', False))
+        return_deadline = None
+        if is_borrowing:
+            return_days = int(request.data.get('return_days', 14))
+            return_deadline = timezone.now() + timedelta(days=return_days)
+
         serializer = SwapCreateSerializer(
             data=request.data,
-            context={'request': request, 'qr_code_url': qr_result['qr_code_url']}
+            context={
+                'request': request,
+                'swap_id': swap_id,
+                'qr_code_data': qr_result['qr_data'],
+                'is_borrowing': is_borrowing,
+                'return_deadline': return_deadline
+            }
         )
         if serializer.is_valid():
             with transaction.atomic():
                 swap = serializer.save()
 
-                # Update QR code with actual swap ID
-                qr_result = qr_manager.generate_swap_qr_code(
-                    swap_id=swap.swap_id,
-                    user_id=request.user.user_id
-                )
-                swap.qr_code_url = qr_result['qr_code_url']
-                swap.qr_code_data = qr_result['qr_data']
-
-                # Set borrowing details if specified
-                is_borrowing = request.data.get('is_borrowing', False)
-                if is_borrowing:
-                    swap.is_borrowing = True
-                    return_days = int(request.data.get('return_days', 14))
-                    swap.return_deadline = timezone.now() + timedelta(days=return_days)
-
-                swap.save()
-
-                initiator_book.locked_until = timezone.now() + timedelta(hours=24)
-                initiator_book.save()
-                if swap.receiver_book:
-                    swap.receiver_book.locked_until = timezone.now() + timedelta(hours=24)
-                    swap.receiver_book.save()
+                lock_books(swap, timezone.now() + timedelta(hours=24))
+                invalidate_swap_lists(swap.initiator_id, swap.receiver_id)
 
                 notification = Notification.objects.create(
                     user=swap.receiver,
@@ -115,7 +120,7 @@ class AcceptSwapView(APIView):
 
     def patch(self, request, swap_id):
         swap = get_object_or_404(
-            Swap,
+            Swap.objects.select_related(*SWAP_RELATED_FIELDS),
             swap_id=swap_id,
             receiver=request.user,
             status='Requested'
@@ -123,17 +128,20 @@ class AcceptSwapView(APIView):
         serializer = SwapAcceptSerializer(swap, data=request.data, partial=True)
         if serializer.is_valid():
             with transaction.atomic():
-                serializer.save(status='Accepted')
+                try:
+                    serializer.save(status='Accepted')
+                except SwapConflictError:
+                    return Response({"error": "Swap was modified, please retry"}, status=status.HTTP_409_CONFLICT)
 
                 notification = Notification.objects.create(
-                    user=swap.initiator,
+                    user_id=swap.initiator_id,
                     swap=swap,
                     type='swap_accepted',
                     message=f"{request.user.username} accepted your swap."
                 )
                 # Send notification via WebSocket to the initiator's group
                 send_notification_to_user(
-                    swap.initiator.user_id,
+                    swap.initiator_id,
                     {
                         "notification_id": str(notification.notification_id),
                         "message": f"{request.user.username} accepted your swap.",
@@ -151,61 +159,39 @@ class ConfirmSwapView(APIView):
     permission_classes = [IsAuthenticated]
 
     def patch(self, request, swap_id):
-        swap = get_object_or_404(Swap, swap_id=swap_id)
-        if request.user not in [swap.initiator, swap.receiver]:
+        swap = get_object_or_404(Swap.objects.select_related(*SWAP_RELATED_FIELDS), swap_id=swap_id)
+        if request.user.pk not in [swap.initiator_id, swap.receiver_id]:
             return Response({"error": "Unauthorized user"}, status=status.HTTP_403_FORBIDDEN)
-        if swap.status != 'Accepted':
-            return Response({"error": "Swap not in Accepted state"}, status=status.HTTP_400_BAD_REQUEST)
+        if swap.status not in ['Accepted', 'Confirmed']:
+            return Response({"error": "Swap not awaiting confirmation"}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = SwapConfirmSerializer(data=request.data)
         if serializer.is_valid():
             with transaction.atomic():
-                swap_confirm_key = f"swap_confirm_{swap_id}_{request.user.user_id}"
-                if cache.get(swap_confirm_key):
+                # Flag, status and completion are decided by one conditional UPDATE
+                new_status = swap.record_confirmation(request.user)
+                if new_status is None:
                     return Response({"error": "User already confirmed"}, status=status.HTTP_400_BAD_REQUEST)
-                cache.set(swap_confirm_key, True, timeout=3600)
-
-                other_user = swap.receiver if request.user == swap.initiator else swap.initiator
-                other_confirm_key = f"swap_confirm_{swap_id}_{other_user.user_id}"
-                if cache.get(other_confirm_key):
-                    swap.set_status('Completed')
-
-                    initiator_book = swap.initiator_book
-                    receiver_book = swap.receiver_book
-                    if receiver_book:
-                        initiator_book.user, receiver_book.user = swap.receiver, swap.initiator
-                        initiator_book.save()
-                        receiver_book.save()
-                    else:
-                        initiator_book.user = swap.receiver
-                        initiator_book.save()
-
-                    initiator_book.locked_until = None
-                    initiator_book.save()
-                    if receiver_book:
-                        receiver_book.locked_until = None
-                        receiver_book.save()
+
+                if new_status == 'Completed':
+                    # Ownership change and lock release for both books in one UPDATE
+                    transfer_books(swap)
 
                     notifications = [
                         Notification(
-                            user=swap.initiator,
-                            swap=swap,
-                            type='swap_completed',
-                            message="Swap completed."
-                        ),
-                        Notification(
-                            user=swap.receiver,
+                            user_id=user_id,
                             swap=swap,
                             type='swap_completed',
                             message="Swap completed."
                         )
+                        for user_id in (swap.initiator_id, swap.receiver_id)
                     ]
                     Notification.objects.bulk_create(notifications)
 
                     # Send notifications via WebSocket to both users' groups
                     for notification in notifications:
                         send_notification_to_user(
-                            notification.user.user_id,
+                            notification.user_id,
                             {
                                 "notification_id": str(notification.notification_id),
                                 "message": "Swap completed.",
@@ -215,13 +201,6 @@ class ConfirmSwapView(APIView):
                                 "follow_id": None
                             }
                         )
-
-                    cache.delete(swap_confirm_key)
-                    cache.delete(other_confirm_key)
-                else:
-                    swap.set_status('Confirmed')
-
-                swap.save()
             return Response(SwapSerializer(swap).data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -229,8 +208,8 @@ class CancelSwapView(APIView):
     permission_classes = [IsAuthenticated]
 
     def patch(self, request, swap_id):
-        swap = get_object_or_404(Swap, swap_id=swap_id)
-        if request.user not in [swap.initiator, swap.receiver]:
+        swap = get_object_or_404(Swap.objects.select_related(*SWAP_RELATED_FIELDS), swap_id=swap_id)
+        if request.user.pk not in [swap.initiator_id, swap.receiver_id]:
             return Response({"error": "Not part of this swap"}, status=status.HTTP_403_FORBIDDEN)
         if swap.status == 'Completed':
             return Response({"error": "Swap already completed"}, status=status.HTTP_400_BAD_REQUEST)
@@ -238,14 +217,13 @@ class CancelSwapView(APIView):
             return Response({"message": "Swap already cancelled"}, status=status.HTTP_200_OK)
 
         with transaction.atomic():
-            swap.set_status('Cancelled')
-            swap.initiator_book.locked_until = None
-            swap.initiator_book.save()
-            if swap.receiver_book:
-                swap.receiver_book.locked_until = None
-                swap.receiver_book.save()
-
-            other_user = swap.receiver if request.user == swap.initiator else swap.initiator
+            try:
+                transition_swap(swap, 'Cancelled')
+            except SwapConflictError:
+                return Response({"error": "Swap was modified, please retry"}, status=status.HTTP_409_CONFLICT)
+            release_books(swap)
+
+            other_user = swap.receiver if request.user.pk == swap.initiator_id else swap.initiator
             notification = Notification.objects.create(
                 user=other_user,
                 swap=swap,
@@ -264,35 +242,34 @@ class CancelSwapView(APIView):
                     "follow_id": None
                 }
             )
-
-            swap.save()
         return Response(SwapSerializer(swap).data, status=status.HTTP_200_OK)
 
 class SwapListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        cache_key = f"swaps_user_{request.user.user_id}_{request.query_params.get('status', 'all')}"
-        cached_swaps = cache.get(cache_key)
-        if cached_swaps:
-            return Response(cached_swaps, status=status.HTTP_200_OK)
-
-        swaps = Swap.objects.filter(
-            Q(initiator=request.user) | Q(receiver=request.user)
-        ).select_related(
-            'initiator', 'receiver', 'initiator_book', 'receiver_book', 'meetup_location'
-        )
-        status_param = request.query_params.get('status')
-        if status_param:
-            swaps = swaps.filter(status=status_param)
-
-        paginator = PageNumberPagination()
-        result_page = paginator.paginate_queryset(swaps.order_by('-created_at'), request)
-        serializer = SwapSerializer(result_page, many=True)
-
-        response_data = paginator.get_paginated_response(serializer.data).data
-        cache.set(cache_key, response_data, timeout=300)
-        return Response(response_data)
+        # Pages are cached per user, status and page under a version that swap writes bump
+        status_param = request.query_params.get('status') or 'all'
+        try:
+            page_number = int(request.query_params.get('page', 1))
+            page = get_swap_list_page(request.user.user_id, status_param, page_number)
+        except (ValueError, InvalidPage):
+            return Response({"error": "Invalid page."}, status=status.HTTP_404_NOT_FOUND)
+
+        url = request.build_absolute_uri()
+        next_url = replace_query_param(url, 'page', page_number + 1) if page_number < page['num_pages'] else None
+        if page_number == 1:
+            previous_url = None
+        elif page_number == 2:
+            previous_url = remove_query_param(url, 'page')
+        else:
+            previous_url = replace_query_param(url, 'page', page_number - 1)
+        return Response({
+            'count': page['count'],
+            'next': next_url,
+            'previous': previous_url,
+            'results': page['results']
+        })
 
 class SwapHistoryView(APIView):
     permission_classes = [IsAuthenticated]
@@ -309,6 +286,24 @@ class SwapHistoryView(APIView):
         
         return paginator.get_paginated_response(serializer.data)
 
+class SwapChainListView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Proposed multi-party swap chains the user takes part in"""
+        chains = SwapChain.objects.filter(
+            status='proposed',
+            links__giver=request.user
+        ).prefetch_related(
+            Prefetch('links', queryset=SwapChainLink.objects.select_related('giver', 'receiver', 'book'))
+        ).order_by('length', '-created_at')
+
+        paginator = PageNumberPagination()
+        result_page = paginator.paginate_queryset(chains, request)
+        serializer = SwapChainSerializer(result_page, many=True)
+
+        return paginator.get_paginated_response(serializer.data)
+
 class AddLocationView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -349,8 +344,10 @@ class MarkNotificationReadView(APIView):
 
     def patch(self, request, notification_id):
         notification = get_object_or_404(Notification, notification_id=notification_id, user=request.user)
+        # Only the request that flips the flag decrements the unread counter
+        if Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True):
+            adjust_unread_counts({request.user.user_id: -1})
         notification.is_read = True
-        notification.save()
         return Response(NotificationSerializer(notification).data, status=status.HTTP_200_OK)
 
 class MarkAllNotificationsReadView(APIView):
@@ -362,12 +359,20 @@ class MarkAllNotificationsReadView(APIView):
             user=request.user,
             is_read=False
         ).update(is_read=True)
+        adjust_unread_counts({request.user.user_id: -updated_count})
 
         return Response({
             'message': f'Marked {updated_count} notifications as read',
             'updated_count': updated_count
         }, status=status.HTTP_200_OK)
 
+class UnreadNotificationCountView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Unread notification count served from the per-user Redis counter"""
+        return Response({'unread_count': get_unread_count(request.user.user_id)}, status=status.HTTP_200_OK)
+
 class DeleteNotificationView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -398,10 +403,13 @@ class BulkNotificationOperationsView(APIView):
             user=request.user
         )
 
+        # Read-state updates only touch rows that change, so the counts are exact counter deltas
         if operation == 'mark_read':
-            updated_count = notifications.update(is_read=True)
+            updated_count = notifications.filter(is_read=False).update(is_read=True)
+            adjust_unread_counts({request.user.user_id: -updated_count})
         elif operation == 'mark_unread':
-            updated_count = notifications.update(is_read=False)
+            updated_count = notifications.filter(is_read=True).update(is_read=False)
+            adjust_unread_counts({request.user.user_id: updated_count})
         elif operation == 'archive':
             updated_count = notifications.update(is_archived=True)
         else:
@@ -419,10 +427,14 @@ class BulkNotificationOperationsView(APIView):
         if not notification_ids:
             return Response({'error': 'No notification IDs provided'}, status=status.HTTP_400_BAD_REQUEST)
 
-        deleted_count, _ = Notification.objects.filter(
+        notifications = Notification.objects.filter(
             notification_id__in=notification_ids,
             user=request.user
-        ).delete()
+        )
+        with transaction.atomic():
+            unread_count = notifications.filter(is_read=False).count()
+            deleted_count, _ = notifications.delete()
+            adjust_unread_counts({request.user.user_id: -unread_count})
 
         return Response({
             'message': f'Successfully deleted {deleted_count} notifications',
@@ -443,10 +455,10 @@ class ShareView(APIView):
             return Response(ShareSerializer(share).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class MidpointView(APIView):
+class MidpointView(AsyncAPIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
+    async def get(self, request):
         try:
             user_lat = float(request.query_params.get('user_lat'))
             user_lon = float(request.query_params.get('user_lon'))
@@ -463,7 +475,7 @@ class MidpointView(APIView):
         }
 
         cache_key = f"midpoint_v2_{user_lat}_{user_lon}_{other_lat}_{other_lon}_{hash(str(preferences))}"
-        cached_result = cache.get(cache_key)
+        cached_result = await cache.aget(cache_key)
         if cached_result:
             return Response(cached_result, status=status.HTTP_200_OK)
 
@@ -471,7 +483,7 @@ class MidpointView(APIView):
         coord2 = {'latitude': other_lat, 'longitude': other_lon}
 
         # Use advanced location discovery service
-        result = location_service.calculate_optimal_midpoint(coord1, coord2, preferences)
+        result = await location_service.acalculate_optimal_midpoint(coord1, coord2, preferences)
 
         # Format response
         response_data = {
@@ -485,7 +497,7 @@ class MidpointView(APIView):
             "preferences_applied": preferences
         }
 
-        cache.set(cache_key, response_data, timeout=3600)
+        await cache.aset(cache_key, response_data, timeout=3600)
         return Response(response_data, status=status.HTTP_200_OK)
 
 class GetQRCodeView(APIView):
@@ -495,9 +507,36 @@ class GetQRCodeView(APIView):
         swap = get_object_or_404(Swap, swap_id=swap_id)
         if request.user not in [swap.initiator, swap.receiver]:
             return Response({"error": "Not part of swap"}, status=status.HTTP_403_FORBIDDEN)
-        if not swap.qr_code_url:
-            return Response({"error": "No QR code generated"}, status=status.HTTP_400_BAD_REQUEST)
-        return Response({"qr_code_url": swap.qr_code_url}, status=status.HTTP_200_OK)
+        if not swap.qr_code_data:
+            if not swap.qr_code_url:
+                return Response({"error": "No QR code generated"}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"qr_token": None, "qr_code_url": swap.qr_code_url}, status=status.HTTP_200_OK)
+
+        if not qr_manager.is_compact_token(swap.qr_code_data):
+            # Reissue legacy Fernet tokens in the compact format; the old image goes with them
+            legacy_data = swap.qr_code_data
+            swap.qr_code_data = qr_manager.create_swap_qr_payload(swap.swap_id, swap.initiator_id)['qr_data']
+            swap.qr_code_url = None
+            if Swap.objects.filter(swap_id=swap.swap_id, qr_code_data=legacy_data).update(
+                qr_code_data=swap.qr_code_data, qr_code_url=None
+            ):
+                invalidate_swap_lists(swap.initiator_id, swap.receiver_id)
+            else:
+                swap.refresh_from_db(fields=['qr_code_data', 'qr_code_url'])
+
+        # Clients can render the token themselves; the PNG stays as a fallback
+        include_png = request.query_params.get('include_png', 'true').lower() != 'false'
+        if include_png and not swap.qr_code_url:
+            # Render lazily; concurrent first requests produce the same content-addressed file
+            swap.qr_code_url = qr_manager.render_qr_code(swap.qr_code_data)
+            if Swap.objects.filter(swap_id=swap.swap_id, qr_code_url__isnull=True).update(
+                qr_code_url=swap.qr_code_url
+            ):
+                invalidate_swap_lists(swap.initiator_id, swap.receiver_id)
+        return Response({
+            "qr_token": swap.qr_code_data,
+            "qr_code_url": swap.qr_code_url
+        }, status=status.HTTP_200_OK)
 
 
 class RequestExtensionView(APIView):
@@ -606,68 +645,207 @@ class RespondToExtensionView(APIView):
             return Response({"error": "Invalid action. Use 'approve' or 'deny'"}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class QRVerificationView(APIView):
-    permission_classes = [IsAuthenticated]
+def _qr_scan_cache_key(swap_id, user_id, qr_data):
+    digest = hashlib.sha256(qr_data.encode()).hexdigest()[:32]
+    return f"qr_scan_result_{swap_id}_{user_id}_{digest}"
+
+
+def _check_qr_scan(swap, user, qr_data, current_location=None):
+    """
+    Validate a QR scan without side effects
+
+    Returns:
+        tuple: (error body, HTTP status, verification_data); the error body is None on success
+    """
+    if user.pk not in (swap.initiator_id, swap.receiver_id):
+        return {"error": "Not part of this swap"}, status.HTTP_403_FORBIDDEN, None
+
+    if swap.status != 'Accepted':
+        return {"error": "Swap must be in Accepted status for QR verification"}, status.HTTP_400_BAD_REQUEST, None
+
+    # Determine which user should be verified
+    other_user_id = swap.receiver_id if user.pk == swap.initiator_id else swap.initiator_id
+
+    # Verify QR code
+    verification_result = qr_manager.verify_qr_code(
+        qr_data=qr_data,
+        expected_swap_id=swap.swap_id,
+        expected_user_id=other_user_id,
+        current_location=current_location
+    )
+
+    if not verification_result['success']:
+        return {
+            "error": verification_result['error'],
+            "error_code": verification_result['error_code']
+        }, status.HTTP_400_BAD_REQUEST, None
+    return None, status.HTTP_200_OK, verification_result['verification_data']
+
+
+def _record_qr_scan(swap, user):
+    """
+    Record a verified scan
+
+    Returns:
+        dict: The response body, or None if the swap left the Accepted state
+        since it was checked (e.g. a concurrent cancel)
+    """
+    with transaction.atomic():
+        # Record this user's verification; the second one moves the swap to Confirmed
+        new_status = swap.record_verification(user)
+        if new_status is None:
+            # Nothing changed: either a repeated scan, or the swap moved on
+            swap.refresh_from_db(fields=['status', 'initiator_verified', 'receiver_verified'])
+            own, _ = swap._participant_role(user)
+            if swap.status != 'Accepted' or not getattr(swap, f'{own}_verified'):
+                return None
+        if new_status == 'Confirmed':
+            exchange = Exchange.objects.create(
+                swap=swap,
+                exchange_date=timezone.now(),
+                location=swap.meetup_location,
+                qr_scanned=True
+            )
 
-    def post(self, request, swap_id):
-        swap = get_object_or_404(Swap, swap_id=swap_id)
+    if new_status == 'Confirmed':
+        return {
+            "message": "Swap confirmed successfully! Both parties have verified their presence.",
+            "status": "confirmed",
+            "exchange_id": str(exchange.exchange_id)
+        }
 
-        if request.user not in [swap.initiator, swap.receiver]:
-            return Response({"error": "Not part of this swap"}, status=status.HTTP_403_FORBIDDEN)
+    # Also covers a repeated scan by a user who already verified
+    return {
+        "message": "QR code verified. Waiting for the other party to verify.",
+        "status": "partially_verified"
+    }
+
+
+def _scan_cache_timeout(verification_data):
+    return max(int(verification_data['expires_at'] - time.time()), 1)
+
+
+QR_REPLAYED_ERROR = {"error": "QR code has already been used", "error_code": "REPLAYED"}
+QR_SWAP_CHANGED_ERROR = {"error": "Swap is no longer in Accepted status", "error_code": "SWAP_CHANGED"}
 
-        if swap.status != 'Accepted':
-            return Response({"error": "Swap must be in Accepted status for QR verification"}, status=status.HTTP_400_BAD_REQUEST)
 
+class QRVerificationView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, swap_id):
         qr_data = request.data.get('qr_data')
         current_location = request.data.get('current_location')  # {latitude, longitude}
 
         if not qr_data:
             return Response({"error": "QR data is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Determine which user should be verified
-        other_user = swap.receiver if request.user == swap.initiator else swap.initiator
+        # A retried scan gets the stored outcome without decoding the token or touching the DB
+        cache_key = _qr_scan_cache_key(swap_id, request.user.user_id, qr_data)
+        cached_result = cache.get(cache_key)
+        if cached_result is not None:
+            return Response(cached_result, status=status.HTTP_200_OK)
 
-        # Verify QR code
-        verification_result = qr_manager.verify_qr_code(
-            qr_data=qr_data,
-            expected_swap_id=swap.swap_id,
-            expected_user_id=other_user.user_id,
-            current_location=current_location
-        )
+        swap = get_object_or_404(Swap.objects.select_related('meetup_location'), swap_id=swap_id)
+        error, error_status, verification_data = _check_qr_scan(swap, request.user, qr_data, current_location)
+        if error:
+            return Response(error, status=error_status)
 
-        if not verification_result['success']:
-            return Response({
-                "error": verification_result['error'],
-                "error_code": verification_result['error_code']
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        # Mark location as verified for this user
-        if not hasattr(swap, '_verified_users'):
-            swap._verified_users = set()
-        swap._verified_users.add(request.user.user_id)
-
-        # If both users have verified, complete the swap
-        if len(getattr(swap, '_verified_users', set())) >= 2:
-            swap.status = 'Confirmed'
-            swap.location_verified = True
-            swap.save()
-
-            # Create exchange record
-            from .models import Exchange
-            exchange = Exchange.objects.create(
-                swap=swap,
-                exchange_date=timezone.now(),
-                location=swap.meetup_location
-            )
+        # Each token can be consumed once; a concurrent duplicate may have just stored its result
+        if not qr_manager.consume_verification_tokens([verification_data])[0]:
+            cached_result = cache.get(cache_key)
+            if cached_result is not None:
+                return Response(cached_result, status=status.HTTP_200_OK)
+            return Response(QR_REPLAYED_ERROR, status=status.HTTP_409_CONFLICT)
 
-            return Response({
-                "message": "Swap confirmed successfully! Both parties have verified their presence.",
-                "status": "confirmed",
-                "exchange_id": exchange.exchange_id
-            }, status=status.HTTP_200_OK)
+        try:
+            result = _record_qr_scan(swap, request.user)
+        except Exception:
+            qr_manager.release_verification_token(verification_data)
+            raise
+        if result is None:
+            qr_manager.release_verification_token(verification_data)
+            return Response(QR_SWAP_CHANGED_ERROR, status=status.HTTP_409_CONFLICT)
 
-        else:
-            return Response({
-                "message": "QR code verified. Waiting for the other party to verify.",
-                "status": "partially_verified"
-            }, status=status.HTTP_200_OK)
\ No newline at end of file
+        cache.set(cache_key, result, timeout=_scan_cache_timeout(verification_data))
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class BatchQRVerificationView(APIView):
+    """Verify many swap QR codes in one request, e.g. at a swap meetup event"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        verifications = request.data.get('verifications')
+        if not isinstance(verifications, list) or not verifications:
+            return Response({"error": "verifications must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(verifications) > QR_BATCH_VERIFY_LIMIT:
+            return Response(
+                {"error": f"At most {QR_BATCH_VERIFY_LIMIT} verifications per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = [None] * len(verifications)
+        cache_keys = {}
+        # A scan repeated within the batch gets the result of its first occurrence
+        duplicates, first_index = {}, {}
+        for i, item in enumerate(verifications):
+            try:
+                swap_id = uuid.UUID(str(item.get('swap_id')))
+            except (AttributeError, ValueError):
+                results[i] = {"error": "Invalid swap ID", "status_code": status.HTTP_400_BAD_REQUEST}
+                continue
+            if not item.get('qr_data'):
+                results[i] = {"swap_id": str(swap_id), "error": "QR data is required", "status_code": status.HTTP_400_BAD_REQUEST}
+                continue
+            key = _qr_scan_cache_key(swap_id, request.user.user_id, item['qr_data'])
+            if key in first_index:
+                duplicates[i] = first_index[key]
+                continue
+            first_index[key] = i
+            cache_keys[i] = key
+
+        # Duplicate scans come straight from the result cache in one round trip
+        cached_results = cache.get_many(list(cache_keys.values()))
+        pending = {}
+        for i, key in cache_keys.items():
+            if key in cached_results:
+                results[i] = {**cached_results[key], "swap_id": str(verifications[i]['swap_id']), "status_code": status.HTTP_200_OK}
+            else:
+                pending[i] = uuid.UUID(str(verifications[i]['swap_id']))
+
+        swaps = Swap.objects.select_related('meetup_location').in_bulk(set(pending.values()))
+        verified = []
+        for i, swap_id in pending.items():
+            swap = swaps.get(swap_id)
+            if swap is None:
+                results[i] = {"swap_id": str(swap_id), "error": "Swap not found", "status_code": status.HTTP_404_NOT_FOUND}
+                continue
+            item = verifications[i]
+            error, error_status, verification_data = _check_qr_scan(
+                swap, request.user, item['qr_data'], item.get('current_location')
+            )
+            if error:
+                results[i] = {**error, "swap_id": str(swap_id), "status_code": error_status}
+            else:
+                verified.append((i, swap, verification_data))
+
+        consumed = qr_manager.consume_verification_tokens([data for _, _, data in verified])
+        for (i, swap, verification_data), is_new in zip(verified, consumed):
+            if not is_new:
+                results[i] = {**QR_REPLAYED_ERROR, "swap_id": str(swap.swap_id), "status_code": status.HTTP_409_CONFLICT}
+                continue
+            try:
+                result = _record_qr_scan(swap, request.user)
+            except Exception:
+                qr_manager.release_verification_token(verification_data)
+                raise
+            if result is None:
+                qr_manager.release_verification_token(verification_data)
+                results[i] = {**QR_SWAP_CHANGED_ERROR, "swap_id": str(swap.swap_id), "status_code": status.HTTP_409_CONFLICT}
+                continue
+            cache.set(cache_keys[i], result, timeout=_scan_cache_timeout(verification_data))
+            results[i] = {**result, "swap_id": str(swap.swap_id), "status_code": status.HTTP_200_OK}
+
+        for i, first in duplicates.items():
+            results[i] = dict(results[first])
+        return Response({"results": results}, status=status.HTTP_200_OK)
@@ -1,11 +1,16 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from . import presence
 import json
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# Most users one presence lookup may ask about
+PRESENCE_LOOKUP_LIMIT = 200
+
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         token = self.scope['query_string'].decode().split('token=')[-1]
@@ -23,6 +28,14 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 await self.channel_layer.group_add(self.group_name, self.channel_name)
                 await self.accept()
                 logger.info(f"WebSocket connected for user_id={user.user_id}")
+                # Partners this socket may send typing events to, checked once each
+                self.typing_partners = set()
+                await database_sync_to_async(presence.user_connected)(user.user_id)
+                await self.send(text_data=json.dumps({
+                    'type': 'presence_config',
+                    'heartbeat_interval': presence.HEARTBEAT_INTERVAL,
+                    'typing_ttl': presence.TYPING_TTL,
+                }))
             else:
                 logger.warning("WebSocket authentication failed")
                 await self.close(code=4001)
@@ -45,16 +58,154 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         if hasattr(self, 'group_name'):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
             logger.info(f"WebSocket disconnected for group={self.group_name} with code={close_code}")
+        if hasattr(self, 'typing_partners'):
+            await database_sync_to_async(presence.user_disconnected)(self.scope['user'].user_id)
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send(text_data=json.dumps({'error': 'Invalid JSON data.'}))
+            return
+
+        action = data.get('action')
+        if action == 'heartbeat':
+            await database_sync_to_async(presence.heartbeat)(self.scope['user'].user_id)
+        elif action == 'typing':
+            await self.handle_typing(data)
+        elif action == 'presence':
+            await self.handle_presence(data)
+        elif action == 'receipt':
+            await self.handle_receipt(data)
+        else:
+            await self.send(text_data=json.dumps({'error': 'Invalid action.'}))
+
+    async def handle_typing(self, data):
+        user = self.scope['user']
+        try:
+            receiver_id = uuid.UUID(str(data.get('receiver_id')))
+        except ValueError:
+            await self.send(text_data=json.dumps({'error': 'Invalid receiver ID.'}))
+            return
+        if receiver_id not in self.typing_partners:
+            if not await self.is_mutual_follow(user, receiver_id):
+                await self.send(text_data=json.dumps({'error': 'Mutual follow required.'}))
+                return
+            self.typing_partners.add(receiver_id)
+
+        is_typing = bool(data.get('is_typing'))
+        # Only state changes reach the receiver; repeated typing events just extend the TTL
+        if await database_sync_to_async(presence.set_typing)(user.user_id, receiver_id, is_typing):
+            await self.channel_layer.group_send(f"user_{receiver_id}", presence.typing_event(user, is_typing))
+
+    async def handle_presence(self, data):
+        user_ids = data.get('user_ids')
+        if not isinstance(user_ids, list) or len(user_ids) > PRESENCE_LOOKUP_LIMIT:
+            await self.send(text_data=json.dumps({'error': f'user_ids must be a list of at most {PRESENCE_LOOKUP_LIMIT} IDs.'}))
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'presence': await self.followed_presence(user_ids),
+        }))
+
+    @database_sync_to_async
+    def followed_presence(self, user_ids):
+        # Like the broadcasts, presence is only visible to followers; other IDs are left out
+        from .models import Follows
+
+        user = self.scope['user']
+        requested = set()
+        for user_id in user_ids:
+            try:
+                requested.add(uuid.UUID(str(user_id)))
+            except ValueError:
+                continue
+        visible = set(Follows.objects.filter(
+            follower=user, followed_id__in=requested, active=True
+        ).values_list('followed_id', flat=True))
+        if user.user_id in requested:
+            visible.add(user.user_id)
+        return presence.get_presence(visible)
+
+    async def handle_receipt(self, data):
+        # Read or delivered up to a watermark, for a whole conversation at once
+        try:
+            partner_id = uuid.UUID(str(data.get('partner_id')))
+        except ValueError:
+            await self.send(text_data=json.dumps({'error': 'Invalid partner ID.'}))
+            return
+        try:
+            error = await self.acknowledge(partner_id, data)
+        except ValueError as e:
+            error = str(e)
+        if error:
+            await self.send(text_data=json.dumps({'error': error}))
+
+    @database_sync_to_async
+    def acknowledge(self, partner_id, data):
+        from backend.chat.models import Chats
+        from backend.chat.receipts import acknowledge_messages, parse_receipt
+
+        receipt_status, up_to = parse_receipt(data)
+        try:
+            acknowledge_messages(self.scope['user'].user_id, partner_id, receipt_status, up_to)
+        except Chats.DoesNotExist:
+            return 'Message not found.'
+        return None
+
+    @database_sync_to_async
+    def is_mutual_follow(self, user, partner_id):
+        from .models import Follows
+
+        return Follows.objects.filter(follower=user, followed_id=partner_id, active=True).exists() and \
+            Follows.objects.filter(follower_id=partner_id, followed=user, active=True).exists()
+
+    async def typing_status(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'typing_status',
+            'user_id': event['user_id'],
+            'username': event['username'],
+            'is_typing': event['is_typing'],
+            'expires_in': event.get('expires_in'),
+        }))
+
+    async def message_receipt(self, event):
+        # The partner read or received messages up to ``up_to``
+        await self.send(text_data=json.dumps({
+            'type': 'message_receipt',
+            'user_id': event['user_id'],
+            'status': event['status'],
+            'up_to': event['up_to'],
+            'count': event['count'],
+            'at': event['at'],
+        }))
+
+    async def presence_batch(self, event):
+        # Online/offline changes of followed users since the last broadcast
+        await self.send(text_data=json.dumps({
+            'type': 'presence_batch',
+            'presence': event['presence'],
+        }))
 
     async def notification(self, event):
         try:
             await self.send(text_data=json.dumps({
-                'type': event['type'],
+                'type': event.get('notification_type', event['type']),
                 'message': event['message'],
                 'follow_id': event.get('follow_id'),
                 'notification_id': event.get('notification_id'),
                 'content_type': event.get('content_type'),
                 'content_id': event.get('content_id'),
+                'unread_count': event.get('unread_count'),
             }))
         except Exception as e:
-            logger.error(f"Error sending notification: {str(e)}")
\ No newline at end of file
+            logger.error(f"Error sending notification: {str(e)}")
+
+    async def notification_batch(self, event):
+        # The outbox dispatcher groups a user's pending notifications into one event
+        for notification in event['notifications']:
+            await self.notification({
+                'type': 'notification',
+                'unread_count': event.get('unread_count'),
+                **notification
+            })
\ No newline at end of file
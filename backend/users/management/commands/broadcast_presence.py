@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from backend.users.presence import broadcast_presence_changes
+
+
+class Command(BaseCommand):
+    help = 'Broadcast batched online/offline changes to followers and expire silent sockets (long-running worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between broadcasts')
+        parser.add_argument('--batch-size', type=int, default=500, help='Changed users broadcast per run')
+        parser.add_argument('--once', action='store_true', help='Broadcast once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            broadcast = broadcast_presence_changes(batch_size=options['batch_size'])
+            if options['once']:
+                self.stdout.write(f'Broadcast presence of {broadcast} users')
+                return
+            # A full batch means more changes are waiting
+            if broadcast >= options['batch_size']:
+                continue
+            try:
+                time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,237 @@
+"""
+Online presence, last-seen and typing state, kept in Redis
+
+Everything runs over the notification websocket: a socket counts as online
+while it sends a heartbeat at least every PRESENCE_TIMEOUT seconds, and typing
+events only reach the partner when the sender's typing state flips. Users
+whose online state changed are collected in a set and broadcast to their
+followers in batches by broadcast_presence_changes, one event per follower.
+CustomUser.last_active is written at most once per LAST_ACTIVE_WRITE_MINUTES.
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from backend.utils.websocket import push_user_events
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_KEY = 'presence:heartbeat'
+CONNECTIONS_KEY = 'presence:connections'
+LAST_SEEN_KEY = 'presence:last_seen'
+CHANGED_KEY = 'presence:changed'
+LAST_ACTIVE_KEY = 'presence:last_active:{}'
+TYPING_KEY = 'typing:{}:{}'
+
+# Typing indicators expire on their own unless the client repeats the event
+TYPING_TTL = 6
+# Clients send a heartbeat this often; see PRESENCE_TIMEOUT in settings
+HEARTBEAT_INTERVAL = 25
+
+# Count a socket and refresh the heartbeat; flag the user as changed if they were offline
+CONNECT_SCRIPT = """
+redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[4])
+local previous = redis.call('ZSCORE', KEYS[2], ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+if not previous or tonumber(previous) < tonumber(ARGV[3]) then
+    redis.call('SADD', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# Drop a socket; the user goes offline with the last one
+DISCONNECT_SCRIPT = """
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+if count > 0 then
+    return 0
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+redis.call('SADD', KEYS[4], ARGV[1])
+return 1
+"""
+
+# Take users whose sockets stopped sending heartbeats offline, at their last heartbeat
+SWEEP_SCRIPT = """
+local stale = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+for i = 1, #stale, 2 do
+    redis.call('ZREM', KEYS[1], stale[i])
+    redis.call('HDEL', KEYS[2], stale[i])
+    redis.call('HSET', KEYS[3], stale[i], stale[i + 1])
+    redis.call('SADD', KEYS[4], stale[i])
+end
+return #stale / 2
+"""
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _epoch(now):
+    return (now or timezone.now()).timestamp()
+
+
+def _cutoff(now):
+    return _epoch(now) - settings.PRESENCE_TIMEOUT
+
+
+def _touch(user_id, increment, now):
+    return bool(_redis().eval(
+        CONNECT_SCRIPT, 3, CONNECTIONS_KEY, HEARTBEAT_KEY, CHANGED_KEY,
+        str(user_id), _epoch(now), _cutoff(now), increment
+    ))
+
+
+def user_connected(user_id, now=None):
+    """
+    Register an open socket of ``user_id``
+
+    Returns:
+        bool: Whether the user just came online
+    """
+    went_online = _touch(user_id, 1, now)
+    touch_last_active(user_id, now)
+    return went_online
+
+
+def heartbeat(user_id, now=None):
+    """Keep ``user_id`` online for another PRESENCE_TIMEOUT seconds"""
+    went_online = _touch(user_id, 0, now)
+    touch_last_active(user_id, now)
+    return went_online
+
+
+def user_disconnected(user_id, now=None):
+    """
+    Unregister a socket of ``user_id``
+
+    Returns:
+        bool: Whether it was the user's last socket
+    """
+    return bool(_redis().eval(
+        DISCONNECT_SCRIPT, 4, CONNECTIONS_KEY, HEARTBEAT_KEY, LAST_SEEN_KEY, CHANGED_KEY,
+        str(user_id), _epoch(now)
+    ))
+
+
+def sweep_stale(now=None, batch_size=500):
+    """Mark users offline whose last heartbeat is older than PRESENCE_TIMEOUT"""
+    return _redis().eval(
+        SWEEP_SCRIPT, 4, HEARTBEAT_KEY, CONNECTIONS_KEY, LAST_SEEN_KEY, CHANGED_KEY,
+        _cutoff(now), batch_size
+    )
+
+
+def touch_last_active(user_id, now=None):
+    """
+    Write CustomUser.last_active, at most once per LAST_ACTIVE_WRITE_MINUTES per user
+
+    Returns:
+        bool: Whether the row was written
+    """
+    from .models import CustomUser
+
+    interval = settings.LAST_ACTIVE_WRITE_MINUTES * 60
+    if not _redis().set(LAST_ACTIVE_KEY.format(user_id), 1, nx=True, ex=interval):
+        return False
+    CustomUser.objects.filter(user_id=user_id).update(last_active=now or timezone.now())
+    return True
+
+
+def get_presence(user_ids, now=None):
+    """
+    Online state and last-seen time of each user
+
+    Returns:
+        dict: str(user_id) to {'online': bool, 'last_seen': ISO timestamp or None}
+    """
+    user_ids = [str(user_id) for user_id in user_ids]
+    if not user_ids:
+        return {}
+    pipeline = _redis().pipeline(transaction=False)
+    pipeline.zmscore(HEARTBEAT_KEY, user_ids)
+    pipeline.hmget(LAST_SEEN_KEY, user_ids)
+    heartbeats, last_seen = pipeline.execute()
+
+    cutoff = _cutoff(now)
+    presence = {}
+    for user_id, beat, seen in zip(user_ids, heartbeats, last_seen):
+        online = beat is not None and beat >= cutoff
+        seen = beat if beat is not None else (float(seen) if seen else None)
+        presence[user_id] = {
+            'online': online,
+            'last_seen': datetime.fromtimestamp(seen, dt_timezone.utc).isoformat() if seen else None,
+        }
+    return presence
+
+
+def set_typing(sender_id, receiver_id, is_typing):
+    """
+    Record that ``sender_id`` started or stopped typing to ``receiver_id``
+
+    Repeated "typing" events only extend the indicator's TTL.
+
+    Returns:
+        bool: Whether the state changed and should be sent to the receiver
+    """
+    key = TYPING_KEY.format(sender_id, receiver_id)
+    redis = _redis()
+    if is_typing:
+        if redis.set(key, 1, nx=True, ex=TYPING_TTL):
+            return True
+        redis.expire(key, TYPING_TTL)
+        return False
+    return bool(redis.delete(key))
+
+
+def typing_event(user, is_typing):
+    """The NotificationConsumer event announcing that ``user`` started or stopped typing"""
+    return {
+        'type': 'typing_status',
+        'user_id': str(user.user_id),
+        'username': user.username,
+        'is_typing': is_typing,
+        'expires_in': TYPING_TTL if is_typing else None,
+    }
+
+
+def broadcast_presence_changes(now=None, batch_size=500):
+    """
+    Send pending online/offline changes to the followers of the changed users
+
+    Each follower gets one presence_batch event listing every followed user
+    whose state changed since the previous run.
+
+    Returns:
+        int: Number of changed users broadcast
+    """
+    from .models import Follows
+
+    sweep_stale(now, batch_size)
+    changed = [
+        user_id.decode() if isinstance(user_id, bytes) else user_id
+        for user_id in _redis().spop(CHANGED_KEY, batch_size) or []
+    ]
+    if not changed:
+        return 0
+
+    presence = get_presence(changed, now)
+    batches = {}
+    for follower_id, followed_id in Follows.objects.filter(
+        followed_id__in=changed, active=True
+    ).values_list('follower_id', 'followed_id'):
+        batches.setdefault(follower_id, {})[str(followed_id)] = presence[str(followed_id)]
+
+    failures = push_user_events({
+        follower_id: {'type': 'presence_batch', 'presence': users}
+        for follower_id, users in batches.items()
+    })
+    if failures:
+        logger.warning(f"Presence broadcast failed for {len(failures)} followers")
+    return len(changed)
@@ -1,3 +1,154 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend.utils.testing import clear_test_cache
+
+from .models import CustomUser, Follows
+from .presence import (
+    broadcast_presence_changes, get_presence, heartbeat, touch_last_active, user_connected, user_disconnected
+)
+from .routing import websocket_urlpatterns
+
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER, PRESENCE_TIMEOUT=60)
+class PresenceTests(TestCase):
+    def setUp(self):
+        clear_test_cache()
+        self.user = CustomUser.objects.create_user('pia', 'pia@example.com', 'pass12345')
+        self.follower = CustomUser.objects.create_user('quinn', 'quinn@example.com', 'pass12345')
+        Follows.objects.create(follower=self.follower, followed=self.user)
+
+    def tearDown(self):
+        clear_test_cache()
+
+    def _presence(self, now=None):
+        return get_presence([self.user.user_id], now)[str(self.user.user_id)]
+
+    def _broadcast(self, now=None):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f"user_{self.follower.user_id}", channel)
+        broadcast = broadcast_presence_changes(now=now)
+        event = async_to_sync(layer.receive)(channel) if broadcast else None
+        return broadcast, event
+
+    def test_online_until_the_last_socket_closes(self):
+        self.assertEqual(self._presence(), {'online': False, 'last_seen': None})
+        self.assertTrue(user_connected(self.user.user_id))
+        self.assertFalse(user_connected(self.user.user_id))
+        self.assertTrue(self._presence()['online'])
+
+        self.assertFalse(user_disconnected(self.user.user_id))
+        self.assertTrue(self._presence()['online'])
+        self.assertTrue(user_disconnected(self.user.user_id))
+        presence = self._presence()
+        self.assertFalse(presence['online'])
+        self.assertIsNotNone(presence['last_seen'])
+
+    def test_changes_are_broadcast_to_followers_in_one_event(self):
+        user_connected(self.user.user_id)
+        # Flapping between runs is broadcast once, with the current state
+        user_disconnected(self.user.user_id)
+        user_connected(self.user.user_id)
+
+        broadcast, event = self._broadcast()
+        self.assertEqual(broadcast, 1)
+        self.assertEqual(event['type'], 'presence_batch')
+        self.assertTrue(event['presence'][str(self.user.user_id)]['online'])
+        self.assertEqual(self._broadcast(), (0, None))
+
+    def test_silent_sockets_go_offline_at_their_last_heartbeat(self):
+        started = timezone.now() - timedelta(minutes=5)
+        user_connected(self.user.user_id, now=started)
+        self._broadcast(now=started)
+
+        broadcast, event = self._broadcast()
+        self.assertEqual(broadcast, 1)
+        presence = event['presence'][str(self.user.user_id)]
+        self.assertFalse(presence['online'])
+        self.assertEqual(presence['last_seen'], started.isoformat())
+
+        # A late heartbeat brings the user back
+        self.assertTrue(heartbeat(self.user.user_id))
+
+    def test_last_active_is_written_at_most_once_per_interval(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(touch_last_active(self.user.user_id))
+        with self.assertNumQueries(0):
+            heartbeat(self.user.user_id)
+            self.assertFalse(touch_last_active(self.user.user_id))
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_active)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class TypingTests(TransactionTestCase):
+    def setUp(self):
+        clear_test_cache()
+        self.user = CustomUser.objects.create_user('rosa', 'rosa@example.com', 'pass12345')
+        self.partner = CustomUser.objects.create_user('sam', 'sam@example.com', 'pass12345')
+        Follows.objects.create(follower=self.user, followed=self.partner)
+        Follows.objects.create(follower=self.partner, followed=self.user)
+
+    def tearDown(self):
+        clear_test_cache()
+
+    async def _connect(self, user):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/notifications/?token={AccessToken.for_user(user)}'
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(json.loads(await communicator.receive_from())['type'], 'presence_config')
+        return communicator
+
+    async def _typing(self, communicator, receiver_id, is_typing):
+        await communicator.send_to(text_data=json.dumps({
+            'action': 'typing', 'receiver_id': str(receiver_id), 'is_typing': is_typing
+        }))
+
+    async def test_only_typing_state_changes_reach_the_partner(self):
+        sender = await self._connect(self.user)
+        receiver = await self._connect(self.partner)
+
+        await self._typing(sender, self.partner.user_id, True)
+        event = json.loads(await receiver.receive_from())
+        self.assertEqual((event['type'], event['username'], event['is_typing']), ('typing_status', 'rosa', True))
+
+        # Repeated keystrokes only extend the indicator
+        await self._typing(sender, self.partner.user_id, True)
+        self.assertTrue(await receiver.receive_nothing())
+
+        await self._typing(sender, self.partner.user_id, False)
+        self.assertFalse(json.loads(await receiver.receive_from())['is_typing'])
+
+        stranger = await CustomUser.objects.acreate(username='tom', email='tom@example.com')
+        await self._typing(sender, stranger.user_id, True)
+        self.assertIn('error', json.loads(await sender.receive_from()))
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    async def test_presence_lookup_is_limited_to_followed_users(self):
+        stranger = await CustomUser.objects.acreate(username='uma', email='uma@example.com')
+        await database_sync_to_async(user_connected)(stranger.user_id)
+        communicator = await self._connect(self.user)
+
+        await communicator.send_to(text_data=json.dumps({
+            'action': 'presence', 'user_ids': [str(self.partner.user_id), str(stranger.user_id), 'bogus']
+        }))
+        response = json.loads(await communicator.receive_from())
+        self.assertEqual(response['type'], 'presence')
+        self.assertEqual(list(response['presence']), [str(self.partner.user_id)])
+        await communicator.disconnect()
@@ -1,4 +1,7 @@
 import boto3
+import hashlib
+import os
+import shutil
 import uuid
 import logging
 from io import BytesIO
@@ -297,3 +300,125 @@ def delete_file(file_url):
 def get_minio_url(key):
     """Get the full MinIO URL for a given key."""
     return f"{settings.AWS_S3_ENDPOINT_URL}/{settings.AWS_STORAGE_BUCKET_NAME}/{key}"
+
+
+class LocalObjectStore:
+    """
+    Filesystem stand-in for the S3 client calls used by chat media uploads
+
+    Used when MinIO is not reachable (local development, tests). Objects live
+    under MEDIA_ROOT and multipart uploads are staged part by part in a hidden
+    directory, mirroring create/upload/list/complete/abort of the S3 API.
+    Presigned URLs are not available, so clients send parts through the server.
+    """
+    COPY_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValidationError(f"Invalid object key: {key}")
+        return path
+
+    def _parts_dir(self, upload_id):
+        return self._path(os.path.join('.multipart', upload_id))
+
+    def _copy(self, source, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as target:
+            shutil.copyfileobj(source, target, self.COPY_BUFFER_SIZE)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None):
+        self._copy(Fileobj, self._path(Key))
+
+    def download_fileobj(self, Bucket, Key, Fileobj, Config=None):
+        path = self._path(Key)
+        if not os.path.exists(path):
+            raise ClientError({'Error': {'Code': '404'}}, 'GetObject')
+        with open(path, 'rb') as source:
+            shutil.copyfileobj(source, Fileobj, self.COPY_BUFFER_SIZE)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._parts_dir(upload_id))
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def _existing_parts_dir(self, upload_id, operation):
+        parts_dir = self._parts_dir(upload_id)
+        if not os.path.isdir(parts_dir):
+            raise ClientError({'Error': {'Code': 'NoSuchUpload'}}, operation)
+        return parts_dir
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        path = os.path.join(self._existing_parts_dir(UploadId, 'UploadPart'), f'{PartNumber:05d}')
+        self._copy(Body, path)
+        digest = hashlib.md5()
+        with open(path, 'rb') as part:
+            for chunk in iter(lambda: part.read(self.COPY_BUFFER_SIZE), b''):
+                digest.update(chunk)
+        return {'ETag': f'"{digest.hexdigest()}"'}
+
+    def list_parts(self, Bucket, Key, UploadId, **kwargs):
+        parts_dir = self._existing_parts_dir(UploadId, 'ListParts')
+        return {'Parts': [
+            {'PartNumber': int(name), 'Size': os.path.getsize(os.path.join(parts_dir, name))}
+            for name in sorted(os.listdir(parts_dir))
+        ], 'IsTruncated': False}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts_dir = self._existing_parts_dir(UploadId, 'CompleteMultipartUpload')
+        path = self._path(Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as target:
+            for part in MultipartUpload['Parts']:
+                with open(os.path.join(parts_dir, f"{part['PartNumber']:05d}"), 'rb') as source:
+                    shutil.copyfileobj(source, target, self.COPY_BUFFER_SIZE)
+        shutil.rmtree(parts_dir)
+        return {'Bucket': Bucket, 'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        shutil.rmtree(self._parts_dir(UploadId), ignore_errors=True)
+
+    def head_object(self, Bucket, Key):
+        path = self._path(Key)
+        if not os.path.exists(path):
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        return {'ContentLength': os.path.getsize(path)}
+
+    def delete_object(self, Bucket, Key):
+        if os.path.exists(self._path(Key)):
+            os.remove(self._path(Key))
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600):
+        return None
+
+
+def uses_minio():
+    """Whether media goes to MinIO, as decided by the storage check in settings"""
+    return settings.DEFAULT_FILE_STORAGE == 'storages.backends.s3boto3.S3Boto3Storage'
+
+
+def get_object_client():
+    """The S3 client for the media bucket, or the filesystem stand-in without MinIO"""
+    if uses_minio():
+        storage = get_minio_storage()
+        storage._ensure_bucket_exists()
+        return storage._get_client()
+    return LocalObjectStore(settings.MEDIA_ROOT)
+
+
+def get_object_url(key):
+    """Public URL of an object written through get_object_client"""
+    if uses_minio():
+        return get_minio_url(key)
+    return f"{settings.MEDIA_URL}{key}"
+
+
+def object_key_from_url(url):
+    """Key of an object whose URL came from get_object_url, or None for other URLs"""
+    prefix = get_object_url('')
+    if url and url.startswith(prefix) and len(url) > len(prefix):
+        return url[len(prefix):]
+    return None
@@ -0,0 +1,37 @@
+from django.contrib.postgres.search import SearchVector
+from django.db.models import Value
+
+# Text search configuration shared by the message search columns, their backfill and queries
+SEARCH_CONFIG = 'english'
+
+
+def search_vector(text):
+    """tsvector expression for ``text``, computed by the database inside the INSERT or UPDATE"""
+    return SearchVector(Value(text or ''), config=SEARCH_CONFIG)
+
+
+class SearchVectorMixin:
+    """
+    Keeps a model's ``search_vector`` column in step with its ``content``
+
+    The vector is only recomputed when the content changed since the row was
+    loaded, and is written by the same statement that saves the row.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_content = instance.__dict__.get('content')
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        content_changed = self._state.adding or self.content != getattr(self, '_loaded_content', None)
+        if content_changed and (update_fields is None or 'content' in update_fields):
+            self.search_vector = search_vector(self.content)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_vector'}
+        super().save(*args, **kwargs)
+        self._loaded_content = self.content
+        # Leave the column deferred instead of holding the unevaluated expression
+        self.__dict__.pop('search_vector', None)
@@ -0,0 +1,31 @@
+"""
+Helpers shared by the apps' tests
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django_redis import get_redis_connection
+
+DELETE_CHUNK_SIZE = 500
+
+
+def clear_test_cache():
+    """
+    Delete the Redis keys earlier tests left behind
+
+    Keys are deleted one scan page at a time rather than with FLUSHDB, and only
+    from REDIS_TEST_URL, the database selected under ``manage.py test``.
+
+    Raises:
+        ImproperlyConfigured: If the cache is not the test database
+    """
+    if not settings.TESTING or settings.CACHES['default']['LOCATION'] != settings.REDIS_TEST_URL:
+        raise ImproperlyConfigured("Refusing to clear a Redis database that is not REDIS_TEST_URL.")
+    redis = get_redis_connection('default')
+    keys = []
+    for key in redis.scan_iter(count=DELETE_CHUNK_SIZE):
+        keys.append(key)
+        if len(keys) == DELETE_CHUNK_SIZE:
+            redis.delete(*keys)
+            keys = []
+    if keys:
+        redis.delete(*keys)
@@ -1,17 +1,120 @@
+import asyncio
+
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
+
+def notification_event(notification_data):
+    """Serialize notification fields into the payload the NotificationConsumer forwards to clients"""
+    return {
+        "notification_id": str(notification_data.get("notification_id")),
+        "message": notification_data.get("message"),
+        "notification_type": notification_data.get("type"),
+        "content_type": notification_data.get("content_type"),
+        "content_id": str(notification_data.get("content_id")) if notification_data.get("content_id") else None,
+        "follow_id": str(notification_data.get("follow_id")) if notification_data.get("follow_id") else None,
+    }
+
+
 def send_notification_to_user(user_id, notification_data):
+    """
+    Queue a websocket notification for a user
+
+    The push is written to the notification outbox in the caller's transaction and
+    delivered by the dispatcher (manage.py dispatch_notifications) after commit.
+    """
+    queue_notifications([(user_id, notification_data)])
+
+
+def queue_notifications(notifications):
+    """Queue (user_id, notification_data) pairs with a single INSERT"""
+    from backend.swaps.models import NotificationOutbox
+
+    NotificationOutbox.objects.bulk_create([
+        NotificationOutbox(recipient_id=user_id, payload=notification_event(notification_data))
+        for user_id, notification_data in notifications
+    ])
+
+
+# Upper bound on group_send calls in flight at once
+DEFAULT_SEND_CONCURRENCY = 64
+
+
+async def _group_send_many(events, concurrency=DEFAULT_SEND_CONCURRENCY):
+    """group_send ``events[user_id]`` to each user's group, with at most ``concurrency`` calls in flight"""
     channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"user_{user_id}",
-        {
-            "type": "notification",
-            "notification_id": str(notification_data.get("notification_id")),
-            "message": notification_data.get("message"),
-            "type": notification_data.get("type"),
-            "content_type": notification_data.get("content_type"),
-            "content_id": str(notification_data.get("content_id")) if notification_data.get("content_id") else None,
-            "follow_id": str(notification_data.get("follow_id")) if notification_data.get("follow_id") else None,
-        }
-    )
\ No newline at end of file
+    semaphore = asyncio.Semaphore(concurrency)
+    user_ids = list(events)
+
+    async def send(user_id):
+        async with semaphore:
+            await channel_layer.group_send(f"user_{user_id}", events[user_id])
+
+    results = await asyncio.gather(*(send(user_id) for user_id in user_ids), return_exceptions=True)
+    return {
+        user_id: result
+        for user_id, result in zip(user_ids, results)
+        if isinstance(result, BaseException)
+    }
+
+
+async def _send_event_batches(batches, concurrency=DEFAULT_SEND_CONCURRENCY, unread_counts=None):
+    unread_counts = unread_counts or {}
+    events = {}
+    for user_id, notifications in batches.items():
+        events[user_id] = {"type": "notification.batch", "notifications": notifications}
+        if user_id in unread_counts:
+            events[user_id]["unread_count"] = unread_counts[user_id]
+    return await _group_send_many(events, concurrency)
+
+
+async def send_notifications_bulk(notifications, concurrency=DEFAULT_SEND_CONCURRENCY):
+    """
+    Push notifications to the channel layer immediately from a single task
+
+    A user's notifications are grouped into one event and at most ``concurrency``
+    group_send calls run at once, so their Redis round trips overlap.
+
+    Args:
+        notifications: Iterable of (user_id, notification_data) pairs
+        concurrency: Maximum group_send calls in flight
+
+    Returns:
+        dict: user_id to the exception raised while sending, for failed users only
+    """
+    batches = {}
+    for user_id, notification_data in notifications:
+        batches.setdefault(user_id, []).append(notification_event(notification_data))
+    return await _send_event_batches(batches, concurrency)
+
+
+def send_notifications_bulk_sync(notifications, concurrency=DEFAULT_SEND_CONCURRENCY):
+    """Blocking send_notifications_bulk for sync code such as views and management commands"""
+    return async_to_sync(send_notifications_bulk)(list(notifications), concurrency)
+
+
+def push_notification_batches(batches, concurrency=DEFAULT_SEND_CONCURRENCY, unread_counts=None):
+    """
+    Push already serialized notification events, one group message per user
+
+    Args:
+        batches: dict mapping user_id to a list of notification_event payloads
+        unread_counts: Optional dict of user_id to unread count sent along with the batch
+
+    Returns:
+        dict: user_id to the exception raised while sending, for failed users only
+    """
+    return async_to_sync(_send_event_batches)(batches, concurrency, unread_counts)
+
+
+def push_user_events(events, concurrency=DEFAULT_SEND_CONCURRENCY):
+    """
+    Send one arbitrary consumer event to each user's group
+
+    Args:
+        events: dict mapping user_id to a channel layer event (with its ``type``)
+
+    Returns:
+        dict: user_id to the exception raised while sending, for failed users only
+    """
+    return async_to_sync(_group_send_many)(events, concurrency)
@@ -98,8 +98,8 @@ const Message = ({ msg, isSociety, isPinned, editingMessageId, setEditingMessage
             By {msg.sender_name || msg.user} | Status: {msg.status || 'Sent'}
           </p>
           <div className="flex gap-2 text-sm">
-            {msg.reactions?.map(r => (
-              <span key={r.id}>{r.emoji} ({r.count || 1})</span>
+            {Object.entries(msg.reaction_counts || {}).map(([reactionType, count]) => (
+              <span key={reactionType}>{reactionType} ({count})</span>
             ))}
             <button onClick={() => onAddReaction(msg.id, '👍', isSociety)}>👍</button>
             <button onClick={() => onAddReaction(msg.id, '❤️', isSociety)}>❤️</button>
@@ -49,7 +49,7 @@ const MessageBubble = ({ message, isOwn, isGroup = false, partner }) => {
         return (
           <div className="relative">
             <img
-              src={message.media_url}
+              src={message.media_thumbnail || message.media_url}
               alt="Shared image"
               className="max-w-xs rounded-lg cursor-pointer hover:opacity-90 transition-opacity"
               onClick={() => setShowFullImage(true)}
@@ -66,6 +66,7 @@ const MessageBubble = ({ message, isOwn, isGroup = false, partner }) => {
             <video
               src={message.media_url}
               controls
+              preload={message.media_thumbnail ? 'none' : 'metadata'}
               className="rounded-lg w-full"
               poster={message.media_thumbnail}
             />
@@ -92,9 +93,21 @@ const MessageBubble = ({ message, isOwn, isGroup = false, partner }) => {
             <div className="flex-1">
               <div className="flex items-center space-x-2">
                 <MicrophoneIcon className="w-4 h-4 opacity-60" />
-                <div className="flex-1 h-1 bg-white/20 rounded-full">
-                  <div className="h-full bg-white/60 rounded-full w-1/3"></div>
-                </div>
+                {message.media_waveform?.length ? (
+                  <div className="flex-1 flex items-center h-6 space-x-px">
+                    {message.media_waveform.map((peak, index) => (
+                      <div
+                        key={index}
+                        className="flex-1 bg-white/60 rounded-full"
+                        style={{ height: `${Math.max(peak, 8)}%` }}
+                      />
+                    ))}
+                  </div>
+                ) : (
+                  <div className="flex-1 h-1 bg-white/20 rounded-full">
+                    <div className="h-full bg-white/60 rounded-full w-1/3"></div>
+                  </div>
+                )}
               </div>
               <p className="text-xs opacity-60 mt-1">
                 {message.media_duration ? `${Math.floor(message.media_duration / 60)}:${(message.media_duration % 60).toString().padStart(2, '0')}` : '0:30'}
@@ -194,16 +207,16 @@ const MessageBubble = ({ message, isOwn, isGroup = false, partner }) => {
             {renderMediaContent()}
 
             {/* Message reactions */}
-            {message.reactions && message.reactions.length > 0 && (
+            {Object.keys(message.reaction_counts || {}).length > 0 && (
               <div className="flex flex-wrap gap-1 mt-2">
-                {message.reactions.map((reaction, index) => (
+                {Object.entries(message.reaction_counts).map(([reactionType, count]) => (
                   <span
-                    key={index}
+                    key={reactionType}
                     className={`inline-flex items-center px-2 py-1 rounded-full text-xs ${
                       isOwn ? 'bg-white/20 text-white' : 'bg-gray-100 text-gray-600'
-                    }`}
+                    } ${message.my_reaction === reactionType ? 'ring-1 ring-current' : ''}`}
                   >
-                    {reaction.reaction_type} {reaction.count > 1 && reaction.count}
+                    {reactionType} {count > 1 && count}
                   </span>
                 ))}
               </div>
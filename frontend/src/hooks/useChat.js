@@ -99,6 +99,28 @@ export function useChat() {
     []
   );
 
+  // One call marks everything the partner sent up to upToChatId as read
+  const markConversationRead = useCallback(
+    async (partnerId, upToChatId = null) => {
+      const result = await handleApiCall(
+        () => api.post(API_ENDPOINTS.CONVERSATION_RECEIPT(partnerId), { status: 'READ', up_to: upToChatId }),
+        setIsLoading,
+        setError,
+        null,
+        'Mark conversation read'
+      );
+      if (result) {
+        setMessages((prev) =>
+          prev.map((m) =>
+            m.sender?.user_id === partnerId && m.status !== 'READ' ? { ...m, status: 'READ' } : m
+          )
+        );
+      }
+      return result;
+    },
+    []
+  );
+
   const addDirectReaction = useCallback(
     async (chatId, data) => {
       const result = await handleApiCall(
@@ -111,7 +133,9 @@ export function useChat() {
       if (result) {
         setMessages((prev) =>
           prev.map((m) =>
-            m.id === chatId ? { ...m, reactions: [...(m.reactions || []), result] } : m
+            m.id === chatId
+              ? { ...m, reaction_counts: result.reaction_counts, my_reaction: result.reaction_type }
+              : m
           )
         );
       }
@@ -186,7 +210,7 @@ export function useChat() {
       setMessages((prev) =>
         prev.map((m) =>
           m.id === wsData.reaction.message_id
-            ? { ...m, reactions: [...(m.reactions || []), wsData.reaction] }
+            ? { ...m, reaction_counts: wsData.reaction_counts ?? m.reaction_counts }
             : m
         )
       );
@@ -210,6 +234,7 @@ export function useChat() {
     editMessage,
     deleteMessage,
     markRead,
+    markConversationRead,
     addDirectReaction,
     listReactions,
     listMessages,
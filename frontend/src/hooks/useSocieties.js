@@ -302,7 +302,7 @@ export function useSocieties() {
     setSocietyMessages((prev) =>
       prev.map((m) =>
         m.id === societyData.reaction?.message_id
-          ? { ...m, reactions: [...(m.reactions || []), societyData.reaction] }
+          ? { ...m, reaction_counts: societyData.reaction_counts ?? m.reaction_counts }
           : m
       )
     );
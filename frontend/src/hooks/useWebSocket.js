@@ -46,6 +46,8 @@ export function useWebSocket(userId = null, type = 'notification') {
   const connectionKey = useRef(null);
   const isConnecting = useRef(false);
   const mountedRef = useRef(true);
+  const heartbeatInterval = useRef(25000);
+  const typingSentAt = useRef({});
 
   // Generate unique connection key
   useEffect(() => {
@@ -74,6 +76,11 @@ export function useWebSocket(userId = null, type = 'notification') {
       return;
     }
 
+    if (message.type === 'presence_config') {
+      heartbeatInterval.current = message.heartbeat_interval * 1000;
+      return;
+    }
+
     if (type === 'discussion') {
       setDiscussionData((prev) => {
         if (message.type === 'note_added' && message.note?.id) {
@@ -303,6 +310,33 @@ export function useWebSocket(userId = null, type = 'notification') {
     }
   }, [isConnected]);
 
+  // Typing events are debounced: one per partner while typing continues, refreshed before the server TTL lapses
+  const sendTyping = useCallback((receiverId, isTyping) => {
+    if (!isConnected || !wsRef.current || wsRef.current.readyState !== WebSocket.OPEN) return;
+    const lastSent = typingSentAt.current[receiverId];
+    if (isTyping && lastSent && Date.now() - lastSent < 3000) return;
+    if (!isTyping && !lastSent) return;
+    typingSentAt.current[receiverId] = isTyping ? Date.now() : undefined;
+    wsRef.current.send(JSON.stringify({ action: 'typing', receiver_id: receiverId, is_typing: isTyping }));
+  }, [isConnected]);
+
+  // Read/delivered receipts cover everything from the partner up to the given message
+  const sendReceipt = useCallback((partnerId, status = 'READ', upTo = null) => {
+    if (!isConnected || !wsRef.current || wsRef.current.readyState !== WebSocket.OPEN) return;
+    wsRef.current.send(JSON.stringify({ action: 'receipt', partner_id: partnerId, status, up_to: upTo }));
+  }, [isConnected]);
+
+  // Heartbeats keep the user online for followers while the socket is open
+  useEffect(() => {
+    if (!isConnected || type !== 'notification') return;
+    const timer = setInterval(() => {
+      if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+        wsRef.current.send(JSON.stringify({ action: 'heartbeat' }));
+      }
+    }, heartbeatInterval.current);
+    return () => clearInterval(timer);
+  }, [isConnected, type]);
+
   // Main connection effect
   useEffect(() => {
     if (isAuthenticated && (userId || profile?.user_id)) {
@@ -337,5 +371,7 @@ export function useWebSocket(userId = null, type = 'notification') {
     likeNote,
     upvotePost,
     reprintPost,
+    sendTyping,
+    sendReceipt,
   };
 }
\ No newline at end of file
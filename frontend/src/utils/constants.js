@@ -104,6 +104,7 @@ export const API_ENDPOINTS = {
   EDIT_MESSAGE: (chatId) => `/chat/messages/${chatId}/edit/`,
   DELETE_MESSAGE: (chatId) => `/chat/messages/${chatId}/delete/`,
   MARK_READ: (chatId) => `/chat/messages/${chatId}/read/`,
+  CONVERSATION_RECEIPT: (partnerId) => `/chat/messages/conversations/${partnerId}/receipts/`,
   ADD_REACTION: (chatId) => `/chat/messages/${chatId}/react/`,
   LIST_REACTIONS: (chatId) => `/chat/messages/${chatId}/reactions/`,
   SEND_MEDIA_MESSAGE: '/chat/media/',